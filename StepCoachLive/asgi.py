@@ -13,4 +13,22 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'StepCoachLive.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up
+from django.conf import settings  # noqa: E402
+from api.services.voice_clients import voice_clients  # noqa: E402
+from api.voice_socket import voice_socket  # noqa: E402
+
+# Prepare ElevenLabs clients in the background, so the first voice session does not pay for it
+if settings.VOICE_PREWARM:
+    voice_clients.warm_in_background()
+
+
+async def application(scope, receive, send):
+    """
+    HTTP goes to Django; WebSockets to the voice relay (api/voice_socket.py).
+    """
+    if scope['type'] == 'websocket':
+        return await voice_socket(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -154,6 +154,71 @@ REST_FRAMEWORK = {
 
 OPENAI_API_KEY = config("OPENAI_API_KEY")
 
+# Per-user AI counselor sessions (api/services/counselor_sessions.py)
+COUNSELOR_SESSION_MAX = config("COUNSELOR_SESSION_MAX", default=1000, cast=int)
+COUNSELOR_SESSION_IDLE_SECONDS = config("COUNSELOR_SESSION_IDLE_SECONDS", default=1800, cast=int)
+# Token budget for chat history sent with every prompt (counted with tiktoken)
+COUNSELOR_HISTORY_TOKENS = config("COUNSELOR_HISTORY_TOKENS", default=2000, cast=int)
+# Fold older messages into Conversation.summary every N chat turns, keeping the newest messages verbatim
+CONVERSATION_SUMMARY_EVERY_TURNS = config("CONVERSATION_SUMMARY_EVERY_TURNS", default=10, cast=int)
+CONVERSATION_SUMMARY_KEEP_MESSAGES = config("CONVERSATION_SUMMARY_KEEP_MESSAGES", default=20, cast=int)
+
+# OCR / PDF extraction process pool (api/services/attachment_extraction.py)
+ATTACHMENT_EXTRACTION_WORKERS = config("ATTACHMENT_EXTRACTION_WORKERS", default=2, cast=int)
+ATTACHMENT_EXTRACTION_TIMEOUT = config("ATTACHMENT_EXTRACTION_TIMEOUT", default=20, cast=float)
+ATTACHMENT_MAX_BYTES = config("ATTACHMENT_MAX_BYTES", default=10 * 1024 * 1024, cast=int)
+ATTACHMENT_MAX_PDF_PAGES = config("ATTACHMENT_MAX_PDF_PAGES", default=20, cast=int)
+# Chat history search (api/services/message_search.py); empty picks the backend for the database vendor
+MESSAGE_SEARCH_BACKEND = config("MESSAGE_SEARCH_BACKEND", default="")
+# Motivational quotes are read from the Quote table at most this often per worker (api/services/quotes.py)
+QUOTE_CACHE_SECONDS = config("QUOTE_CACHE_SECONDS", default=300, cast=int)
+# Journal entries offered to the counselor as context (api/services/journal_index.py).
+# An empty JOURNAL_EMBEDDER uses the local hashing embedder; otherwise a dotted path to an embedder class.
+JOURNAL_EMBEDDER = config("JOURNAL_EMBEDDER", default="")
+JOURNAL_CONTEXT_ENTRIES = config("JOURNAL_CONTEXT_ENTRIES", default=3, cast=int)
+JOURNAL_CONTEXT_TOKENS = config("JOURNAL_CONTEXT_TOKENS", default=300, cast=int)
+JOURNAL_MIN_SCORE = config("JOURNAL_MIN_SCORE", default=0.15, cast=float)
+JOURNAL_INDEX_MAX_ENTRIES = config("JOURNAL_INDEX_MAX_ENTRIES", default=500, cast=int)
+# Token usage ledger (api/services/usage_meter.py): rows are written in batches of up to N, at least every S seconds
+USAGE_METER_BATCH_SIZE = config("USAGE_METER_BATCH_SIZE", default=100, cast=int)
+USAGE_METER_FLUSH_SECONDS = config("USAGE_METER_FLUSH_SECONDS", default=5, cast=float)
+# Chat/voice token buckets per plan_type (api/services/rate_limit.py); a plan's features may override
+# them with {"rate_limits": {...}}. An empty RATE_LIMIT_BACKEND keeps buckets per process; use
+# api.services.rate_limit.CacheBucketBackend to share them through the RATE_LIMIT_CACHE cache.
+RATE_LIMIT_BACKEND = config("RATE_LIMIT_BACKEND", default="")
+RATE_LIMIT_CACHE = config("RATE_LIMIT_CACHE", default="default")
+RATE_LIMITS = {
+    "free": {"chat": {"rate": "30/hour", "burst": 5}, "voice": "3/hour"},
+    "monthly": {"chat": {"rate": "300/hour", "burst": 20}, "voice": "20/hour"},
+    "yearly": {"chat": {"rate": "300/hour", "burst": 20}, "voice": "20/hour"},
+}
+# Replay window of a finished chat turn for retries with the same Idempotency-Key header
+# (api/services/chat_flights.py); identical requests without one share only a turn still in flight
+CHAT_IDEMPOTENCY_SECONDS = config("CHAT_IDEMPOTENCY_SECONDS", default=600, cast=int)
+# Live voice sessions per process (api/services/voice_registry.py); each one holds a runtime thread.
+# Sessions are ended after VOICE_MAX_SESSION_SECONDS, or VOICE_IDLE_SECONDS without a transcript.
+VOICE_MAX_SESSIONS = config("VOICE_MAX_SESSIONS", default=20, cast=int)
+VOICE_MAX_SESSIONS_PER_USER = config("VOICE_MAX_SESSIONS_PER_USER", default=1, cast=int)
+VOICE_MAX_SESSION_SECONDS = config("VOICE_MAX_SESSION_SECONDS", default=1800, cast=int)
+VOICE_IDLE_SECONDS = config("VOICE_IDLE_SECONDS", default=300, cast=int)
+# Which worker runs whose voice sessions, shared by all workers: by default the VoiceSessionLease table
+# (api/services/voice_directory.py). Set it empty to keep sessions per process, with a single worker
+# only. Owners heartbeat, and reap, every N seconds.
+VOICE_SESSION_DIRECTORY = config("VOICE_SESSION_DIRECTORY", default="api.services.voice_directory.DatabaseSessionDirectory")
+VOICE_HEARTBEAT_SECONDS = config("VOICE_HEARTBEAT_SECONDS", default=2, cast=float)
+# ElevenLabs clients and N signed session URLs per agent are prepared ahead of voice sessions
+# (api/services/voice_clients.py); VOICE_PREWARM does it when a server worker boots
+VOICE_PREWARM = config("VOICE_PREWARM", default=True, cast=bool)
+VOICE_PREFETCHED_URLS = config("VOICE_PREFETCHED_URLS", default=2, cast=int)
+# Voice transcripts are written in batches (api/services/voice_transcripts.py): every S seconds,
+# once N messages wait, and when the session ends
+VOICE_TRANSCRIPT_FLUSH_SECONDS = config("VOICE_TRANSCRIPT_FLUSH_SECONDS", default=3, cast=float)
+VOICE_TRANSCRIPT_BATCH_SIZE = config("VOICE_TRANSCRIPT_BATCH_SIZE", default=20, cast=int)
+# Voice sessions relayed over /ws/voice/ (api/voice_socket.py): audio is sent in frames of N ms, and
+# each direction buffers at most VOICE_RELAY_BUFFER_MS before the oldest audio is dropped
+VOICE_RELAY_FRAME_MS = config("VOICE_RELAY_FRAME_MS", default=100, cast=int)
+VOICE_RELAY_BUFFER_MS = config("VOICE_RELAY_BUFFER_MS", default=2000, cast=int)
+
 STRIPE_SECRET_KEY = config("STRIPE_SECRET_KEY")
 STRIPE_WEBHOOK_SECRET = config("STRIPE_WEBHOOK_SECRET")
 
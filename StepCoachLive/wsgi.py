@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'StepCoachLive.settings')
 
 application = get_wsgi_application()
+
+# Prepare ElevenLabs clients in the background, so the first voice session does not pay for it
+from django.conf import settings  # noqa: E402
+from api.services.voice_clients import voice_clients  # noqa: E402
+
+if settings.VOICE_PREWARM:
+    voice_clients.warm_in_background()
@@ -1,50 +1,131 @@
 import json
 import random
-import pytesseract
-from PIL import Image
-import PyPDF2
 import io
-import openai
+from asgiref.sync import sync_to_async
 from dotenv import load_dotenv
 import os
 import sys
+import threading
+import time
 from datetime import datetime
-from langchain_openai import ChatOpenAI
-from langchain.memory import ConversationBufferWindowMemory
 from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
+
+# This file still runs on its own as `python -m api.ai` from the project root
+# (see __main__), so these services, and api.services.llm_backends loaded in
+# build_llm, must not import Django
+from api.services.llm_resilience import CircuitBreaker, ResilientLLM, llm_metrics
+from api.services.chat_history import HistoryAssembler, Turn, count_tokens, format_history, truncate_tokens, turn_tokens
+from api.services.message_classifier import message_classifier
 
 # Load environment variables from .env file
 load_dotenv()
 
-class AICounselor:
-    def __init__(self):
-        """
-        Initializes the AI counselor with the API key from the .env file and prepares the environment.
-        """
+FALLBACK_RESPONSE = "I'm here for you, but having some tech issues. Can you tell me more about how you're feeling? 💙"
+
+# Vetted reply for crisis messages; sent as-is without waiting for the LLM
+CRISIS_RESPONSE = (
+    "I'm really glad you told me, and I'm worried about you. 💙 "
+    "If you might act on these thoughts, please call your local emergency number right now. "
+    "In the US you can call or text 988 (Suicide & Crisis Lifeline) any time, day or night. "
+    "Are you somewhere safe at the moment?"
+)
+
+# Motivational quotes database
+MOTIVATIONAL_QUOTES = (
+    "Recovery is not a race. You don't have to feel guilty if it takes you longer than you thought it would.",
+    "The greatest revolution of our generation is the discovery that human beings, by changing the inner attitudes of their minds, can change the outer aspects of their lives.",
+    "You are stronger than your addiction and your addiction is not stronger than your God.",
+    "Don't quit too easily. Your life is precious.",
+    "Recovery is about progression, not perfection.",
+    "If you are tired take rest and start again. Believe that you can do it.",
+    "One day at a time, one moment at a time, one breath at a time.",
+    "Life doesn't always go with the flow. Life is like a wave sometimes you need to stay calm sometimes you need to rise.",
+    "The only person you are destined to become is the person you decide to be.",
+    "Don't let the past take over your today.",
+    "Healing takes time, and asking for help is a courageous step.",
+    "Progress, not perfection, is what we should strive for.",
+)
+
+def build_llm():
+    """
+    Builds the chat model selected by LLM_BACKEND ("openai" by default, or "fake"
+    for load tests and offline runs). The client is stateless, so one instance
+    can be shared by every counselor.
+
+    The model is wrapped in ResilientLLM, so every call gets a deadline,
+    jittered retries and the circuit breaker (tuned by the LLM_* env vars).
+    """
+    timeout = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+    backend = os.getenv("LLM_BACKEND", "openai").lower()
+    # Each backend's SDK is imported only when it is picked
+    if backend == "fake":
+        from api.services.llm_backends import fake_from_env
+        llm = fake_from_env()
+    elif backend == "openai":
+        from langchain_openai import ChatOpenAI
+
         api_key = os.getenv("OPENAI_API_KEY")
-        os.environ["OPENAI_API_KEY"] =  api_key
         if not api_key:
             raise ValueError("OpenAI API key not found in environment variables.")
+        os.environ["OPENAI_API_KEY"] = api_key
 
-        # Set up LangChain LLM
-        self.llm = ChatOpenAI(
-            model="gpt-4o-mini", 
+        llm = ChatOpenAI(
+            model="gpt-4o-mini",
             temperature=0.7,
+            timeout=timeout,
+            max_retries=0,  # ResilientLLM retries, with jitter and the breaker in the loop
+            stream_usage=True,  # token counts on streamed replies too, for the usage ledger
         )
+    else:
+        raise ValueError(f"Unknown LLM_BACKEND '{backend}', expected 'openai' or 'fake'.")
+
+    return ResilientLLM(
+        llm,
+        timeout=timeout,
+        deadline=float(os.getenv("LLM_DEADLINE_SECONDS", "45")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+            metrics=llm_metrics,
+        ),
+    )
 
-        # Set up memory for conversation
-        self.memory = ConversationBufferWindowMemory(
-            k=10,  # remembers last 10 exchanges
-            return_messages=True,
-            memory_key="chat_history"
-        )
+
+class AICounselor:
+    def __init__(self, llm=None, history_tokens: int = 2000, attachment_tokens: int = 1500):
+        """
+        Initializes the AI counselor with the API key from the .env file and prepares the environment.
+        Pass a shared `llm` to avoid building a new client; history and profile stay per instance.
+        """
+        # Set up LangChain LLM
+        self.llm = llm or build_llm()
+
+        # Recent turns, oldest first, trimmed to what fits the token budget
+        self.history_assembler = HistoryAssembler(max_tokens=history_tokens)
+        self.history = []
+        self.summary = ""  # Rolling summary of turns that no longer fit, see Conversation.summary
+        self.attachment_tokens = attachment_tokens
+        self.last_prompt_tokens = 0
+        self.last_analysis = {}
+        self.last_message = ""
+        # Per-user journal search with a `context(text)` method, set by the session store
+        # (api/services/journal_index.py); its result goes into the prompt, bounded in tokens
+        self.journal = None
+        self.journal_context = ""
+        # Called with the token usage of every LLM call (api/services/usage_meter.py), set by the session store
+        self.on_usage = None
+        # Held by the chat views for a whole turn, so concurrent requests of the user take turns
+        # instead of mixing up the history, last_analysis and last_prompt_tokens
+        self.lock = threading.Lock()
 
         # Prompt template for the conversation
         self.prompt = PromptTemplate(
-            input_variables=["chat_history", "input"],
+            input_variables=["summary", "journal", "chat_history", "input"],
             template=(
                 "You are a supportive friend helping with addiction recovery.\n\n"
+                "What you remember about them from earlier:\n{summary}\n\n"
+                "{journal}"
                 "Recent conversation:\n{chat_history}\n\n"
                 "Current message: {input}\n\n"
                 "Respond in 2-3 short sentences like you're texting a close friend. "
@@ -52,9 +133,6 @@ class AICounselor:
             )
         )
 
-        # Set up the conversation chain
-        self.chain = LLMChain(llm=self.llm, prompt=self.prompt, memory=self.memory)
-
         self.conversation_history = []
         self.user_profile = {
             "addiction_type": None,
@@ -64,21 +142,7 @@ class AICounselor:
             "session_count": 0
         }
 
-        # Motivational quotes database
-        self.motivational_quotes = [
-            "Recovery is not a race. You don't have to feel guilty if it takes you longer than you thought it would.",
-            "The greatest revolution of our generation is the discovery that human beings, by changing the inner attitudes of their minds, can change the outer aspects of their lives.",
-            "You are stronger than your addiction and your addiction is not stronger than your God.",
-            "Don't quit too easily. Your life is precious.",
-            "Recovery is about progression, not perfection.",
-            "If you are tired take rest and start again. Believe that you can do it.",
-            "One day at a time, one moment at a time, one breath at a time.",
-            "Life doesn't always go with the flow. Life is like a wave sometimes you need to stay calm sometimes you need to rise.",
-            "The only person you are destined to become is the person you decide to be.",
-            "Don't let the past take over your today.",
-            "Healing takes time, and asking for help is a courageous step.",
-            "Progress, not perfection, is what we should strive for."
-        ]
+        self.motivational_quotes = list(MOTIVATIONAL_QUOTES)
 
     def create_system_prompt(self) -> str:
         return f"""
@@ -124,6 +188,9 @@ class AICounselor:
         """
         Extracts text from an image using OCR (Optical Character Recognition).
         """
+        import pytesseract
+        from PIL import Image
+
         try:
             image = Image.open(io.BytesIO(image_data))
             text = pytesseract.image_to_string(image)
@@ -135,6 +202,8 @@ class AICounselor:
         """
         Extracts text from a PDF file.
         """
+        import PyPDF2
+
         try:
             pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_data))
             text = ""
@@ -147,50 +216,9 @@ class AICounselor:
     def analyze_user_message(self, message: str) -> dict:
         """
         Analyzes the user's message to determine emotional state, triggers, and support needed.
+        Keyword rules live in api/data/message_rules.json (api/services/message_classifier.py).
         """
-        # Simple keyword-based analysis to avoid API parsing issues
-        message_lower = message.lower()
-        
-        # Detect emotional state
-        emotional_state = "neutral"
-        if any(word in message_lower for word in ["anxious", "anxiety", "nervous", "worried", "panic"]):
-            emotional_state = "anxious"
-        elif any(word in message_lower for word in ["sad", "depressed", "down", "hopeless", "worthless"]):
-            emotional_state = "depressed"
-        elif any(word in message_lower for word in ["angry", "mad", "frustrated", "pissed", "furious"]):
-            emotional_state = "angry"
-        elif any(word in message_lower for word in ["craving", "want to", "need to", "urge", "tempted"]):
-            emotional_state = "craving"
-        elif any(word in message_lower for word in ["drunk", "high", "using", "relapsed", "drank"]):
-            emotional_state = "using"
-        
-        # Detect support needed
-        support_needed = ["general_support"]
-        if emotional_state == "anxious":
-            support_needed.append("meditation")
-        elif emotional_state == "depressed":
-            support_needed.extend(["exercise", "motivation"])
-        elif emotional_state == "craving":
-            support_needed.extend(["meditation", "motivation"])
-        elif emotional_state == "using":
-            support_needed.extend(["crisis", "motivation"])
-        
-        # Detect urgency
-        urgency = "medium"
-        if any(word in message_lower for word in ["suicide", "kill myself", "end it", "can't go on"]):
-            urgency = "crisis"
-        elif any(word in message_lower for word in ["drunk", "high", "relapsed", "used"]):
-            urgency = "high"
-        elif any(word in message_lower for word in ["craving", "urge", "tempted"]):
-            urgency = "high"
-        
-        return {
-            "emotional_state": emotional_state,
-            "triggers": [],
-            "support_needed": support_needed,
-            "urgency": urgency,
-            "key_concerns": []
-        }
+        return message_classifier.classify(message)
 
     def generate_meditation_suggestion(self, emotional_state: str) -> str:
         """
@@ -251,8 +279,12 @@ class AICounselor:
 
         self.user_profile["session_count"] += 1
 
-    def process_message(self, message: str, image_data: bytes = None, pdf_data: bytes = None) -> str:
-        extracted_text = ""
+    def prepare_message(self, message: str, image_data: bytes = None, pdf_data: bytes = None, attachment_text: str = None) -> str:
+        """
+        Merges attachment text into the message and updates the profile from its analysis.
+        Pass `attachment_text` when the attachments were already extracted elsewhere.
+        """
+        extracted_text = attachment_text or ""
         if image_data:
             extracted_text += "Image content: " + self.extract_text_from_image(image_data) + "\n"
         if pdf_data:
@@ -260,21 +292,220 @@ class AICounselor:
 
         full_message = message
         if extracted_text.strip():
+            # Long PDFs would otherwise blow up the prompt, keep the start of them
+            extracted_text = truncate_tokens(extracted_text, self.attachment_tokens)
             full_message += f"\n\nAdditional context from attachments:\n{extracted_text}"
 
         # Analyze the message
         analysis = self.analyze_user_message(full_message)
         self.update_user_profile(analysis)
+        self.last_analysis = analysis
+        self.last_message = full_message
+        self.journal_context = self.journal.context(full_message) if self.journal is not None else ""
+        return full_message
+
+    async def aprepare_message(self, message: str, image_data: bytes = None, pdf_data: bytes = None, attachment_text: str = None) -> str:
+        """
+        Async version of `prepare_message`. OCR, PDF parsing and the journal lookup
+        (a network call with a remote embedder) run in a worker thread, off the event loop.
+        """
+        if image_data or pdf_data or self.journal is not None:
+            return await sync_to_async(self.prepare_message, thread_sensitive=False)(message, image_data, pdf_data, attachment_text)
+        return self.prepare_message(message, attachment_text=attachment_text)
+
+    def in_crisis(self) -> bool:
+        """
+        True when the last prepared message was classified as a crisis.
+        """
+        return self.last_analysis.get("urgency") == "crisis"
+
+    def crisis_response(self, full_message: str) -> str:
+        self.remember_turn(full_message, CRISIS_RESPONSE)
+        self.last_prompt_tokens = 0
+        return CRISIS_RESPONSE
 
+    def crisis_follow_up(self, full_message: str) -> str:
+        """
+        LLM follow-up sent after the crisis response; raises if the LLM call fails.
+        """
+        prompt, _ = self.assemble_prompt(
+            f"{full_message}\n\n(You already gave them crisis line details. "
+            "Follow up warmly, stay with them, and encourage reaching out to someone now.)"
+        )
+        started = time.monotonic()
+        reply = self.llm.invoke(prompt)
+        response = reply.content.strip()
+        self.report_usage("crisis_follow_up", prompt, response, reply, started)
+        self.history.append(Turn("ai", response, turn_tokens(response)))
+        return response
+
+    def load_history(self, rows, summary: str = ""):
+        """
+        Seeds the history from stored messages given newest first as (role, content),
+        plus the summary of anything older.
+        """
+        window = self.history_assembler.assemble(rows)
+        self.history = list(window.turns)
+        self.summary = summary
+
+    def remember_turn(self, user_message: str, ai_response: str):
+        self.history.append(Turn("user", user_message, turn_tokens(user_message)))
+        self.history.append(Turn("ai", ai_response, turn_tokens(ai_response)))
+        # Nothing older than the budget can ever be sent again
+        total = sum(turn.tokens for turn in self.history)
+        while self.history and total > self.history_assembler.max_tokens:
+            total -= self.history.pop(0).tokens
+
+    def assemble_prompt(self, full_message: str):
+        """
+        Fills the template with the newest turns that fit the history budget.
+        Returns the prompt and its size in tokens.
+        """
+        summary = self.summary or "(nothing yet)"
+        journal = f"From their journal (bring up only if it helps):\n{self.journal_context}\n\n" if self.journal_context else ""
+        reserved = count_tokens(self.prompt.format(summary=summary, journal=journal, chat_history="", input=full_message))
+        window = self.history_assembler.assemble(reversed(self.history))
+        prompt = self.prompt.format(summary=summary, journal=journal, chat_history=format_history(window.turns), input=full_message)
+        return prompt, reserved + window.tokens
+
+    def build_prompt(self, full_message: str) -> str:
+        """
+        Same as `assemble_prompt`, recording the prompt size in `last_prompt_tokens`.
+        """
+        prompt, self.last_prompt_tokens = self.assemble_prompt(full_message)
+        return prompt
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.llm, "model_name", None) or type(self.llm).__name__
+
+    def report_usage(self, kind: str, prompt: str, response: str, reply, started: float):
+        """
+        Passes the token usage of one LLM call to `on_usage`. When the provider sent
+        no usage data the tokens are counted locally and marked as estimated.
+        """
+        if self.on_usage is None:
+            return
+        usage = getattr(reply, "usage_metadata", None) or {}
+        estimated = "input_tokens" not in usage
+        self.on_usage(
+            kind=kind,
+            model=self.model_name,
+            prompt_tokens=count_tokens(prompt) if estimated else usage["input_tokens"],
+            completion_tokens=count_tokens(response) if estimated else usage.get("output_tokens", 0),
+            latency_ms=int((time.monotonic() - started) * 1000),
+            estimated=estimated,
+        )
+
+    def metered_stream(self, prompt: str, kind: str = "chat"):
+        """
+        Text chunks of the LLM stream. Usage is reported however the stream ends,
+        including a client that stops reading halfway; the usage arrives on the
+        last chunk, which has no text.
+        """
+        chunks, last, started = [], None, time.monotonic()
+        try:
+            for chunk in self.llm.stream(prompt):
+                last = chunk if getattr(chunk, "usage_metadata", None) else last
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield chunk.content
+        finally:
+            if chunks or last is not None:
+                self.report_usage(kind, prompt, "".join(chunks), last, started)
+
+    async def ametered_stream(self, prompt: str, kind: str = "chat"):
+        chunks, last, started = [], None, time.monotonic()
         try:
-            response = self.chain.invoke({"input": full_message})
-            # If response is a dict (as with PromptTemplate), use response["text"]
-            if isinstance(response, dict) and "text" in response:
-                return response["text"].strip()
-            return response.strip()
+            async for chunk in self.llm.astream(prompt):
+                last = chunk if getattr(chunk, "usage_metadata", None) else last
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield chunk.content
+        finally:
+            if chunks or last is not None:
+                self.report_usage(kind, prompt, "".join(chunks), last, started)
+
+    def process_message(self, message: str, image_data: bytes = None, pdf_data: bytes = None, attachment_text: str = None) -> str:
+        full_message = self.prepare_message(message, image_data, pdf_data, attachment_text)
+        if self.in_crisis():
+            return self.crisis_response(full_message)
+        prompt = self.build_prompt(full_message)
+
+        started = time.monotonic()
+        try:
+            reply = self.llm.invoke(prompt)
         except Exception as e:
-            return f"I'm here for you, but having some tech issues. Can you tell me more about how you're feeling? 💙"
+            return FALLBACK_RESPONSE
+        response = reply.content.strip()
+        self.report_usage("chat", prompt, response, reply, started)
+        self.remember_turn(full_message, response)
+        return response
+
+    async def aprocess_message(self, message: str, image_data: bytes = None, pdf_data: bytes = None, attachment_text: str = None) -> str:
+        """
+        Async version of `process_message`; the LLM wait does not hold a worker thread.
+        """
+        full_message = await self.aprepare_message(message, image_data, pdf_data, attachment_text)
+        if self.in_crisis():
+            return self.crisis_response(full_message)
+        prompt = self.build_prompt(full_message)
+
+        started = time.monotonic()
+        try:
+            reply = await self.llm.ainvoke(prompt)
+        except Exception:
+            return FALLBACK_RESPONSE
+        response = reply.content.strip()
+        self.report_usage("chat", prompt, response, reply, started)
+        self.remember_turn(full_message, response)
+        return response
+
+    def stream_message(self, message: str, image_data: bytes = None, pdf_data: bytes = None, attachment_text: str = None):
+        """
+        Yields the response text chunk by chunk as the LLM produces it.
+        The full response is added to the history once the stream is finished.
+        """
+        full_message = self.prepare_message(message, image_data, pdf_data, attachment_text)
+        if self.in_crisis():
+            yield self.crisis_response(full_message)
+            return
+        prompt = self.build_prompt(full_message)
+
+        chunks = []
+        try:
+            for text in self.metered_stream(prompt):
+                chunks.append(text)
+                yield text
+        except Exception:
+            # Only fall back if nothing was sent yet, otherwise keep the partial answer
+            if not chunks:
+                chunks.append(FALLBACK_RESPONSE)
+                yield FALLBACK_RESPONSE
+
+        self.remember_turn(full_message, "".join(chunks).strip())
+
+    async def astream_message(self, message: str, attachment_text: str = None):
+        """
+        Async version of `stream_message` for the ASGI chat view.
+        """
+        full_message = await self.aprepare_message(message, attachment_text=attachment_text)
+        if self.in_crisis():
+            yield self.crisis_response(full_message)
+            return
+        prompt = self.build_prompt(full_message)
+
+        chunks = []
+        try:
+            async for text in self.ametered_stream(prompt):
+                chunks.append(text)
+                yield text
+        except Exception:
+            if not chunks:
+                chunks.append(FALLBACK_RESPONSE)
+                yield FALLBACK_RESPONSE
 
+        self.remember_turn(full_message, "".join(chunks).strip())
 
     def save_conversation_history(self, filename: str):
         """
@@ -407,7 +638,8 @@ class AICounselor:
                 print(f"\n❌ An error occurred: {e}")
                 print("Please try again, or type 'quit' to exit.")
 
-# Main execution
+# Main execution: `python -m api.ai` from the project root (`python api/ai.py`
+# cannot import the api.services modules above)
 if __name__ == "__main__":
     try:
         counselor = AICounselor()
@@ -0,0 +1,300 @@
+# Async (ASGI) versions of the chat, history and voice endpoints.
+# An in-flight LLM call here awaits on the event loop instead of pinning a worker thread.
+# Serve with an ASGI server pointed at StepCoachLive.asgi:application.
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from main.models import Conversation, Message
+from api.serializers import ConversationSerializer, MessageSerializer
+from api.views import chat_flight_key, sse_event
+from .services.counselor_sessions import counselor_sessions
+from .services.conversation_summary import conversation_summaries
+from .services.attachment_extraction import attachment_extractor
+from .services.crisis import crisis_follow_ups
+from .services.chat_turns import asave_turn
+from .services.chat_flights import DuplicateTimeout, chat_flights
+from .services.voice_transcripts import transcript_writers
+from .services.voice_registry import VoiceCapacityError, VoiceSessionElsewhere, voice_registry
+from .services.rate_limit import rate_limiter
+
+
+async def authenticate(request):
+    """
+    Resolve the JWT user the same way DRF does for the sync views.
+    """
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return result[0] if result else None
+
+
+def request_data(request) -> dict:
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+    return request.POST.dict()
+
+
+def unauthorized():
+    return JsonResponse(
+        {"detail": "Authentication credentials were not provided."},
+        status=status.HTTP_401_UNAUTHORIZED,
+    )
+
+
+async def rate_limit(user, scope):
+    """
+    Same plan limits as the sync views' throttles; None when the scope is not limited.
+    """
+    return await sync_to_async(rate_limiter.hit)(user.id, scope)
+
+
+def throttled(decision):
+    response = JsonResponse(
+        {"detail": f"Request was throttled. Expected available in {decision.retry_after} seconds."},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+    )
+    return with_rate_limit_headers(response, decision)
+
+
+def with_rate_limit_headers(response, decision):
+    if decision is not None:
+        for header, value in decision.headers().items():
+            response[header] = value
+    return response
+
+
+@asynccontextmanager
+async def turn(counselor, poll_seconds: float = 0.02):
+    """
+    Holds the counselor's lock (AICounselor.lock) for one turn of the user.
+    While another turn has it this polls rather than blocking, so the event
+    loop keeps running and a cancelled request never ends up owning the lock.
+    """
+    while not counselor.lock.acquire(blocking=False):
+        await asyncio.sleep(poll_seconds)
+    try:
+        yield
+    finally:
+        counselor.lock.release()
+
+
+class AsyncChatView(View):
+    async def post(self, request):
+        """
+        Same contract as ChatView, including `?stream=1`.
+        """
+        user = await authenticate(request)
+        if user is None:
+            return unauthorized()
+
+        decision = await rate_limit(user, 'chat')
+        if decision is not None and not decision.allowed:
+            return throttled(decision)
+        return with_rate_limit_headers(await self.chat(request, user), decision)
+
+    async def chat(self, request, user):
+        data = request_data(request)
+        conversation_type = data.get('conversation_type', 'text')
+
+        if conversation_type == 'text':
+            serializer = MessageSerializer(data=data)
+            if not serializer.is_valid():
+                return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            user_message = serializer.validated_data['content']
+            stream = request.GET.get('stream') in ('1', 'true')
+            flight, leader = chat_flights.begin(chat_flight_key(request, user.id, conversation_type, user_message))
+            if not leader:
+                return await self.shared_response(flight, stream)
+
+            try:
+                conversation, created = await Conversation.objects.aget_or_create(user_id=user.id)
+                counselor = await sync_to_async(counselor_sessions.get)(user.id)
+                attachment_text = await self.attachment_text(request)
+
+                if stream:
+                    return self.stream_response(user, counselor, conversation, user_message, attachment_text, flight)
+
+                async with turn(counselor):
+                    ai_response = await counselor.aprocess_message(user_message, attachment_text=attachment_text)
+                    await asave_turn(conversation, user_message, ai_response)
+                    if counselor.in_crisis():
+                        await sync_to_async(crisis_follow_ups.handle)(counselor, user, conversation, user_message, ai_response)
+                    prompt_tokens = counselor.last_prompt_tokens
+                conversation_summaries.record_turn(conversation.id)
+            except BaseException as e:
+                chat_flights.fail(flight, e)
+                raise
+            result = {"response": ai_response, "prompt_tokens": prompt_tokens}
+            chat_flights.finish(flight, result)
+            return JsonResponse(result)
+
+        elif conversation_type == 'voice':
+            user_message = data.get('content', '')
+            flight, leader = chat_flights.begin(chat_flight_key(request, user.id, conversation_type, user_message))
+            if not leader:
+                return await self.shared_response(flight, stream=False)
+
+            try:
+                counselor = await sync_to_async(counselor_sessions.get)(user.id)
+                async with turn(counselor):
+                    ai_response = await counselor.aprocess_message(user_message)
+                    if counselor.in_crisis():
+                        await sync_to_async(crisis_follow_ups.handle)(counselor, user, None, user_message, ai_response)
+                    prompt_tokens = counselor.last_prompt_tokens
+            except BaseException as e:
+                chat_flights.fail(flight, e)
+                raise
+            result = {"response": ai_response, "prompt_tokens": prompt_tokens}
+            chat_flights.finish(flight, result)
+            return JsonResponse(result)
+
+        return JsonResponse({
+            "error": "Invalid conversation type. Must be either 'text' or 'voice'."
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    async def attachment_text(self, request):
+        image = request.FILES.get('image')
+        pdf = request.FILES.get('pdf')
+        if not image and not pdf:
+            return None
+        return await attachment_extractor.aextract_all(
+            image_data=image.read() if image else None,
+            pdf_data=pdf.read() if pdf else None,
+        )
+
+    async def shared_response(self, flight, stream):
+        """
+        Same as ChatView.shared_response; the wait runs in a worker thread, off the event loop.
+        """
+        try:
+            if flight.done.is_set():
+                result = chat_flights.wait(flight)
+            else:
+                result = await sync_to_async(chat_flights.wait, thread_sensitive=False)(flight)
+        except DuplicateTimeout:
+            return JsonResponse(
+                {"error": "An identical request is still being processed."}, status=status.HTTP_409_CONFLICT,
+            )
+        if stream:
+            async def events():
+                yield sse_event({"token": result["response"]})
+                yield sse_event(result, event="done")
+
+            response = StreamingHttpResponse(events(), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+        else:
+            response = JsonResponse(result)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def stream_response(self, user, counselor, conversation, user_message, attachment_text=None, flight=None):
+        async def events():
+            chunks = []
+            completed = False
+            async with turn(counselor):
+                try:
+                    async for token in counselor.astream_message(user_message, attachment_text=attachment_text):
+                        chunks.append(token)
+                        yield sse_event({"token": token})
+                    completed = True
+                except Exception as e:
+                    if flight is not None:
+                        chat_flights.fail(flight, e)
+                    raise
+                finally:
+                    # Also runs when the client disconnects, so the user message is never lost
+                    # and duplicates waiting on the flight get what was streamed
+                    ai_response = "".join(chunks).strip()
+                    prompt_tokens = counselor.last_prompt_tokens
+                    try:
+                        await asave_turn(conversation, user_message, ai_response)
+                        if completed and counselor.in_crisis():
+                            await sync_to_async(crisis_follow_ups.handle)(counselor, user, conversation, user_message, ai_response)
+                    finally:
+                        if flight is not None and not flight.done.is_set():
+                            chat_flights.finish(flight, {"response": ai_response, "prompt_tokens": prompt_tokens})
+
+            conversation_summaries.record_turn(conversation.id)
+            yield sse_event({"response": ai_response, "prompt_tokens": prompt_tokens}, event="done")
+
+        response = StreamingHttpResponse(events(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class AsyncConversationHistoryView(View):
+    async def get(self, request):
+        user = await authenticate(request)
+        if user is None:
+            return unauthorized()
+
+        conversations = [
+            conversation
+            async for conversation in Conversation.objects.filter(user_id=user.id).prefetch_related('messages')
+        ]
+        return JsonResponse(ConversationSerializer(conversations, many=True).data, safe=False)
+
+
+class AsyncVoiceSessionView(View):
+    """
+    Async wrapper around the voice registry; starting and ending sessions runs in a worker thread.
+    """
+    async def post(self, request):
+        user = await authenticate(request)
+        if user is None:
+            return unauthorized()
+
+        decision = await rate_limit(user, 'voice')
+        if decision is not None and not decision.allowed:
+            return throttled(decision)
+
+        agent = (request_data(request).get("agent") or "male").lower()
+        user_key = str(user.id)
+
+        # Utterances are buffered and written in batches, off the SDK callback thread
+        transcript = transcript_writers.open(user_key)
+
+        try:
+            await sync_to_async(voice_registry.start, thread_sensitive=False)(
+                user_key=user_key,
+                agent=agent,
+                on_user_transcript=transcript.user,
+                on_agent_response=transcript.agent,
+                on_end=transcript.close,
+            )
+            response = JsonResponse({"status": "running", "agent": agent}, status=status.HTTP_200_OK)
+        except VoiceSessionElsewhere as e:
+            response = JsonResponse({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except VoiceCapacityError as e:
+            response = JsonResponse({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = str(int(voice_registry.reap_interval))
+        except Exception as e:
+            response = JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return with_rate_limit_headers(response, decision)
+
+    async def delete(self, request):
+        user = await authenticate(request)
+        if user is None:
+            return unauthorized()
+
+        try:
+            conversation_id = await sync_to_async(voice_registry.end, thread_sensitive=False)(str(user.id))
+        except VoiceSessionElsewhere:
+            return JsonResponse({"status": "ending"}, status=status.HTTP_202_ACCEPTED)
+        return JsonResponse({"status": "ended", "conversation_id": conversation_id}, status=status.HTTP_200_OK)
@@ -0,0 +1,37 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.db.models.functions import Cast
+
+from main.models import Conversation
+
+
+class Command(BaseCommand):
+    help = (
+        "Bring Conversation.user and legacy_user_id into agreement: set the FK from legacy ids that "
+        "name a user, and copy the FK into legacy_user_id where it differs. Safe to run any number of "
+        "times; run it before the migration that drops legacy_user_id."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=5000, help="Conversations per id range.")
+        parser.add_argument("--check", action="store_true", help="Only count the rows that disagree.")
+
+    def handle(self, *args, **options):
+        text_user = Cast('user_id', models.CharField(max_length=255))
+        user_ids = User.objects.annotate(key=Cast('id', models.CharField(max_length=255))).values('key')
+        last = Conversation.objects.aggregate(last=models.Max('id'))['last'] or 0
+        linked = relabeled = 0
+        for start in range(0, last, options["batch"]):
+            batch = Conversation.objects.filter(id__gt=start, id__lte=start + options["batch"])
+            unlinked = batch.filter(user__isnull=True, legacy_user_id__in=user_ids)
+            stale = batch.filter(user__isnull=False).exclude(legacy_user_id=text_user)
+            if options["check"]:
+                linked += unlinked.count()
+                relabeled += stale.count()
+            else:
+                linked += unlinked.update(user_id=Cast('legacy_user_id', models.BigIntegerField()))
+                relabeled += stale.update(legacy_user_id=text_user)
+
+        verb = "disagree" if options["check"] else "fixed"
+        self.stdout.write(f"{linked:,} conversations without the FK and {relabeled:,} with a stale legacy id {verb}")
@@ -0,0 +1,40 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from api.ai import AICounselor
+from api.services.llm_backends import FakeChatModel
+
+
+class Command(BaseCommand):
+    help = "Compare concurrent chat turns on the sync (thread per request) and async counselor paths against a fake LLM."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Concurrent chat turns to run.")
+        parser.add_argument("--workers", type=int, default=8, help="Sync worker threads, like a WSGI pool.")
+        parser.add_argument("--latency", type=float, default=0.5, help="Fake LLM latency in seconds.")
+
+    def handle(self, *args, **options):
+        n, workers = options["requests"], options["workers"]
+        llm = FakeChatModel(first_token_ms=options["latency"] * 1000)
+        counselors = [AICounselor(llm=llm) for _ in range(n)]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda c: c.process_message("I'm craving a drink tonight"), counselors))
+        sync_elapsed = time.perf_counter() - started
+
+        async def run_async():
+            await asyncio.gather(*(c.aprocess_message("I'm craving a drink tonight") for c in counselors))
+
+        started = time.perf_counter()
+        asyncio.run(run_async())
+        async_elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"{n} turns, {options['latency']:.2f}s fake LLM latency")
+        self.stdout.write(f"sync  ({workers} workers): {sync_elapsed:7.2f}s  {n / sync_elapsed:8.1f} turns/s")
+        self.stdout.write(f"async (1 event loop): {async_elapsed:7.2f}s  {n / async_elapsed:8.1f} turns/s")
+        self.stdout.write(f"speedup: {sync_elapsed / async_elapsed:.1f}x")
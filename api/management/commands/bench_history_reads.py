@@ -0,0 +1,154 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+# Indexes before and after migrations 0036/0037, on copies of the chat tables
+BEFORE_INDEXES = [
+    "CREATE INDEX bench_message_conversation ON bench_message (conversation_id)",
+]
+AFTER_INDEXES = [
+    "CREATE INDEX bench_message_conv_ts_id ON bench_message (conversation_id, timestamp, id)",
+    "CREATE INDEX bench_message_conv_id ON bench_message (conversation_id, id)",
+    "CREATE INDEX bench_conversation_user_updated ON bench_conversation (user_ref_id, last_updated DESC)",
+    "DROP INDEX bench_message_conversation",
+]
+
+# The reads ChatView, the session store and the history endpoints issue
+QUERIES = {
+    "latest conversation": (
+        "SELECT id FROM bench_conversation WHERE user_id = %s ORDER BY last_updated DESC LIMIT 1",
+        "SELECT id FROM bench_conversation WHERE user_ref_id = %s ORDER BY last_updated DESC LIMIT 1",
+    ),
+    "hydrate session": (
+        "SELECT role, content FROM bench_message WHERE conversation_id = %s AND id > %s ORDER BY id DESC LIMIT 50",
+    ) * 2,
+    "newest page": (
+        "SELECT id, role, content, timestamp FROM bench_message WHERE conversation_id = %s "
+        "ORDER BY timestamp DESC, id DESC LIMIT 31",
+    ) * 2,
+    "page before cursor": (
+        "SELECT id, role, content, timestamp FROM bench_message WHERE conversation_id = %s "
+        "AND timestamp <= %s AND (timestamp < %s OR id < %s) ORDER BY timestamp DESC, id DESC LIMIT 31",
+    ) * 2,
+}
+
+
+class Command(BaseCommand):
+    help = "Time conversation history reads before and after the chat table indexes, on a throwaway database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=1_000_000, help="Total messages (try 10000000).")
+        parser.add_argument("--per-conversation", type=int, default=400, help="Messages in a typical conversation.")
+        parser.add_argument("--heavy", type=int, default=100_000, help="Messages in the one very long conversation.")
+        parser.add_argument("--repeat", type=int, default=200, help="Timed runs per query.")
+        parser.add_argument("--seed", type=int, default=3)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        workdir = tempfile.mkdtemp(prefix="bench-history-")
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(workdir, "db.sqlite3")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            os.rmdir(workdir)
+
+    def run(self, options):
+        rng = random.Random(options["seed"])
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute("PRAGMA synchronous = OFF")
+            started = time.perf_counter()
+            conversations = self.populate(cursor, rng, options)
+            self.stdout.write(f"loaded {options['messages']:,} messages in {conversations:,} conversations "
+                              f"({time.perf_counter() - started:.0f}s)")
+
+            for sql in BEFORE_INDEXES:
+                cursor.execute(sql)
+            before = self.measure(cursor, rng, conversations, options, 0)
+
+            started = time.perf_counter()
+            for sql in AFTER_INDEXES:
+                cursor.execute(sql)
+            self.stdout.write(f"building the new indexes took {time.perf_counter() - started:.1f}s")
+            after = self.measure(cursor, rng, conversations, options, 1)
+
+        self.stdout.write(f"{'median ms':<34}{'before':>10}{'after':>10}{'speedup':>10}")
+        for name in QUERIES:
+            for target in ("typical", "heavy"):
+                b, a = before[name, target], after[name, target]
+                self.stdout.write(f"{name + ' (' + target + ')':<34}{b:>10.3f}{a:>10.3f}{b / a:>9.0f}x")
+
+    def populate(self, cursor, rng, options):
+        cursor.execute(
+            "CREATE TABLE bench_conversation (id BIGINT PRIMARY KEY, user_id VARCHAR(255) NOT NULL, "
+            "user_ref_id BIGINT, last_updated TIMESTAMP NOT NULL)"
+        )
+        cursor.execute(
+            "CREATE TABLE bench_message (id BIGINT PRIMARY KEY, conversation_id BIGINT NOT NULL, "
+            "role VARCHAR(50) NOT NULL, content TEXT NOT NULL, timestamp TIMESTAMP NOT NULL)"
+        )
+        total, heavy = options["messages"], min(options["heavy"], options["messages"])
+        conversations = max(1, (total - heavy) // options["per_conversation"]) + 1
+        # One conversation per user, like ChatView creates them; conversation 1 is the heavy one
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        cursor.executemany(
+            "INSERT INTO bench_conversation (id, user_id, user_ref_id, last_updated) VALUES (%s, %s, %s, %s)",
+            [(cid, str(cid), cid, start) for cid in range(1, conversations + 1)],
+        )
+
+        batch = []
+        for mid in range(1, total + 1):
+            # Messages of every conversation interleave over time, as they do in production
+            cid = 1 if rng.random() < heavy / total else rng.randint(2, conversations)
+            batch.append((mid, cid, "user" if mid % 2 else "ai", f"message {mid} in conversation {cid}",
+                          start + timedelta(seconds=mid)))
+            if len(batch) == 20_000:
+                self.insert_messages(cursor, batch)
+                batch = []
+        if batch:
+            self.insert_messages(cursor, batch)
+        return conversations
+
+    @staticmethod
+    def insert_messages(cursor, rows):
+        cursor.executemany(
+            "INSERT INTO bench_message (id, conversation_id, role, content, timestamp) VALUES (%s, %s, %s, %s, %s)",
+            rows,
+        )
+
+    def measure(self, cursor, rng, conversations, options, variant):
+        cursor.execute("SELECT id, timestamp FROM bench_message WHERE conversation_id = 1 ORDER BY id")
+        heavy_rows = cursor.fetchall()
+        middle = heavy_rows[len(heavy_rows) // 2] if heavy_rows else (0, datetime(2024, 1, 1, tzinfo=timezone.utc))
+        # The summary watermark sits well behind the newest message, as it does after summarizing
+        watermark = heavy_rows[max(0, len(heavy_rows) - 200)][0] if heavy_rows else 0
+
+        results = {}
+        for name, variants in QUERIES.items():
+            sql = variants[variant]
+            for target in ("typical", "heavy"):
+                timings = []
+                for _ in range(options["repeat"]):
+                    cid = 1 if target == "heavy" else rng.randint(2, conversations)
+                    params = {
+                        "latest conversation": (cid if variant else str(cid),),
+                        "hydrate session": (cid, watermark if target == "heavy" else 0),
+                        "newest page": (cid,),
+                        "page before cursor": (cid, middle[1], middle[1], middle[0]),
+                    }[name]
+                    started = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    timings.append((time.perf_counter() - started) * 1000)
+                results[name, target] = statistics.median(timings)
+        return results
@@ -0,0 +1,77 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+# What every worker and manage.py command pays before doing any work: settings,
+# app registry, admin autodiscovery and the URLconf (system checks import it)
+PROBE = (
+    "import json, sys, django; django.setup(); "
+    "from django.urls import get_resolver; get_resolver().url_patterns; "
+    "print(json.dumps(sorted(sys.modules)))"
+)
+
+# SDKs that must stay out of the boot path; each is imported by the code that uses it
+HEAVY_MODULES = (
+    "elevenlabs", "langchain", "langchain_core", "langchain_openai", "numpy", "openai",
+    "PIL", "PyPDF2", "pytesseract", "stripe", "tiktoken",
+)
+
+
+class Command(BaseCommand):
+    help = "Time django.setup() plus URLconf loading in fresh interpreters with `python -X importtime`."
+    requires_system_checks = []  # the checks would load the URLconf in this process too
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time.")
+        parser.add_argument("--top", type=int, default=15, help="Slowest top-level imports to list.")
+        parser.add_argument("--max-ms", type=float, default=None,
+                            help="Fail when the median wall time is above this (for CI).")
+
+    def handle(self, *args, **options):
+        walls, imports, modules, per_module = [], [], set(), {}
+        for _ in range(max(1, options["runs"])):
+            started = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", PROBE],
+                capture_output=True, text=True, env=os.environ.copy(),
+            )
+            walls.append((time.perf_counter() - started) * 1000)
+            if result.returncode:
+                raise CommandError(result.stderr.strip().splitlines()[-1])
+            modules = set(json.loads(result.stdout.strip().splitlines()[-1]))
+            top_level = self.parse(result.stderr)
+            imports.append(sum(top_level.values()) / 1000)
+            for name, micros in top_level.items():
+                per_module.setdefault(name, []).append(micros / 1000)
+
+        self.stdout.write(f"{'median wall ms':<28}{statistics.median(walls):>10.1f}")
+        self.stdout.write(f"{'median import ms':<28}{statistics.median(imports):>10.1f}")
+        self.stdout.write(f"{'modules loaded':<28}{len(modules):>10}")
+        slowest = sorted(per_module.items(), key=lambda item: -statistics.median(item[1]))[:options["top"]]
+        for name, timings in slowest:
+            self.stdout.write(f"  {name:<40}{statistics.median(timings):>8.1f} ms")
+
+        heavy = sorted(name for name in HEAVY_MODULES if name in modules)
+        self.stdout.write(f"heavy modules at boot: {', '.join(heavy) or 'none'}")
+        if options["max_ms"] is not None and statistics.median(walls) > options["max_ms"]:
+            raise CommandError(f"boot took {statistics.median(walls):.0f} ms, budget is {options['max_ms']:.0f} ms")
+
+    @staticmethod
+    def parse(stderr: str) -> dict:
+        """
+        Cumulative microseconds of each top-level import (the ones the probe or
+        Django triggered directly, not the modules they pulled in).
+        """
+        top_level = {}
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if not name.startswith("  "):
+                top_level[name.strip()] = int(cumulative)
+        return top_level
@@ -0,0 +1,89 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services.message_classifier import message_classifier
+from main.models import Message
+
+SENTENCES = [
+    "I had a really long day at work and my boss kept piling more on my desk.",
+    "Honestly I feel kind of down about how things went with my sister last weekend.",
+    "I keep thinking about stopping at the bar on the way home, the urge is strong tonight.",
+    "My therapist said I should try journaling before bed so I started doing that.",
+    "I'm worried I won't be able to sleep again without something to take the edge off.",
+    "We went hiking on Saturday and it was the first time in months I felt clear headed.",
+    "I relapsed on Friday and I'm so frustrated with myself, I thought I was past this.",
+    "Nothing major happened today, just errands and cooking dinner for the kids.",
+    "Sometimes I feel hopeless like I can't go on doing this every single day.",
+    "My friends want to go out for drinks for a birthday and I don't know what to say.",
+    "I've been 42 days sober and I'm proud of it but also scared of messing it up.",
+    "The meeting tonight helped a lot, someone shared a story that sounded just like mine.",
+]
+
+
+def legacy_analyze(message: str) -> dict:
+    """The keyword scans analyze_user_message used before the compiled classifier."""
+    message_lower = message.lower()
+    emotional_state = "neutral"
+    if any(word in message_lower for word in ["anxious", "anxiety", "nervous", "worried", "panic"]):
+        emotional_state = "anxious"
+    elif any(word in message_lower for word in ["sad", "depressed", "down", "hopeless", "worthless"]):
+        emotional_state = "depressed"
+    elif any(word in message_lower for word in ["angry", "mad", "frustrated", "pissed", "furious"]):
+        emotional_state = "angry"
+    elif any(word in message_lower for word in ["craving", "want to", "need to", "urge", "tempted"]):
+        emotional_state = "craving"
+    elif any(word in message_lower for word in ["drunk", "high", "using", "relapsed", "drank"]):
+        emotional_state = "using"
+    support_needed = ["general_support"]
+    if emotional_state == "anxious":
+        support_needed.append("meditation")
+    elif emotional_state == "depressed":
+        support_needed.extend(["exercise", "motivation"])
+    elif emotional_state == "craving":
+        support_needed.extend(["meditation", "motivation"])
+    elif emotional_state == "using":
+        support_needed.extend(["crisis", "motivation"])
+    urgency = "medium"
+    if any(word in message_lower for word in ["suicide", "kill myself", "end it", "can't go on"]):
+        urgency = "crisis"
+    elif any(word in message_lower for word in ["drunk", "high", "relapsed", "used"]):
+        urgency = "high"
+    elif any(word in message_lower for word in ["craving", "urge", "tempted"]):
+        urgency = "high"
+    return {"emotional_state": emotional_state, "triggers": [], "support_needed": support_needed,
+            "urgency": urgency, "key_concerns": []}
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark the message classifier against the old keyword scans."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=20000, help="Corpus size.")
+        parser.add_argument("--from-db", action="store_true", help="Sample user messages from the Message table.")
+
+    def handle(self, *args, **options):
+        corpus = self.corpus(options["messages"], options["from_db"])
+        avg_len = sum(map(len, corpus)) / len(corpus)
+        mismatches = sum(legacy_analyze(m) != message_classifier.classify(m) for m in corpus)
+        self.stdout.write(f"{len(corpus)} messages, {avg_len:.0f} chars on average, {mismatches} mismatches vs legacy")
+
+        legacy = self.time_per_message(legacy_analyze, corpus)
+        current = self.time_per_message(message_classifier.classify, corpus)
+        self.stdout.write(f"legacy {legacy:7.2f} us/message  classifier {current:7.2f} us/message")
+
+    def time_per_message(self, fn, corpus):
+        started = time.perf_counter()
+        for message in corpus:
+            fn(message)
+        return (time.perf_counter() - started) * 1e6 / len(corpus)
+
+    def corpus(self, size, from_db):
+        if from_db:
+            rows = list(Message.objects.filter(role="user").values_list("content", flat=True)[:size])
+            if rows:
+                return rows
+        rng = random.Random(7)
+        return [" ".join(rng.sample(SENTENCES, rng.randint(2, 6))) for _ in range(size)]
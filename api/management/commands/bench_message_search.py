@@ -0,0 +1,83 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api.services.message_search import SearchFilters, message_search
+from main.models import Conversation
+
+WORDS = (
+    "craving drink urge sober meeting sponsor sleep work stress family angry anxious walk gym "
+    "journal relapse proud weekend party friends tired hopeful breathing coffee morning night "
+    "therapy boss sister kids money plan goal milestone day week month trigger calm"
+).split()
+
+QUERIES = ["craving", "cravings weekend", "sponsor meeting", "relapse party friends", "milestones"]
+
+
+class Command(BaseCommand):
+    help = "Time chat history search on a throwaway database filled with synthetic messages."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=1_000_000, help="Total messages.")
+        parser.add_argument("--users", type=int, default=2000, help="Users, one conversation each.")
+        parser.add_argument("--repeat", type=int, default=50, help="Timed runs per query.")
+        parser.add_argument("--seed", type=int, default=5)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        workdir = tempfile.mkdtemp(prefix="bench-search-")
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(workdir, "db.sqlite3")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            os.rmdir(workdir)
+
+    def run(self, options):
+        rng = random.Random(options["seed"])
+        started = time.perf_counter()
+        users = User.objects.bulk_create([User(username=f"bench{i}") for i in range(options["users"])])
+        conversations = Conversation.objects.bulk_create([Conversation(user=user) for user in users])
+        self.populate(rng, [c.id for c in conversations], options["messages"])
+        self.stdout.write(f"indexed {options['messages']:,} messages for {len(users):,} users "
+                          f"({time.perf_counter() - started:.0f}s, {message_search.backend.__class__.__name__})")
+
+        month = SearchFilters(since=datetime(2024, 2, 1, tzinfo=timezone.utc), until=datetime(2024, 3, 1, tzinfo=timezone.utc))
+        self.stdout.write(f"{'query':<28}{'hits':>6}{'p50 ms':>10}{'p99 ms':>10}")
+        for query in QUERIES:
+            for label, filters in (("", SearchFilters()), (" +ai, 1 month", month._replace(role="ai"))):
+                timings, hits = [], 0
+                for _ in range(options["repeat"]):
+                    user = rng.choice(users)
+                    t = time.perf_counter()
+                    hits += len(message_search.search(user.id, query, filters, limit=21))
+                    timings.append((time.perf_counter() - t) * 1000)
+                timings.sort()
+                p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+                self.stdout.write(f"{query + label:<28}{hits / options['repeat']:>6.1f}"
+                                  f"{statistics.median(timings):>10.2f}{p99:>10.2f}")
+
+    def populate(self, rng, conversation_ids, total):
+        # Straight into the table so the FTS triggers do the indexing, as they do for ChatView writes
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        step = timedelta(days=365) / total  # one year of history
+        sql = "INSERT INTO main_message (conversation_id, role, content, timestamp) VALUES (%s, %s, %s, %s)"
+        batch = []
+        for i in range(total):
+            content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 24)))
+            when = connection.ops.adapt_datetimefield_value(start + step * i)
+            batch.append((rng.choice(conversation_ids), "user" if i % 2 else "ai", content, when))
+            if len(batch) == 20_000 or i == total - 1:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.executemany(sql, batch)
+                batch = []
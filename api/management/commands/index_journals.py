@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services.journal_index import journal_indexer
+from main.models import JournalEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Embed journal entries that have no current embedding, e.g. after deploying the journal "
+        "index or switching JOURNAL_EMBEDDER. Entries that are already current are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=200, help="Entries embedded per batch.")
+
+    def handle(self, *args, **options):
+        embedder = journal_indexer.embedder
+        started = time.perf_counter()
+        seen = embedded = 0
+        last_id = 0
+        while True:
+            batch = list(JournalEntry.objects.filter(id__gt=last_id).order_by('id')[:options["batch"]])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            seen += len(batch)
+            embedded += len(journal_indexer.index(batch))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{embedded:,} of {seen:,} entries embedded with {embedder.name} in {elapsed:.1f}s")
@@ -0,0 +1,109 @@
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Sum
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment,
+)
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.services.conversation_summary import conversation_summaries
+from api.services.counselor_sessions import counselor_sessions
+from api.services.llm_backends import FakeChatModel
+from api.services.llm_resilience import ResilientLLM, llm_metrics
+from api.services.rate_limit import rate_limiter
+from api.services.usage_meter import usage_meter
+from api.views import ChatView
+from main.models import TokenUsage
+
+MESSAGES = [
+    "I had a rough day and I keep thinking about a drink.",
+    "Went to my meeting tonight, it helped.",
+    "I'm worried about the party this weekend.",
+    "Day 30 sober today!",
+]
+
+
+class Command(BaseCommand):
+    help = "Drive ChatView in-process against the fake LLM on a throwaway test database and report our own overhead."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="Chat turns to send.")
+        parser.add_argument("--users", type=int, default=20, help="Distinct users the turns are spread over.")
+        parser.add_argument("--first-token-ms", type=float, default=0.0, help="Mean fake LLM time to first token.")
+        parser.add_argument("--first-token-sigma", type=float, default=0.0, help="Log-normal sigma of the first token time.")
+        parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Mean fake token rate (0 = instant).")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        # A file rather than shared-cache memory: background summary jobs write while requests do
+        workdir = tempfile.mkdtemp(prefix="loadtest-chat-")
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(workdir, "db.sqlite3")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # A few users send every turn back to back, far past any plan's chat limit
+            with override_settings(RATE_LIMITS={}):
+                rate_limiter.invalidate()
+                self.run(options)
+            conversation_summaries.drain()
+            usage_meter.flush()
+        finally:
+            rate_limiter.invalidate()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            os.rmdir(workdir)
+
+    def run(self, options):
+        counselor_sessions.use_llm(ResilientLLM(FakeChatModel(
+            first_token_ms=options["first_token_ms"],
+            first_token_sigma=options["first_token_sigma"],
+            tokens_per_second=options["tokens_per_second"],
+            seed=options["seed"],
+        )))
+        llm_metrics.reset()
+        users = [User.objects.create_user(username=f"loadtest{i}", password="x") for i in range(options["users"])]
+        factory = APIRequestFactory()
+        view = ChatView.as_view()
+
+        latencies, queries = [], []
+        tracemalloc.start()
+        started = time.perf_counter()
+        for i in range(options["requests"]):
+            request = factory.post("/api/chat/", {"content": MESSAGES[i % len(MESSAGES)]}, format="json")
+            force_authenticate(request, user=users[i % len(users)])
+            with CaptureQueriesContext(connection) as captured:
+                t = time.perf_counter()
+                response = view(request)
+                latencies.append(time.perf_counter() - t)
+            if response.status_code != 200:
+                self.stderr.write(f"request {i} failed with {response.status_code}: {response.data}")
+                break
+            queries.append(len(captured))
+        elapsed = time.perf_counter() - started
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        n = len(queries)
+        if not n:
+            return
+        latencies.sort()
+        self.stdout.write(f"{n} turns over {len(users)} users in {elapsed:.2f}s: {n / elapsed:.1f} req/s")
+        self.stdout.write(
+            f"latency p50 {latencies[n // 2] * 1000:.2f} ms  "
+            f"p99 {latencies[min(n - 1, int(n * 0.99))] * 1000:.2f} ms  max {latencies[-1] * 1000:.2f} ms"
+        )
+        self.stdout.write(f"queries per request: mean {statistics.mean(queries):.1f}  max {max(queries)}")
+        self.stdout.write(f"python heap: {current / 1e6:.1f} MB retained, {peak / 1e6:.1f} MB peak")
+        self.stdout.write(f"counselor sessions cached: {len(counselor_sessions)}")
+        llm = llm_metrics.snapshot()
+        self.stdout.write(f"llm calls: {llm['calls']}  error rate {llm['error_rate']:.2%}  breaker {llm['breaker']['state']}")
+        usage_meter.flush()
+        ledger = TokenUsage.objects.aggregate(rows=Count('id'), prompt=Sum('prompt_tokens'), completion=Sum('completion_tokens'))
+        self.stdout.write(f"token ledger: {ledger['rows']} rows, {ledger['prompt'] or 0} prompt + {ledger['completion'] or 0} completion tokens")
@@ -0,0 +1,30 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from api.services.usage_meter import plan_totals, rollup_day
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily per-user token usage rollups from the TokenUsage ledger. "
+        "Run it every few minutes for today, and once after midnight for yesterday."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--day", help="Day to roll up (YYYY-MM-DD); default is today.")
+        parser.add_argument("--days", type=int, default=2, help="Days to roll up, ending with --day.")
+
+    def handle(self, *args, **options):
+        last = parse_date(options["day"]) if options["day"] else timezone.localdate()
+        if last is None:
+            raise CommandError("--day must be YYYY-MM-DD")
+        for offset in range(max(1, options["days"]) - 1, -1, -1):
+            day: date = last - timedelta(days=offset)
+            users = rollup_day(day)
+            self.stdout.write(f"{day}: {users} users")
+            for row in plan_totals(day):
+                self.stdout.write(f"  {row['plan'] or '(no plan)':<24}{row['users']:>7} users{row['calls']:>9} calls"
+                                  f"{row['prompt']:>12} prompt{row['completion']:>12} completion")
@@ -548,7 +548,22 @@ class MessageSerializer(serializers.ModelSerializer):
 class ConversationSerializer(serializers.ModelSerializer):
     # Serialize the related messages using MessageSerializer
     messages = MessageSerializer(many=True, read_only=True)
+    # Now the user FK column; kept a string so the response looks the same as before
+    user_id = serializers.CharField(read_only=True)
 
     class Meta:
         model = Conversation
-        fields = ['user_id', 'started_at', 'last_updated', 'messages'] 
\ No newline at end of file
+        fields = ['user_id', 'started_at', 'last_updated', 'messages']
+
+
+class MessageHistorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Message
+        fields = ['id', 'role', 'content', 'timestamp']
+
+
+class ConversationListSerializer(serializers.ModelSerializer):
+    # Just the conversation, messages are paged in through conversation-messages
+    class Meta:
+        model = Conversation
+        fields = ['id', 'started_at', 'last_updated', 'summary']
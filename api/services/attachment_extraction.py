@@ -0,0 +1,137 @@
+# StepCoachLive/api/services/attachment_extraction.py
+import asyncio
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import extraction_workers
+
+KIND_LABELS = {"image": "Image", "pdf": "PDF"}
+
+
+class AttachmentExtractor:
+    """
+    OCR and PDF text extraction on a process pool, off the request thread.
+
+    Results are cached by content hash, and identical uploads that are still
+    being processed share one job. Inputs are capped by size, page count and
+    pixel count, and the job itself stops after `timeout` seconds of work:
+    tesseract is killed, PDF parsing gives up before the next page. So a
+    pathological upload holds a worker for about `timeout`, not until it is
+    done. The caller stops waiting after `timeout` too, queueing included.
+    """
+    def __init__(self, max_workers: int = 2, timeout: float = 20, max_bytes: int = 10 * 1024 * 1024,
+                 max_pages: int = 20, max_pixels: int = 12_000_000, cache_seconds: int = 24 * 3600):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_pages = max_pages
+        self.max_pixels = max_pixels
+        self.cache_seconds = cache_seconds
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a threaded server process is not safe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def submit(self, kind: str, data: bytes) -> Future:
+        """
+        Starts (or joins) extraction of `data` and returns a future with the text.
+        """
+        key = f"attachment-text:{kind}:{hashlib.sha256(data).hexdigest()}"
+        cached = cache.get(key)
+        if cached is not None:
+            return _done(cached)
+        if len(data) > self.max_bytes:
+            return _failed(ValueError(f"file is larger than {self.max_bytes // (1024 * 1024)} MB"))
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+            try:
+                future = self._start(kind, data)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM on a huge image); replace the pool once
+                self._pool = None
+                future = self._start(kind, data)
+            self._in_flight[key] = future
+
+        def finished(f: Future):
+            with self._lock:
+                self._in_flight.pop(key, None)
+            if not f.cancelled() and f.exception() is None:
+                cache.set(key, f.result(), self.cache_seconds)
+
+        future.add_done_callback(finished)
+        return future
+
+    def _start(self, kind: str, data: bytes) -> Future:
+        if kind == "image":
+            return self._executor().submit(extraction_workers.ocr_image, data, self.max_pixels, self.timeout)
+        return self._executor().submit(extraction_workers.pdf_text, data, self.max_pages, self.timeout)
+
+    def extract(self, kind: str, data: bytes) -> str:
+        return self._wait(kind, self.submit(kind, data))
+
+    def _wait(self, kind: str, future: Future) -> str:
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            return f"Error processing {KIND_LABELS[kind]}: extraction timed out"
+        except Exception as e:
+            return f"Error processing {KIND_LABELS[kind]}: {str(e)}"
+
+    async def aextract(self, kind: str, data: bytes) -> str:
+        try:
+            # shield: a timeout here must not cancel a job other requests may be waiting on
+            future = asyncio.wrap_future(self.submit(kind, data))
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            return f"Error processing {KIND_LABELS[kind]}: extraction timed out"
+        except Exception as e:
+            return f"Error processing {KIND_LABELS[kind]}: {str(e)}"
+
+    def extract_all(self, image_data: bytes = None, pdf_data: bytes = None) -> str:
+        """
+        Extracts every attachment in parallel and formats them like AICounselor.prepare_message.
+        """
+        jobs = [(kind, self.submit(kind, data)) for kind, data in (("image", image_data), ("pdf", pdf_data)) if data]
+        return "".join(f"{KIND_LABELS[kind]} content: {self._wait(kind, future)}\n" for kind, future in jobs)
+
+    async def aextract_all(self, image_data: bytes = None, pdf_data: bytes = None) -> str:
+        jobs = [(kind, data) for kind, data in (("image", image_data), ("pdf", pdf_data)) if data]
+        texts = await asyncio.gather(*(self.aextract(kind, data) for kind, data in jobs))
+        return "".join(f"{KIND_LABELS[kind]} content: {text}\n" for (kind, _), text in zip(jobs, texts))
+
+
+def _done(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _failed(exc: Exception) -> Future:
+    future = Future()
+    future.set_exception(exc)
+    return future
+
+
+attachment_extractor = AttachmentExtractor(
+    max_workers=settings.ATTACHMENT_EXTRACTION_WORKERS,
+    timeout=settings.ATTACHMENT_EXTRACTION_TIMEOUT,
+    max_bytes=settings.ATTACHMENT_MAX_BYTES,
+    max_pages=settings.ATTACHMENT_MAX_PDF_PAGES,
+)
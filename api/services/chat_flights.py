@@ -0,0 +1,128 @@
+# StepCoachLive/api/services/chat_flights.py
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+
+
+class DuplicateTimeout(Exception):
+    """The request this one was attached to did not finish in time."""
+
+
+class _Flight:
+    __slots__ = ("key", "done", "result", "error", "expires")
+
+    def __init__(self, key: str, expires: float):
+        self.key = key
+        self.done = threading.Event()
+        self.result: Optional[dict] = None
+        self.error: Optional[BaseException] = None
+        self.expires = expires
+
+
+class ChatFlights:
+    """
+    Single-flight for chat turns, so a retried or double-tapped request does
+    not call the LLM and save the turn a second time.
+
+    A request is identified by the client's `Idempotency-Key` header, or
+    failing that by a hash of what it sends, scoped to the user. The first
+    request runs the turn ("leader"); an identical request arriving meanwhile
+    waits for the leader and gets the same result. After the leader finishes,
+    the result is replayed for `key_replay_seconds` only when the client sent
+    a key; a request without one can be sent twice on purpose (the same short
+    "yes"), so it shares a turn only while that turn is in flight. Failures
+    are not kept: the waiting duplicates get the error, and the next retry
+    runs again.
+
+    Flights live in process memory, so duplicates that land on different
+    workers are not coalesced.
+    """
+    def __init__(self, key_replay_seconds: float = 600, wait_seconds: float = 120, max_flights: int = 10000):
+        self.key_replay_seconds = key_replay_seconds
+        self.wait_seconds = wait_seconds
+        self.max_flights = max_flights
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def key(self, user_id, idempotency_key: Optional[str], parts: Iterable) -> str:
+        if idempotency_key:
+            return f"{user_id}:key:{idempotency_key[:200]}"
+        digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode()).hexdigest()
+        return f"{user_id}:body:{digest}"
+
+    def begin(self, key: str) -> Tuple[_Flight, bool]:
+        """
+        Returns the flight of `key` and whether the caller leads it. A caller
+        that does not lead must `wait` for it (which returns at once for a
+        replay); a leader must call `finish` or `fail`.
+        """
+        now = time.monotonic()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.expires > now:
+                return flight, False
+            if len(self._flights) >= self.max_flights:
+                self._prune(now)
+            # A leader that never finishes (e.g. a stream nobody read) is replaced after wait_seconds
+            flight = self._flights[key] = _Flight(key, now + self.wait_seconds)
+            return flight, True
+
+    def finish(self, flight: _Flight, result: dict) -> None:
+        flight.result = result
+        if ":key:" in flight.key:
+            flight.expires = time.monotonic() + self.key_replay_seconds
+        else:
+            # Duplicates already waiting hold the flight and still get the result
+            self._forget(flight)
+        flight.done.set()
+
+    def fail(self, flight: _Flight, error: BaseException) -> None:
+        self._forget(flight)
+        flight.error = error
+        flight.done.set()
+
+    def wait(self, flight: _Flight) -> dict:
+        if not flight.done.wait(self.wait_seconds):
+            raise DuplicateTimeout(flight.key)
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def run(self, key: str, turn: Callable[[], dict]) -> Tuple[dict, bool]:
+        """
+        Runs `turn` once per key; returns its result and whether it was shared with another request.
+        """
+        flight, leader = self.begin(key)
+        if not leader:
+            return self.wait(flight), True
+        try:
+            result = turn()
+        except BaseException as e:
+            self.fail(flight, e)
+            raise
+        self.finish(flight, result)
+        return result, False
+
+    def _forget(self, flight: _Flight) -> None:
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def _prune(self, now: float) -> None:
+        for key in [key for key, flight in self._flights.items() if flight.expires <= now]:
+            del self._flights[key]
+        # Still full of live flights: drop the oldest finished ones
+        overflow = len(self._flights) - self.max_flights + 1
+        if overflow > 0:
+            finished = sorted(
+                (flight for flight in self._flights.values() if flight.done.is_set()),
+                key=lambda flight: flight.expires,
+            )
+            for flight in finished[:overflow]:
+                del self._flights[flight.key]
+
+
+chat_flights = ChatFlights(key_replay_seconds=settings.CHAT_IDEMPOTENCY_SECONDS)
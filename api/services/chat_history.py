@@ -0,0 +1,86 @@
+# StepCoachLive/api/services/chat_history.py
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple, Tuple
+
+TOKEN_MODEL = "gpt-4o-mini"
+# Role label, separators and newline around every turn in the prompt
+TURN_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    import tiktoken  # slow to import, and only chat requests count tokens
+
+    try:
+        return tiktoken.encoding_for_model(TOKEN_MODEL)
+    except Exception:
+        # The BPE file is downloaded on first use; fall back to an estimate when offline
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cuts `text` down to at most `max_tokens` tokens.
+    """
+    encoding = _encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def turn_tokens(content: str) -> int:
+    return count_tokens(content) + TURN_OVERHEAD_TOKENS
+
+
+class Turn(NamedTuple):
+    role: str
+    content: str
+    tokens: int
+
+
+class AssembledHistory(NamedTuple):
+    turns: List[Turn]  # oldest first, ready for the prompt
+    tokens: int
+
+
+class HistoryAssembler:
+    """
+    Fills a token budget with the newest chat turns first.
+
+    Rows come newest-first (e.g. Message rows ordered by -timestamp), so the
+    caller can stream them from the database and stop as soon as the budget
+    is full.
+    """
+    def __init__(self, max_tokens: int = 2000):
+        self.max_tokens = max_tokens
+
+    def assemble(self, rows: Iterable[Tuple], reserved_tokens: int = 0) -> AssembledHistory:
+        budget = self.max_tokens - reserved_tokens
+        picked: List[Turn] = []
+        used = 0
+        for row in rows:
+            turn = row if isinstance(row, Turn) else Turn(row[0], row[1], turn_tokens(row[1]))
+            if used + turn.tokens > budget:
+                break
+            picked.append(turn)
+            used += turn.tokens
+        picked.reverse()
+        return AssembledHistory(picked, used)
+
+
+def format_history(turns: Iterable[Turn]) -> str:
+    lines = []
+    for turn in turns:
+        speaker = "User" if turn.role == "user" else "You"
+        lines.append(f"{speaker}: {turn.content}")
+    return "\n".join(lines) or "(no previous messages)"
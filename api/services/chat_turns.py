@@ -0,0 +1,45 @@
+# StepCoachLive/api/services/chat_turns.py
+from typing import List, Optional
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+
+from main.models import Conversation, Message
+
+
+def save_turn(conversation: Conversation, user_content: str, ai_content: Optional[str]) -> List[Message]:
+    """
+    Writes a chat turn once the response is known: both messages in one
+    bulk insert, plus `Conversation.last_updated`, in a single transaction.
+
+    The user message goes first so ids keep the conversation order. An empty
+    `ai_content` (e.g. a stream cut off before its first token) saves only the
+    user message.
+    """
+    messages = [Message(conversation=conversation, role='user', content=user_content)]
+    if ai_content:
+        messages.append(Message(conversation=conversation, role='ai', content=ai_content))
+
+    now = timezone.now()
+    with transaction.atomic():
+        created = Message.objects.bulk_create(messages)
+        # update() skips auto_now, so set it explicitly
+        Conversation.objects.filter(id=conversation.id).update(last_updated=now)
+    conversation.last_updated = now
+    return created
+
+
+def save_reply(conversation: Conversation, content: str) -> Message:
+    """
+    Writes an AI message sent outside a turn (e.g. a crisis follow-up), bumping
+    `Conversation.last_updated` like `save_turn`.
+    """
+    with transaction.atomic():
+        message = Message.objects.create(conversation=conversation, role='ai', content=content)
+        Conversation.objects.filter(id=conversation.id).update(last_updated=message.timestamp)
+    conversation.last_updated = message.timestamp
+    return message
+
+
+asave_turn = sync_to_async(save_turn)
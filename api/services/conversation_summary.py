@@ -0,0 +1,122 @@
+# StepCoachLive/api/services/conversation_summary.py
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from main.models import Conversation, Message
+from .chat_history import count_tokens, truncate_tokens
+from .counselor_sessions import counselor_sessions
+from .usage_meter import usage_meter
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "You keep short notes for an addiction recovery coach about one user.\n\n"
+    "Current notes:\n{summary}\n\n"
+    "New messages:\n{messages}\n\n"
+    "Rewrite the notes to include anything important from the new messages: "
+    "substance, triggers, goals, progress, setbacks, people and plans. "
+    "Keep it under 200 words, plain sentences, no greeting."
+)
+
+
+class ConversationSummarizer:
+    """
+    Folds the oldest unsummarized messages of a conversation into Conversation.summary.
+
+    Every `every_turns` chat turns a job runs on a background thread. The newest
+    `keep_messages` messages are left alone so the prompt still has them verbatim.
+    """
+    def __init__(self, every_turns: int = 10, keep_messages: int = 20, max_batch: int = 200, max_input_tokens: int = 6000):
+        self.every_turns = every_turns
+        self.keep_messages = keep_messages
+        self.max_batch = max_batch
+        self.max_input_tokens = max_input_tokens
+        self._turns: Dict[int, int] = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+
+    def record_turn(self, conversation_id: int) -> None:
+        """
+        Called after a chat turn is saved; schedules a summary every N turns.
+        """
+        with self._lock:
+            turns = self._turns.get(conversation_id, 0) + 1
+            if turns < self.every_turns or conversation_id in self._running:
+                self._turns[conversation_id] = turns
+                return
+            self._turns[conversation_id] = 0
+            self._running.add(conversation_id)
+        self._executor.submit(self._run, conversation_id)
+
+    def drain(self) -> None:
+        """
+        Blocks until every summary queued so far has run (load tests, shutdown).
+        """
+        self._executor.submit(lambda: None).result()
+
+    def _run(self, conversation_id: int) -> None:
+        try:
+            self.summarize(conversation_id)
+        except Exception:
+            logger.exception("Summarizing conversation %s failed", conversation_id)
+        finally:
+            with self._lock:
+                self._running.discard(conversation_id)
+            close_old_connections()
+
+    def summarize(self, conversation_id: int) -> bool:
+        conversation = Conversation.objects.get(id=conversation_id)
+        pending = Message.objects.filter(
+            conversation_id=conversation_id, id__gt=conversation.summary_last_message_id
+        ).order_by("id")
+
+        fold_count = min(pending.count() - self.keep_messages, self.max_batch)
+        if fold_count < 2:
+            return False
+
+        rows = list(pending.values_list("id", "role", "content")[:fold_count])
+        transcript = "\n".join(
+            f"{'User' if role == 'user' else 'Coach'}: {content}" for _, role, content in rows
+        )
+        prompt = SUMMARY_PROMPT.format(
+            summary=conversation.summary or "(none yet)",
+            messages=truncate_tokens(transcript, self.max_input_tokens),
+        )
+        llm = counselor_sessions.shared_llm()
+        started = time.monotonic()
+        reply = llm.invoke(prompt)
+        summary = reply.content.strip()
+        usage = reply.usage_metadata or {}
+        estimated = "input_tokens" not in usage
+        usage_meter.record(
+            conversation.user_id,
+            kind="summary",
+            model=getattr(llm, "model_name", None) or type(llm).__name__,
+            prompt_tokens=count_tokens(prompt) if estimated else usage["input_tokens"],
+            completion_tokens=count_tokens(summary) if estimated else usage.get("output_tokens", 0),
+            latency_ms=int((time.monotonic() - started) * 1000),
+            estimated=estimated,
+        )
+
+        # Only write if nobody else moved the summary forward in the meantime
+        updated = Conversation.objects.filter(
+            id=conversation_id, summary_last_message_id=conversation.summary_last_message_id
+        ).update(summary=summary, summary_last_message_id=rows[-1][0])
+
+        if updated:
+            # The cached session still holds the folded turns; reload it with the new summary
+            counselor_sessions.evict(conversation.user_id)
+        return bool(updated)
+
+
+conversation_summaries = ConversationSummarizer(
+    every_turns=settings.CONVERSATION_SUMMARY_EVERY_TURNS,
+    keep_messages=settings.CONVERSATION_SUMMARY_KEEP_MESSAGES,
+)
@@ -0,0 +1,139 @@
+# StepCoachLive/api/services/counselor_sessions.py
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import TYPE_CHECKING, Optional
+
+from django.conf import settings
+
+from main.models import Conversation, Message
+from .usage_meter import usage_meter
+
+if TYPE_CHECKING:
+    from api.ai import AICounselor
+
+
+class _Session:
+    __slots__ = ("counselor", "last_used")
+
+    def __init__(self, counselor: "AICounselor"):
+        self.counselor = counselor
+        self.last_used = time.monotonic()
+
+
+class CounselorSessionStore:
+    """
+    Per-user AICounselor instances kept in a bounded LRU.
+
+    Each user gets their own history window and profile. History is rebuilt lazily
+    from the Message table on first use, and only the stateless ChatOpenAI client
+    is shared between sessions. api.ai (LangChain, OpenAI) is imported with the
+    first session, not when the store is, so workers and commands boot fast.
+    """
+    def __init__(self, max_sessions: int = 1000, idle_timeout: float = 1800, history_tokens: int = 2000):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.history_tokens = history_tokens
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._llm = None
+
+    def shared_llm(self):
+        with self._lock:
+            if self._llm is None:
+                from api.ai import build_llm
+                self._llm = build_llm()
+            return self._llm
+
+    def use_llm(self, llm) -> None:
+        """
+        Swaps the shared chat model (e.g. for a load test) and drops cached sessions built on the old one.
+        """
+        with self._lock:
+            self._llm = llm
+            self._sessions.clear()
+
+    def get(self, user_id) -> "AICounselor":
+        key = str(user_id)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(key)
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end(key)
+                return session.counselor
+
+        # Build outside the lock so a slow history load does not block other users
+        from api.ai import AICounselor
+        counselor = AICounselor(llm=self.shared_llm(), history_tokens=self.history_tokens)
+        counselor.on_usage = partial(usage_meter.record, key)
+        self._hydrate(counselor, key)
+
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = _Session(counselor)
+                self._sessions[key] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            session.last_used = now
+            self._sessions.move_to_end(key)
+            return session.counselor
+
+    def peek(self, user_id) -> Optional["AICounselor"]:
+        """
+        The user's cached counselor, if any, without building one or touching the LRU order.
+        """
+        with self._lock:
+            session = self._sessions.get(str(user_id))
+            return session.counselor if session is not None else None
+
+    def evict(self, user_id) -> None:
+        with self._lock:
+            self._sessions.pop(str(user_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict_idle(self, now: float) -> None:
+        # Sessions are in LRU order, so the oldest idle ones are at the front
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if now - session.last_used < self.idle_timeout:
+                break
+            self._sessions.popitem(last=False)
+
+    def _hydrate(self, counselor: "AICounselor", user_key: str) -> None:
+        from .journal_index import journal_indexer
+        counselor.journal = journal_indexer.load(user_key)
+
+        conversation = latest_conversation(user_key)
+        if conversation is None:
+            return
+
+        # Only messages newer than the rolling summary, newest first and streamed in chunks
+        # so the assembler stops reading once the budget is full
+        rows = (
+            Message.objects.filter(conversation=conversation, id__gt=conversation.summary_last_message_id)
+            .order_by("-timestamp", "-id")
+            .values_list("role", "content")
+            .iterator(chunk_size=50)
+        )
+        counselor.load_history(rows, summary=conversation.summary)
+
+
+def latest_conversation(user_key: str) -> Optional[Conversation]:
+    return Conversation.objects.filter(user_id=user_key).order_by("-last_updated").first()
+
+
+counselor_sessions = CounselorSessionStore(
+    max_sessions=settings.COUNSELOR_SESSION_MAX,
+    idle_timeout=settings.COUNSELOR_SESSION_IDLE_SECONDS,
+    history_tokens=settings.COUNSELOR_HISTORY_TOKENS,
+)
@@ -0,0 +1,50 @@
+# StepCoachLive/api/services/crisis.py
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from django.db import close_old_connections
+
+from main.models import Conversation, CrisisEvent
+from .chat_turns import save_reply
+
+logger = logging.getLogger(__name__)
+
+
+class CrisisFollowUps:
+    """
+    Records crisis events and runs the LLM follow-up off the request thread.
+
+    The user already has the vetted crisis response by the time this runs, so
+    a slow or failing LLM only delays (or drops) the follow-up message. The
+    follow-up holds the counselor's lock like a chat turn, so it starts once
+    the turn that raised it is saved and the user's next turn waits for it.
+    """
+    def __init__(self, max_workers: int = 2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crisis")
+
+    def handle(self, counselor, user, conversation: Optional[Conversation], user_message: str, response: str) -> CrisisEvent:
+        logger.warning("Crisis message from user %s, sent the vetted crisis response", user.id)
+        event = CrisisEvent.objects.create(
+            user=user,
+            conversation=conversation,
+            message=user_message,
+            response=response,
+        )
+        self._executor.submit(self._follow_up, counselor, event.id, conversation, counselor.last_message)
+        return event
+
+    def _follow_up(self, counselor, event_id: int, conversation: Optional[Conversation], full_message: str) -> None:
+        try:
+            with counselor.lock:
+                follow_up = counselor.crisis_follow_up(full_message)
+                if conversation is not None:
+                    save_reply(conversation, follow_up)
+            CrisisEvent.objects.filter(id=event_id).update(follow_up=follow_up)
+        except Exception:
+            logger.exception("Crisis follow-up for event %s failed", event_id)
+        finally:
+            close_old_connections()
+
+
+crisis_follow_ups = CrisisFollowUps()
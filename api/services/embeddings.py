@@ -0,0 +1,80 @@
+# StepCoachLive/api/services/embeddings.py
+# Text embedders for the journal index. Every embedder returns L2-normalized
+# float32 rows, so a dot product is the cosine similarity.
+import hashlib
+import re
+from functools import lru_cache
+from typing import List, Sequence
+
+import numpy as np
+
+WORD = re.compile(r"[a-z0-9']+")
+
+STOP_WORDS = frozenset(
+    "a an and are as at be been but by for from had has have he her him his i i'm im in is it its "
+    "me my of on or our she so that the their them then there they this to too was we were what "
+    "when which who with you your".split()
+)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+class HashingEmbedder:
+    """
+    Local, deterministic embedder: signed feature hashing of word unigrams and
+    bigrams with sublinear term frequency. No model download and no network,
+    and the same text always gets the same vector, so it suits tests, offline
+    runs and small installs. It matches shared words, not meaning.
+    """
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = [self._stem(word) for word in WORD.findall(text.lower()) if word not in STOP_WORDS]
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                bucket, sign = _bucket(feature, self.dim)
+                vectors[row, bucket] += sign
+        return normalize(np.sign(vectors) * np.log1p(np.abs(vectors)))
+
+    @staticmethod
+    def _stem(word: str) -> str:
+        # Enough to put "cravings", "craving" and "craved" in one bucket
+        for suffix in ("ings", "ing", "ed", "es", "s"):
+            if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+                return word[:-len(suffix)]
+        return word
+
+
+@lru_cache(maxsize=100_000)
+def _bucket(feature: str, dim: int):
+    # Journals reuse a small vocabulary, so most features are hashed once per process
+    digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+    return digest % dim, (1.0 if digest >> 63 else -1.0)
+
+
+class OpenAIEmbedder:
+    """
+    OpenAI embeddings API (text-embedding-3-small by default). Better matches
+    by meaning, at the cost of a network call per journal save and per chat
+    message.
+    """
+    def __init__(self, model: str = "text-embedding-3-small", dim: int = 1536):
+        self.model = model
+        self.dim = dim
+        self.name = f"openai-{model}-{dim}"
+        self._client = None
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if self._client is None:
+            import openai
+            self._client = openai.OpenAI()
+        response = self._client.embeddings.create(model=self.model, input=list(texts), dimensions=self.dim)
+        rows: List[List[float]] = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        return normalize(np.asarray(rows, dtype=np.float32).reshape(len(texts), self.dim))
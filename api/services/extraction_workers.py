@@ -0,0 +1,36 @@
+# StepCoachLive/api/services/extraction_workers.py
+# Runs inside the extraction process pool, so keep this module free of Django imports.
+import io
+import time
+
+
+def ocr_image(image_data: bytes, max_pixels: int, timeout: float) -> str:
+    import pytesseract
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_data))
+    if image.width * image.height > max_pixels:
+        # OCR time grows with pixel count; shrink huge photos first
+        scale = (max_pixels / (image.width * image.height)) ** 0.5
+        image.thumbnail((int(image.width * scale), int(image.height * scale)))
+    try:
+        # Kills the tesseract process past the timeout, which frees this worker
+        return pytesseract.image_to_string(image, timeout=timeout).strip()
+    except RuntimeError as e:
+        if "timeout" in str(e).lower():
+            raise TimeoutError("extraction timed out") from e
+        raise
+
+
+def pdf_text(pdf_data: bytes, max_pages: int, timeout: float) -> str:
+    import PyPDF2
+
+    deadline = time.monotonic() + timeout
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf_data))
+    text = ""
+    for page in reader.pages[:max_pages]:
+        # Checked between pages, so the worker is held at most one page past the timeout
+        if time.monotonic() > deadline:
+            raise TimeoutError("extraction timed out")
+        text += (page.extract_text() or "") + "\n"
+    return text.strip()
@@ -0,0 +1,203 @@
+# StepCoachLive/api/services/journal_index.py
+import hashlib
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+from django.conf import settings
+from django.db.models.functions import Substr
+from django.utils.module_loading import import_string
+
+from main.models import JournalEmbedding, JournalEntry
+from .chat_history import truncate_tokens
+from .counselor_sessions import counselor_sessions
+from .embeddings import HashingEmbedder
+
+# Start of an entry that gets embedded, and the part kept in memory for prompts
+EMBED_CHARS = 4000
+SNIPPET_CHARS = 600
+
+
+class JournalHit(NamedTuple):
+    entry_id: int
+    score: float
+    snippet: str
+
+
+class _Snapshot(NamedTuple):
+    # Row i of `matrix` is the vector of entry ids[i]; never modified once published
+    ids: np.ndarray
+    matrix: np.ndarray
+    snippets: Dict[int, str]
+
+
+class UserJournalIndex:
+    """
+    One user's journal vectors as a single float32 matrix; a search is one
+    matrix-vector product and a partial sort. It lives on the user's counselor
+    session (counselor.journal), and journal saves and deletes update it in
+    place, so chat requests never touch the database for it.
+
+    Writers build a new snapshot of ids, matrix and snippets under the lock
+    and publish it in one assignment; a search reads the snapshot once, so it
+    never sees the parts of two different versions, and never waits.
+    """
+    def __init__(self, embedder, top_k: int = 3, min_score: float = 0.2, max_tokens: int = 300):
+        self.embedder = embedder
+        self.top_k = top_k
+        self.min_score = min_score
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._snapshot = _Snapshot(np.zeros(0, dtype=np.int64), np.zeros((0, embedder.dim), dtype=np.float32), {})
+
+    def __len__(self) -> int:
+        return len(self._snapshot.ids)
+
+    def upsert(self, entry_id: int, vector: np.ndarray, snippet: str) -> None:
+        with self._lock:
+            ids, matrix, snippets = self._snapshot
+            found = np.flatnonzero(ids == entry_id)
+            if found.size:
+                matrix = matrix.copy()
+                matrix[found[0]] = vector
+            else:
+                ids = np.append(ids, entry_id)
+                matrix = np.vstack([matrix, vector[np.newaxis, :]])
+            self._snapshot = _Snapshot(ids, matrix, {**snippets, entry_id: snippet})
+
+    def remove(self, entry_id: int) -> None:
+        with self._lock:
+            ids, matrix, snippets = self._snapshot
+            keep = ids != entry_id
+            self._snapshot = _Snapshot(
+                ids[keep], matrix[keep], {key: value for key, value in snippets.items() if key != entry_id},
+            )
+
+    def search(self, text: str, k: Optional[int] = None) -> List[JournalHit]:
+        ids, matrix, snippets = self._snapshot
+        if not len(ids) or not text.strip():
+            return []
+        k = min(k or self.top_k, len(ids))
+        scores = matrix @ self.embedder.embed([text])[0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            JournalHit(int(ids[i]), float(scores[i]), snippets.get(int(ids[i]), ""))
+            for i in top if scores[i] >= self.min_score
+        ]
+
+    def context(self, text: str) -> str:
+        """
+        The most relevant entries as prompt lines, `max_tokens` in total at most.
+        """
+        hits = self.search(text)
+        if not hits:
+            return ""
+        share = max(1, self.max_tokens // len(hits))
+        return "\n".join(f"- {truncate_tokens(hit.snippet, share)}" for hit in hits)
+
+
+class JournalIndexer:
+    """
+    Keeps JournalEmbedding rows current and builds UserJournalIndex objects.
+
+    The embedder comes from JOURNAL_EMBEDDER (a dotted path to a class with a
+    `name`, a `dim` and an `embed(texts)` method), or is the local
+    HashingEmbedder when it is empty. Entries are only embedded again when
+    their text or the embedder changed.
+    """
+    def __init__(self, embedder=None, top_k: int = 3, min_score: float = 0.2, max_tokens: int = 300, max_entries: int = 500):
+        self._embedder = embedder
+        self.top_k = top_k
+        self.min_score = min_score
+        self.max_tokens = max_tokens
+        self.max_entries = max_entries
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            path = getattr(settings, "JOURNAL_EMBEDDER", "")
+            self._embedder = import_string(path)() if path else HashingEmbedder()
+        return self._embedder
+
+    def load(self, user_id) -> UserJournalIndex:
+        """
+        The user's newest `max_entries` entries; any without a current embedding are embedded first.
+        """
+        index = UserJournalIndex(self.embedder, self.top_k, self.min_score, self.max_tokens)
+        rows = list(
+            JournalEntry.objects.filter(user_id=user_id)
+            .order_by('-created_at')
+            .annotate(snippet=Substr('content', 1, SNIPPET_CHARS))
+            .values_list('id', 'title', 'created_at', 'snippet', 'embedding__embedder', 'embedding__vector')
+            [:self.max_entries]
+        )
+        stale = [row[0] for row in rows if row[4] != self.embedder.name]
+        fresh = self.index(JournalEntry.objects.filter(id__in=stale)) if stale else {}
+        for entry_id, title, created_at, snippet, _, vector in reversed(rows):
+            vector = fresh[entry_id] if entry_id in fresh else np.frombuffer(vector, dtype="<f4")
+            index.upsert(entry_id, vector, entry_snippet(title, created_at, snippet))
+        return index
+
+    def index(self, entries: Iterable[JournalEntry]) -> Dict[int, np.ndarray]:
+        """
+        Embeds the entries whose text changed since they were last embedded and
+        stores the vectors. Returns the new vectors by entry id.
+        """
+        entries = list(entries)
+        texts = {entry.id: f"{entry.title}\n{entry.content[:EMBED_CHARS]}" for entry in entries}
+        digests = {
+            entry_id: hashlib.sha1(f"{self.embedder.name}\n{text}".encode()).hexdigest()
+            for entry_id, text in texts.items()
+        }
+        current = dict(JournalEmbedding.objects.filter(entry_id__in=texts).values_list('entry_id', 'digest'))
+        todo = [entry for entry in entries if current.get(entry.id) != digests[entry.id]]
+        if not todo:
+            return {}
+
+        vectors = self.embedder.embed([texts[entry.id] for entry in todo])
+        JournalEmbedding.objects.bulk_create(
+            [
+                JournalEmbedding(
+                    entry_id=entry.id,
+                    user_id=entry.user_id,
+                    embedder=self.embedder.name,
+                    digest=digests[entry.id],
+                    vector=vector.astype("<f4").tobytes(),
+                )
+                for entry, vector in zip(todo, vectors)
+            ],
+            update_conflicts=True,
+            unique_fields=['entry'],
+            update_fields=['user', 'embedder', 'digest', 'vector', 'updated_at'],
+        )
+        return {entry.id: vector for entry, vector in zip(todo, vectors)}
+
+    def entry_saved(self, entry: JournalEntry) -> None:
+        vector = self.index([entry]).get(entry.id)
+        journal = self._live_index(entry.user_id)
+        if vector is not None and journal is not None:
+            journal.upsert(entry.id, vector, entry_snippet(entry.title, entry.created_at, entry.content[:SNIPPET_CHARS]))
+
+    def entry_deleted(self, entry: JournalEntry) -> None:
+        # The embedding row goes with the entry (on_delete=CASCADE)
+        journal = self._live_index(entry.user_id)
+        if journal is not None:
+            journal.remove(entry.id)
+
+    @staticmethod
+    def _live_index(user_id) -> Optional[UserJournalIndex]:
+        counselor = counselor_sessions.peek(user_id)
+        return getattr(counselor, "journal", None)
+
+
+def entry_snippet(title: str, created_at, text: str) -> str:
+    return f"{created_at:%b %d, %Y} \"{title}\": {' '.join(text.split())}"
+
+
+journal_indexer = JournalIndexer(
+    top_k=settings.JOURNAL_CONTEXT_ENTRIES,
+    min_score=settings.JOURNAL_MIN_SCORE,
+    max_tokens=settings.JOURNAL_CONTEXT_TOKENS,
+    max_entries=settings.JOURNAL_INDEX_MAX_ENTRIES,
+)
@@ -0,0 +1,120 @@
+# StepCoachLive/api/services/llm_backends.py
+# Chat model backends the counselor can run on.
+import asyncio
+import hashlib
+import math
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Iterator, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+FAKE_REPLIES = [
+    "That sounds like a lot to carry today, and I'm proud of you for saying it out loud. What's one small thing that would help you get through the next hour?",
+    "Cravings come in waves and this one will pass too, you've ridden them out before. Want to try ten slow breaths with me right now?",
+    "Nice work showing up for yourself today, that really counts. How are you planning to celebrate the win?",
+    "It makes sense you feel frustrated, recovery isn't a straight line. What usually helps you cool down when it gets like this?",
+    "Thanks for checking in, I'm glad you're here. How has your sleep been the last few nights?",
+]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic local stand-in for ChatOpenAI, for load tests and offline runs.
+
+    The reply is picked from FAKE_REPLIES by a hash of the prompt, so the same
+    prompt always gets the same text. Time to first token and the token rate
+    are drawn from log-normal distributions (sigma 0 means a fixed value) using
+    a seeded RNG, so a run is reproducible. Usage metadata is filled in like
+    the OpenAI backend does, counting one token per word.
+    """
+    first_token_ms: float = 0.0
+    first_token_sigma: float = 0.0
+    tokens_per_second: float = 0.0  # 0 streams everything at once
+    tokens_per_second_sigma: float = 0.0
+    max_tokens: int = 60
+    seed: int = 0
+
+    _rng: random.Random = PrivateAttr()
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-counselor"
+
+    # timing
+    def _draw(self, mean: float, sigma: float) -> float:
+        if mean <= 0 or sigma <= 0:
+            return max(mean, 0.0)
+        # Log-normal with the requested mean: long right tail like real provider latency
+        return mean * math.exp(self._rng.gauss(0.0, sigma) - sigma * sigma / 2)
+
+    def _timing(self):
+        first_token = self._draw(self.first_token_ms, self.first_token_sigma) / 1000
+        rate = self._draw(self.tokens_per_second, self.tokens_per_second_sigma)
+        per_token = 1 / rate if rate > 0 else 0.0
+        return first_token, per_token
+
+    # content
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        prompt = "\n".join(str(m.content) for m in messages)
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        words = FAKE_REPLIES[digest[0] % len(FAKE_REPLIES)].split(" ")[:self.max_tokens]
+        return [word if i == len(words) - 1 else word + " " for i, word in enumerate(words)]
+
+    def _message(self, messages: List[BaseMessage], tokens: List[str]) -> AIMessage:
+        input_tokens = sum(len(str(m.content).split()) for m in messages)
+        return AIMessage(
+            content="".join(tokens),
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": len(tokens),
+                "total_tokens": input_tokens + len(tokens),
+            },
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = self._tokens(messages)
+        first_token, per_token = self._timing()
+        time.sleep(first_token + per_token * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, tokens))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        tokens = self._tokens(messages)
+        first_token, per_token = self._timing()
+        await asyncio.sleep(first_token + per_token * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, tokens))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        tokens = self._tokens(messages)
+        first_token, per_token = self._timing()
+        time.sleep(first_token)
+        for token in tokens:
+            if per_token:
+                time.sleep(per_token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        tokens = self._tokens(messages)
+        first_token, per_token = self._timing()
+        await asyncio.sleep(first_token)
+        for token in tokens:
+            if per_token:
+                await asyncio.sleep(per_token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def fake_from_env() -> FakeChatModel:
+    return FakeChatModel(
+        first_token_ms=float(os.getenv("FAKE_LLM_FIRST_TOKEN_MS", "0")),
+        first_token_sigma=float(os.getenv("FAKE_LLM_FIRST_TOKEN_SIGMA", "0")),
+        tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "0")),
+        tokens_per_second_sigma=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND_SIGMA", "0")),
+        seed=int(os.getenv("FAKE_LLM_SEED", "0")),
+    )
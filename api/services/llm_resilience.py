@@ -0,0 +1,344 @@
+# StepCoachLive/api/services/llm_resilience.py
+# Deadlines, retries and a circuit breaker around the chat model.
+import asyncio
+import random
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, Optional
+
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+
+@lru_cache(maxsize=1)
+def transient_errors() -> tuple:
+    """
+    Provider trouble worth retrying and counting against the breaker. Bad requests
+    and auth errors mean the provider is up: they fail at once and are not retried.
+    openai takes a few hundred ms to import, so it is only loaded once a call fails.
+    """
+    import openai
+
+    return (
+        TimeoutError,
+        asyncio.TimeoutError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+    )
+
+
+@lru_cache(maxsize=1)
+def timeout_errors() -> tuple:
+    import openai
+
+    return TimeoutError, asyncio.TimeoutError, openai.APITimeoutError
+
+
+class CircuitOpenError(Exception):
+    """The breaker is open; the provider is not called at all."""
+
+
+class LLMMetrics:
+    """
+    In-process counters for LLM calls: outcomes, retries, a latency histogram
+    and the breaker state. `snapshot()` returns them as a plain dict.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._outcomes: Dict[str, int] = {"ok": 0, "timeout": 0, "error": 0, "rejected": 0, "circuit_open": 0}
+            self._retries = 0
+            self._latency_counts = [0] * (len(self.buckets) + 1)
+            self._latency_sum = 0.0
+            self._breaker_state = "closed"
+            self._breaker_opened = 0
+
+    def record_call(self, outcome: str, seconds: float = None) -> None:
+        with self._lock:
+            self._outcomes[outcome] += 1
+            if seconds is not None:
+                self._latency_counts[bisect_left(self.buckets, seconds)] += 1
+                self._latency_sum += seconds
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self._retries += 1
+
+    def record_state(self, state: str) -> None:
+        with self._lock:
+            if state == "open" and self._breaker_state != "open":
+                self._breaker_opened += 1
+            self._breaker_state = state
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            calls = sum(self._outcomes.values())
+            timed = sum(self._latency_counts)
+            failed = calls - self._outcomes["ok"]
+            return {
+                "calls": calls,
+                "outcomes": dict(self._outcomes),
+                "error_rate": round(failed / calls, 4) if calls else 0.0,
+                "retries": self._retries,
+                "latency": {
+                    "count": timed,
+                    "mean_seconds": round(self._latency_sum / timed, 4) if timed else 0.0,
+                    "buckets": {
+                        **{f"le_{bound}": count for bound, count in zip(self.buckets, self._latency_counts)},
+                        "inf": self._latency_counts[-1],
+                    },
+                },
+                "breaker": {"state": self._breaker_state, "times_opened": self._breaker_opened},
+            }
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures and rejects
+    calls for `reset_timeout` seconds. After that a single trial call is let
+    through (half open): success closes the breaker, failure opens it again.
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30, metrics: LLMMetrics = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.metrics = metrics
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def _set_state(self, state: str) -> None:
+        self._state = state
+        if self.metrics is not None:
+            self.metrics.record_state(state)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == "closed":
+                return True
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._set_state("half_open")
+            # A trial abandoned without a verdict (e.g. a cancelled request) must not wedge the breaker
+            now = time.monotonic()
+            if self._state == "half_open" and (self._trial_started is None or now - self._trial_started >= self.reset_timeout):
+                self._trial_started = now
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._trial_started = None
+            if self._state != "closed":
+                self._set_state("closed")
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_started = None
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state("open")
+
+
+class ResilientLLM:
+    """
+    Wraps a chat model with per-attempt timeouts, an overall deadline, bounded
+    retries with full jitter and a circuit breaker. It exposes the same
+    invoke/ainvoke/stream/astream calls the counselor uses.
+
+    Async calls are cut off with `asyncio.wait_for`. A blocking call cannot be
+    interrupted from outside, so the sync path relies on the client's own
+    timeout; build the model with `timeout=` set and its retries turned off.
+    Streams are only retried when nothing was yielded yet; their latency is the
+    time to the first chunk, and an async stream also fails if the gap between
+    chunks exceeds `timeout` seconds.
+    """
+    def __init__(self, llm, timeout: float = 20, deadline: float = 45, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 4, breaker: CircuitBreaker = None,
+                 metrics: LLMMetrics = None, rng: random.Random = None):
+        self.llm = llm
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics = metrics or llm_metrics
+        self.breaker = breaker or CircuitBreaker(metrics=self.metrics)
+        self._rng = rng or random.Random()
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.llm, "model_name", None) or getattr(self.llm, "_llm_type", type(self.llm).__name__)
+
+    # bookkeeping shared by every call style
+    def _admit(self, last_error: Exception = None) -> float:
+        """
+        Starts an attempt if the breaker allows it. A retry refused by the
+        breaker (often opened by this call's own failures) re-raises the error
+        of the previous attempt, which is what the caller needs to see.
+        """
+        if not self.breaker.allow():
+            if last_error is not None:
+                raise last_error
+            self.metrics.record_call("circuit_open")
+            raise CircuitOpenError("LLM provider circuit is open, failing fast")
+        return time.monotonic()
+
+    def _succeeded(self, started: float) -> None:
+        self.breaker.record_success()
+        self.metrics.record_call("ok", time.monotonic() - started)
+
+    def _failed(self, exc: Exception, started: float) -> bool:
+        """
+        Records a failed attempt and returns True if it is worth retrying.
+        """
+        elapsed = time.monotonic() - started
+        if not isinstance(exc, transient_errors()):
+            # The provider answered, it just refused this request
+            self.breaker.record_success()
+            self.metrics.record_call("rejected", elapsed)
+            return False
+        timed_out = isinstance(exc, timeout_errors())
+        self.metrics.record_call("timeout" if timed_out else "error", elapsed)
+        self.breaker.record_failure()
+        return True
+
+    def _broke_off(self, exc: Exception) -> None:
+        """
+        A stream failed after its first chunk; the call already counted as ok.
+        """
+        if isinstance(exc, transient_errors()):
+            self.breaker.record_failure()
+
+    def _backoff(self, attempt: int, started_all: float) -> Optional[float]:
+        """
+        Full-jitter delay before retry `attempt`, or None if no retry is left.
+        """
+        if attempt > self.max_retries:
+            return None
+        delay = self._rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        remaining = self.deadline - (time.monotonic() - started_all)
+        # A retry needs room for the backoff plus a reasonable share of an attempt
+        if remaining <= delay + min(self.timeout, 1.0):
+            return None
+        self.metrics.record_retry()
+        return delay
+
+    def _attempt_timeout(self, started_all: float) -> float:
+        return max(0.0, min(self.timeout, self.deadline - (time.monotonic() - started_all)))
+
+    # call styles
+    def invoke(self, prompt, **kwargs):
+        started_all = time.monotonic()
+        attempt, last_error = 0, None
+        while True:
+            attempt += 1
+            started = self._admit(last_error)
+            try:
+                result = self.llm.invoke(prompt, **kwargs)
+            except Exception as exc:
+                delay = self._backoff(attempt, started_all) if self._failed(exc, started) else None
+                if delay is None:
+                    raise
+                last_error = exc
+                time.sleep(delay)
+                continue
+            self._succeeded(started)
+            return result
+
+    async def ainvoke(self, prompt, **kwargs):
+        started_all = time.monotonic()
+        attempt, last_error = 0, None
+        while True:
+            attempt += 1
+            started = self._admit(last_error)
+            try:
+                result = await asyncio.wait_for(self.llm.ainvoke(prompt, **kwargs), self._attempt_timeout(started_all))
+            except Exception as exc:
+                delay = self._backoff(attempt, started_all) if self._failed(exc, started) else None
+                if delay is None:
+                    raise
+                last_error = exc
+                await asyncio.sleep(delay)
+                continue
+            self._succeeded(started)
+            return result
+
+    def stream(self, prompt, **kwargs):
+        started_all = time.monotonic()
+        attempt, last_error = 0, None
+        while True:
+            attempt += 1
+            started = self._admit(last_error)
+            yielded = False
+            try:
+                for chunk in self.llm.stream(prompt, **kwargs):
+                    if not yielded:
+                        yielded = True
+                        self._succeeded(started)
+                    yield chunk
+            except Exception as exc:
+                if yielded:
+                    self._broke_off(exc)
+                    raise
+                delay = self._backoff(attempt, started_all) if self._failed(exc, started) else None
+                if delay is None:
+                    raise
+                last_error = exc
+                time.sleep(delay)
+                continue
+            if not yielded:
+                self._succeeded(started)
+            return
+
+    async def astream(self, prompt, **kwargs):
+        started_all = time.monotonic()
+        attempt, last_error = 0, None
+        while True:
+            attempt += 1
+            started = self._admit(last_error)
+            yielded = False
+            chunks = self.llm.astream(prompt, **kwargs).__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    if not yielded:
+                        yielded = True
+                        self._succeeded(started)
+                    yield chunk
+            except Exception as exc:
+                if yielded:
+                    self._broke_off(exc)
+                    raise
+                delay = self._backoff(attempt, started_all) if self._failed(exc, started) else None
+                if delay is None:
+                    raise
+                last_error = exc
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                await chunks.aclose()
+            if not yielded:
+                self._succeeded(started)
+            return
+
+
+# One set of counters per process, shared by every ResilientLLM
+llm_metrics = LLMMetrics()
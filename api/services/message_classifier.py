@@ -0,0 +1,72 @@
+# StepCoachLive/api/services/message_classifier.py
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Pattern, Tuple
+
+RULES_FILE = Path(__file__).resolve().parent.parent / "data" / "message_rules.json"
+
+# Each dimension that is decided by keyword rules; earlier rules win
+DIMENSIONS = ("emotional_state", "urgency")
+
+
+class MessageClassifier:
+    """
+    Classifies emotional state, support needed and urgency from the keyword
+    rules table. Keywords match as substrings, case-insensitively, and
+    earlier rules win: each dimension is checked the way the rules read, one
+    `in` scan per keyword in priority order, stopping at the first rule that
+    matches.
+
+    A rule with `"whole_words": true` matches its keywords only between word
+    boundaries instead, so "end it" is not found in "spend it". The crisis
+    rule needs this, since a match there replaces the counselor's reply.
+    """
+    def __init__(self, rules: dict):
+        self.rules = rules
+        # dimension -> [(label, keywords, whole-word pattern or None)] in priority order
+        self._rules: Dict[str, List[Tuple[str, Tuple[str, ...], Optional[Pattern]]]] = {
+            dimension: [self._compile(rule) for rule in rules[dimension]["rules"]]
+            for dimension in DIMENSIONS
+        }
+        self._defaults = {dimension: rules[dimension]["default"] for dimension in DIMENSIONS}
+
+    @classmethod
+    def from_file(cls, path=RULES_FILE) -> "MessageClassifier":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def classify(self, message: str) -> dict:
+        lowered = message.lower()
+        emotional_state = self._first("emotional_state", lowered)
+        support = self.rules["support_needed"]
+        support_needed: List[str] = support["base"] + support["by_emotional_state"].get(emotional_state, [])
+
+        return {
+            "emotional_state": emotional_state,
+            "triggers": [],
+            "support_needed": support_needed,
+            "urgency": self._first("urgency", lowered),
+            "key_concerns": []
+        }
+
+    @staticmethod
+    def _compile(rule: dict):
+        keywords = tuple(keyword.lower() for keyword in rule["keywords"])
+        pattern = None
+        if rule.get("whole_words"):
+            pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, keywords)) + r")\b")
+        return rule["label"], keywords, pattern
+
+    def _first(self, dimension: str, lowered: str) -> str:
+        for label, keywords, pattern in self._rules[dimension]:
+            for keyword in keywords:
+                if keyword in lowered:
+                    # The substring test is cheap and almost always fails; only then is the pattern run
+                    if pattern is None or pattern.search(lowered):
+                        return label
+                    break
+        return self._defaults[dimension]
+
+
+message_classifier = MessageClassifier.from_file()
@@ -0,0 +1,202 @@
+# StepCoachLive/api/services/message_search.py
+import re
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from main.models import Message
+
+HIGHLIGHT = ("<mark>", "</mark>")
+MAX_TERMS = 8
+SNIPPET_WORDS = 16
+# Must match SQLITE_ROWID in main/migrations/0039_message_search_index.py
+ROWID_USER_STRIDE = 2 ** 32
+
+
+class SearchHit(NamedTuple):
+    id: int
+    conversation_id: int
+    role: str
+    timestamp: datetime
+    snippet: str
+    score: float
+
+
+class SearchFilters(NamedTuple):
+    role: Optional[str] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+
+
+def search_terms(query: str) -> List[str]:
+    """
+    Lowercased words of the query. Anything else (quotes, operators) is
+    dropped, so user input can never change the structure of the match.
+    """
+    return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+
+class SqliteFtsBackend:
+    """
+    SQLite FTS5 index in main_message_fts (migration 0039), kept current by
+    triggers on main_message, so bulk inserts are indexed as well.
+
+    FTS rowids are `user id * ROWID_USER_STRIDE + message id`, so the user
+    filter is a rowid range that FTS5 seeks to in each posting list. Matches
+    are ranked by FTS5's bm25() and paged in the same query, so every match
+    of the user can show up, on any page. bm25() counts each term's documents
+    over the whole index, so a query costs more as the table grows (about 20
+    ms at 1M messages, see bench_message_search). Only the returned page gets
+    snippets.
+    """
+    def search(self, user_id, terms, filters: SearchFilters, limit: int, offset: int) -> List[SearchHit]:
+        match = " ".join(f'"{term}"' for term in terms)
+        low = int(user_id) * ROWID_USER_STRIDE
+        sql = [
+            "SELECT main_message_fts.rowid %% %s, bm25(main_message_fts)",
+            "FROM main_message_fts JOIN main_message m ON m.id = main_message_fts.rowid %% %s",
+            "WHERE main_message_fts MATCH %s AND main_message_fts.rowid BETWEEN %s AND %s",
+        ]
+        params = [ROWID_USER_STRIDE, ROWID_USER_STRIDE, match, low, low + ROWID_USER_STRIDE - 1]
+        sql, params = _add_filters(sql, params, filters)
+        # Equal scores: newest first
+        sql.append("ORDER BY bm25(main_message_fts), main_message_fts.rowid DESC LIMIT %s OFFSET %s")
+        params += [limit, offset]
+
+        with connection.cursor() as cursor:
+            cursor.execute(" ".join(sql), params)
+            ranked = cursor.fetchall()
+        if not ranked:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT m.id, m.conversation_id, m.role, m.timestamp, "
+                f"snippet(main_message_fts, 0, %s, %s, '…', {SNIPPET_WORDS}) "
+                "FROM main_message_fts JOIN main_message m ON m.id = main_message_fts.rowid %% %s "
+                f"WHERE main_message_fts MATCH %s AND main_message_fts.rowid IN ({', '.join(['%s'] * len(ranked))})",
+                [*HIGHLIGHT, ROWID_USER_STRIDE, match, *(low + message_id for message_id, _ in ranked)],
+            )
+            rows = {row[0]: row[1:] for row in cursor.fetchall()}
+        hits = []
+        for message_id, score in ranked:
+            conversation_id, role, timestamp, snippet = rows[message_id]
+            timestamp = connection.ops.convert_datetimefield_value(timestamp, None, connection)
+            # bm25() is lower for better matches
+            hits.append(SearchHit(message_id, conversation_id, role, timestamp, snippet, round(-score, 4)))
+        return hits
+
+
+class PostgresSearchBackend:
+    """
+    PostgreSQL full-text search over the GIN expression index from migration
+    0039. The query uses the same to_tsvector expression so the index is used.
+    """
+    def search(self, user_id, terms, filters: SearchFilters, limit: int, offset: int) -> List[SearchHit]:
+        tsquery = " ".join(terms)
+        vector = "to_tsvector('english'::regconfig, COALESCE(m.content, ''))"
+        query = "plainto_tsquery('english'::regconfig, %s)"
+        sql = [
+            "SELECT m.id, m.conversation_id, m.role, m.timestamp,",
+            f"ts_headline('english', m.content, {query}, %s) AS snippet, ts_rank({vector}, {query}) AS score",
+            "FROM main_message m JOIN main_conversation c ON c.id = m.conversation_id",
+            f"WHERE c.user_ref_id = %s AND {vector} @@ {query}",
+        ]
+        options = f"StartSel={HIGHLIGHT[0]}, StopSel={HIGHLIGHT[1]}, MaxWords={SNIPPET_WORDS}, MinWords=5"
+        params = [tsquery, options, tsquery, int(user_id), tsquery]
+        sql, params = _add_filters(sql, params, filters)
+        sql.append("ORDER BY score DESC, m.id DESC LIMIT %s OFFSET %s")
+        params += [limit, offset]
+        return _fetch_hits(" ".join(sql), params)
+
+
+class ScanSearchBackend:
+    """
+    Fallback for databases without a full-text index: every term must appear
+    (case-insensitive substring), newest first. Fine for small installs only,
+    its cost grows with the user's history.
+    """
+    def search(self, user_id, terms, filters: SearchFilters, limit: int, offset: int) -> List[SearchHit]:
+        messages = Message.objects.filter(conversation__user_id=user_id)
+        for term in terms:
+            messages = messages.filter(content__icontains=term)
+        if filters.role:
+            messages = messages.filter(role=filters.role)
+        if filters.since:
+            messages = messages.filter(timestamp__gte=filters.since)
+        if filters.until:
+            messages = messages.filter(timestamp__lt=filters.until)
+        rows = messages.order_by('-timestamp', '-id')[offset:offset + limit]
+        return [
+            SearchHit(m.id, m.conversation_id, m.role, m.timestamp, _scan_snippet(m.content, terms), 0.0)
+            for m in rows
+        ]
+
+
+def _add_filters(sql, params, filters: SearchFilters):
+    if filters.role:
+        sql.append("AND m.role = %s")
+        params.append(filters.role)
+    if filters.since:
+        sql.append("AND m.timestamp >= %s")
+        params.append(connection.ops.adapt_datetimefield_value(filters.since))
+    if filters.until:
+        sql.append("AND m.timestamp < %s")
+        params.append(connection.ops.adapt_datetimefield_value(filters.until))
+    return sql, params
+
+
+def _fetch_hits(sql, params) -> List[SearchHit]:
+    # raw() converts the timestamp like any other queryset; snippet and score come back as attributes
+    return [
+        SearchHit(m.id, m.conversation_id, m.role, m.timestamp, m.snippet, float(m.score))
+        for m in Message.objects.raw(sql, params)
+    ]
+
+
+def _scan_snippet(content: str, terms: List[str]) -> str:
+    words = content.split()
+    lowered = [word.lower() for word in words]
+    first = next((i for i, word in enumerate(lowered) if any(term in word for term in terms)), 0)
+    start = max(0, first - SNIPPET_WORDS // 2)
+    window = [
+        f"{HIGHLIGHT[0]}{word}{HIGHLIGHT[1]}" if any(term in word.lower() for term in terms) else word
+        for word in words[start:start + SNIPPET_WORDS]
+    ]
+    return ("… " if start else "") + " ".join(window) + (" …" if start + SNIPPET_WORDS < len(words) else "")
+
+
+BACKENDS = {
+    "sqlite": SqliteFtsBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+class MessageSearch:
+    """
+    Ranked full-text search over one user's messages.
+
+    The backend follows the database vendor, or MESSAGE_SEARCH_BACKEND (a
+    dotted path to a class with the same `search` method) when it is set.
+    """
+    def __init__(self, backend=None):
+        self._backend = backend
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            path = getattr(settings, "MESSAGE_SEARCH_BACKEND", "")
+            backend_class = import_string(path) if path else BACKENDS.get(connection.vendor, ScanSearchBackend)
+            self._backend = backend_class()
+        return self._backend
+
+    def search(self, user_id, query: str, filters: SearchFilters = SearchFilters(), limit: int = 20, offset: int = 0) -> List[SearchHit]:
+        terms = search_terms(query)
+        if not terms:
+            return []
+        return self.backend.search(user_id, terms, filters, limit, offset)
+
+
+message_search = MessageSearch()
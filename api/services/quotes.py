@@ -0,0 +1,83 @@
+# StepCoachLive/api/services/quotes.py
+import hashlib
+import random
+import threading
+import time
+from datetime import date
+from typing import NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from main.models import Quote
+
+
+class QuoteEntry(NamedTuple):
+    id: int
+    text: str
+    author: str
+
+
+class DailyQuote(NamedTuple):
+    day: date
+    quote: QuoteEntry
+    etag: str
+
+
+class QuoteService:
+    """
+    Motivational quotes served from the Quote table out of an in-process copy.
+
+    The table is read at most once per `ttl` seconds. Saving or deleting a quote
+    invalidates this process's copy at once (api/signals.py); other workers pick
+    the change up when their TTL runs out. The quote of the day walks through
+    the quotes in id order, one per day, so every user and every worker serves
+    the same quote on a given day.
+    """
+    def __init__(self, ttl: float = 300, rng: Optional[random.Random] = None):
+        self.ttl = ttl
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._quotes: Optional[Tuple[QuoteEntry, ...]] = None
+        self._loaded_at = 0.0
+        self._daily: Optional[DailyQuote] = None
+
+    def all(self) -> Tuple[QuoteEntry, ...]:
+        quotes = self._quotes
+        if quotes is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return quotes
+        with self._lock:
+            if self._quotes is None or time.monotonic() - self._loaded_at >= self.ttl:
+                self._quotes = tuple(
+                    QuoteEntry(*row) for row in Quote.objects.order_by('id').values_list('id', 'text', 'author')
+                )
+                self._loaded_at = time.monotonic()
+                self._daily = None
+            return self._quotes
+
+    def random(self) -> Optional[QuoteEntry]:
+        quotes = self.all()
+        return self._rng.choice(quotes) if quotes else None
+
+    def of_the_day(self, day: Optional[date] = None) -> Optional[DailyQuote]:
+        quotes = self.all()
+        day = day or timezone.localdate()
+        daily = self._daily
+        if daily is not None and daily.day == day:
+            return daily
+        if not quotes:
+            return None
+        quote = quotes[day.toordinal() % len(quotes)]
+        # Changes with the day and with any edit of the quote itself
+        digest = hashlib.sha1(f"{day.isoformat()}|{quote.id}|{quote.text}|{quote.author}".encode()).hexdigest()
+        daily = DailyQuote(day, quote, digest[:16])
+        self._daily = daily
+        return daily
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._quotes = None
+            self._daily = None
+
+
+quote_service = QuoteService(ttl=settings.QUOTE_CACHE_SECONDS)
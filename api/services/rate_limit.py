@@ -0,0 +1,178 @@
+# StepCoachLive/api/services/rate_limit.py
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from subscription.models import UserSubscription
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class Limit(NamedTuple):
+    burst: int       # bucket size: requests allowed back to back
+    per_second: float  # refill rate
+
+    @classmethod
+    def parse(cls, spec) -> "Limit":
+        """
+        Accepts DRF-style "30/minute" (burst 30), or {"rate": "30/minute", "burst": 10}.
+        """
+        if isinstance(spec, dict):
+            limit = cls.parse(spec["rate"])
+            return cls(int(spec.get("burst", limit.burst)), limit.per_second)
+        count, period = str(spec).split("/", 1)
+        return cls(int(count), int(count) / PERIODS[period.strip()[0].lower()])
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: int        # seconds until the bucket is full again
+    retry_after: int  # seconds until the next request is allowed, 0 if it is now
+
+    def headers(self) -> Dict[str, str]:
+        """
+        RateLimit-* fields as in the IETF httpapi draft, plus Retry-After when refused.
+        """
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+def refill(state: Optional[Tuple[float, float]], limit: Limit, now: float) -> float:
+    if state is None:
+        return float(limit.burst)
+    tokens, stamp = state
+    return min(float(limit.burst), tokens + max(0.0, now - stamp) * limit.per_second)
+
+
+class LocalBucketBackend:
+    """
+    Buckets in process memory. Exact and lock-protected, but every worker
+    process keeps its own buckets, so the effective limit is multiplied by the
+    number of workers. The least recently used buckets are dropped past
+    `max_keys`; a dropped bucket simply starts full again.
+    """
+    def __init__(self, max_keys: int = 50000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: Limit, now: float) -> Tuple[bool, float]:
+        with self._lock:
+            tokens = refill(self._buckets.get(key), limit, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class CacheBucketBackend:
+    """
+    Buckets in a Django cache (RATE_LIMIT_CACHE alias), so all workers share
+    them: a file or database cache on a single host, Redis or Memcached across
+    hosts. The read-modify-write is not atomic, so two workers hitting the same
+    bucket at the same instant can both be let through; the limit is
+    approximate by at most the number of concurrent requests of one user.
+    """
+    def __init__(self, alias: Optional[str] = None):
+        self.alias = alias or getattr(settings, "RATE_LIMIT_CACHE", "default")
+
+    def take(self, key: str, limit: Limit, now: float) -> Tuple[bool, float]:
+        cache = caches[self.alias]
+        key = f"ratelimit:{key}"
+        tokens = refill(cache.get(key), limit, now)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # A bucket left alone until it is full again is the same as no bucket
+        cache.set(key, (tokens, now), timeout=math.ceil((limit.burst - tokens) / limit.per_second) + 1)
+        return allowed, tokens
+
+
+class RateLimiter:
+    """
+    Token-bucket limits per user and scope ("chat", "voice").
+
+    Limits come from the user's active subscription plan: a plan whose
+    `features` is a dict with `rate_limits`, e.g.
+    `{"rate_limits": {"chat": "60/minute", "voice": {"rate": "10/hour", "burst": 2}}}`,
+    overrides the RATE_LIMITS defaults of its plan_type. Users without an
+    active subscription get the "free" limits. The plan of a user is looked up
+    at most once per `plan_ttl` seconds; signals drop it when a subscription or
+    plan changes.
+    """
+    def __init__(self, backend=None, plan_ttl: float = 60.0):
+        self._backend = backend
+        self.plan_ttl = plan_ttl
+        self._plans: Dict[str, Tuple[float, Dict[str, Limit]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            path = getattr(settings, "RATE_LIMIT_BACKEND", "")
+            self._backend = import_string(path)() if path else LocalBucketBackend()
+        return self._backend
+
+    def hit(self, user_id, scope: str) -> Optional[Decision]:
+        """
+        Takes one token from the user's `scope` bucket. Returns None when the
+        scope is not limited for the user's plan.
+        """
+        limit = self.limits_for(user_id).get(scope)
+        if limit is None:
+            return None
+        allowed, tokens = self.backend.take(f"{scope}:{user_id}", limit, time.time())
+        return Decision(
+            allowed=allowed,
+            limit=limit.burst,
+            remaining=int(tokens),
+            reset=math.ceil((limit.burst - tokens) / limit.per_second),
+            retry_after=0 if allowed else math.ceil((1 - tokens) / limit.per_second),
+        )
+
+    def limits_for(self, user_id) -> Dict[str, Limit]:
+        key = str(user_id)
+        now = time.monotonic()
+        cached = self._plans.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+        limits = self._load_limits(user_id)
+        with self._lock:
+            self._plans[key] = (now + self.plan_ttl, limits)
+        return limits
+
+    def invalidate(self, user_id=None) -> None:
+        with self._lock:
+            if user_id is None:
+                self._plans.clear()
+            else:
+                self._plans.pop(str(user_id), None)
+
+    def _load_limits(self, user_id) -> Dict[str, Limit]:
+        subscription = UserSubscription.objects.filter(user_id=user_id).select_related('plan').first()
+        plan = subscription.plan if subscription and subscription.is_currently_active else None
+        specs = dict(settings.RATE_LIMITS.get(plan.plan_type if plan else "free", {}))
+        if plan and isinstance(plan.features, dict):
+            specs.update(plan.features.get("rate_limits") or {})
+        return {scope: Limit.parse(spec) for scope, spec in specs.items() if spec}
+
+
+rate_limiter = RateLimiter()
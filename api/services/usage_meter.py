@@ -0,0 +1,174 @@
+# StepCoachLive/api/services/usage_meter.py
+import atexit
+import logging
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from main.models import DailyTokenUsage, TokenUsage
+from subscription.models import UserSubscription
+
+logger = logging.getLogger(__name__)
+
+
+class UsageMeter:
+    """
+    Records prompt/completion tokens and latency of every LLM call into the
+    TokenUsage ledger.
+
+    `record` only appends to an in-memory buffer; a background thread writes
+    the buffer with one bulk insert every `flush_seconds`, or as soon as
+    `batch_size` records are waiting. A failed write keeps the records for the
+    next attempt, up to `max_buffer`. Whatever is buffered when the process
+    exits normally is written by an atexit hook; a crash loses at most one
+    interval.
+    """
+    def __init__(self, batch_size: int = 100, flush_seconds: float = 5.0, max_buffer: int = 10000):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_buffer = max_buffer
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._buffer: List[TokenUsage] = []
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def record(self, user_id, kind: str, model: str, prompt_tokens: int, completion_tokens: int,
+               latency_ms: int, estimated: bool = False) -> None:
+        usage = TokenUsage(
+            user_id=int(user_id) if user_id is not None else None,
+            kind=kind,
+            model=model[:100],
+            prompt_tokens=max(0, int(prompt_tokens)),
+            completion_tokens=max(0, int(completion_tokens)),
+            latency_ms=max(0, int(latency_ms)),
+            estimated=estimated,
+            created_at=timezone.now(),
+        )
+        with self._lock:
+            self._buffer.append(usage)
+            waiting = len(self._buffer)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="usage-meter", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        if waiting >= self.batch_size:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """
+        Writes everything buffered so far; returns the number of rows written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+            try:
+                TokenUsage.objects.bulk_create(batch, batch_size=500)
+            except Exception:
+                logger.exception("Writing %s token usage records failed", len(batch))
+                with self._lock:
+                    keep = max(0, self.max_buffer - len(self._buffer))
+                    self.dropped += max(0, len(batch) - keep)
+                    self._buffer[:0] = batch[-keep:] if keep else []
+                return 0
+            return len(batch)
+
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+def day_bounds(day: date):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def rollup_day(day: date) -> int:
+    """
+    Rebuilds the DailyTokenUsage rows of `day` from the ledger. Safe to run
+    again, e.g. every few minutes for today; returns the number of users.
+    """
+    start, end = day_bounds(day)
+    totals = list(
+        TokenUsage.objects.filter(created_at__gte=start, created_at__lt=end, user__isnull=False)
+        .values('user_id')
+        .annotate(
+            calls=Count('id'),
+            prompt=Sum('prompt_tokens'),
+            completion=Sum('completion_tokens'),
+            latency=Sum('latency_ms'),
+        )
+    )
+    plans = dict(
+        UserSubscription.objects.filter(user_id__in=[row['user_id'] for row in totals])
+        .values_list('user_id', 'plan__name')
+    )
+    DailyTokenUsage.objects.bulk_create(
+        [
+            DailyTokenUsage(
+                day=day,
+                user_id=row['user_id'],
+                plan=plans.get(row['user_id'], ''),
+                calls=row['calls'],
+                prompt_tokens=row['prompt'],
+                completion_tokens=row['completion'],
+                latency_ms=row['latency'],
+            )
+            for row in totals
+        ],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['day', 'user'],
+        update_fields=['plan', 'calls', 'prompt_tokens', 'completion_tokens', 'latency_ms'],
+    )
+    return len(totals)
+
+
+def plan_totals(day: date) -> List[dict]:
+    """
+    Per-plan totals of a rolled-up day, most tokens first. Users without a plan are under "".
+    """
+    return list(
+        DailyTokenUsage.objects.filter(day=day)
+        .values('plan')
+        .annotate(
+            users=Count('user_id'),
+            calls_total=Sum('calls'),
+            prompt=Sum('prompt_tokens'),
+            completion=Sum('completion_tokens'),
+        )
+        .annotate(total=F('prompt') + F('completion'))
+        .order_by('-total')
+        .values('plan', 'users', 'prompt', 'completion', 'total', calls=F('calls_total'))
+    )
+
+
+def top_users(day: date, limit: int = 20) -> List[dict]:
+    return list(
+        DailyTokenUsage.objects.filter(day=day)
+        .annotate(total=F('prompt_tokens') + F('completion_tokens'))
+        .order_by('-total')
+        .values('user_id', 'plan', 'calls', 'total', prompt=F('prompt_tokens'), completion=F('completion_tokens'))[:limit]
+    )
+
+
+usage_meter = UsageMeter(
+    batch_size=settings.USAGE_METER_BATCH_SIZE,
+    flush_seconds=settings.USAGE_METER_FLUSH_SECONDS,
+)
@@ -0,0 +1,204 @@
+# StepCoachLive/api/services/voice_clients.py
+# Shared ElevenLabs clients and pre-fetched session URLs for voice sessions,
+# plus start-up latency metrics. The SDK is only imported when a client is
+# first built, so importing this module stays cheap.
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from django.conf import settings
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+AGENTS = ("male", "female")
+START_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8)
+
+
+class VoiceStartMetrics:
+    """
+    In-process start-up latency of voice sessions, from the start request:
+    `setup` until the session is connecting, `first_audio` until the agent's
+    first audio reaches the audio interface (what users notice). Also counts
+    how often a pre-fetched session URL was ready. `snapshot()` returns a
+    plain dict.
+    """
+    def __init__(self, buckets=START_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series = {name: ([0] * (len(self.buckets) + 1), [0.0]) for name in ("setup", "first_audio")}
+            self._url_hits = 0
+            self._url_misses = 0
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            counts, total = self._series[name]
+            counts[bisect_left(self.buckets, seconds)] += 1
+            total[0] += seconds
+
+    def record_url(self, prefetched: bool) -> None:
+        with self._lock:
+            if prefetched:
+                self._url_hits += 1
+            else:
+                self._url_misses += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            series = {}
+            for name, (counts, total) in self._series.items():
+                count = sum(counts)
+                series[name] = {
+                    "count": count,
+                    "mean_seconds": round(total[0] / count, 4) if count else 0.0,
+                    "buckets": {
+                        **{f"le_{bound}": n for bound, n in zip(self.buckets, counts)},
+                        "inf": counts[-1],
+                    },
+                }
+            return {**series, "prefetched_urls": {"hits": self._url_hits, "misses": self._url_misses}}
+
+
+class VoiceClientPool:
+    """
+    One ElevenLabs client per agent voice, built once and shared by all
+    sessions of the process, so credentials are read once and the HTTPS
+    connections of its connection pool are reused.
+
+    Each agent also keeps `urls_per_agent` signed session URLs fetched ahead
+    of time, which takes the signed-URL round trip off session start. A URL
+    is used once and only while younger than `url_ttl` (ElevenLabs honours
+    them for 15 minutes); a background thread tops the stock up after each
+    use. `warm` builds the clients and fills the stocks up front.
+    """
+    def __init__(self, urls_per_agent: int = 2, url_ttl: float = 600):
+        self.urls_per_agent = urls_per_agent
+        self.url_ttl = url_ttl
+        self._clients: Dict[str, object] = {}
+        self._credentials: Dict[str, Tuple[str, str]] = {}
+        self._urls: Dict[str, Deque[Tuple[float, str]]] = {agent: deque() for agent in AGENTS}
+        self._lock = threading.Lock()
+        # Only one fill at a time, or warm() and the refill thread both top up the same stock
+        self._fill_lock = threading.Lock()
+        self._refill = threading.Event()
+        self._refiller: Optional[threading.Thread] = None
+
+    def credentials(self, agent: str) -> Tuple[str, str]:
+        agent = self._agent(agent)
+        if agent not in self._credentials:
+            api_key = os.getenv("ELEVENLABS_API_KEY")
+            agent_id = os.getenv("AGENT_ID_FEMALE") if agent == "female" else os.getenv("AGENT_ID_MALE")
+            if not api_key or not agent_id:
+                raise RuntimeError("Missing ELEVENLABS_API_KEY or AGENT_ID_* in environment.")
+            self._credentials[agent] = (api_key, agent_id)
+        return self._credentials[agent]
+
+    def client(self, agent: str):
+        agent = self._agent(agent)
+        with self._lock:
+            client = self._clients.get(agent)
+        if client is None:
+            from elevenlabs.client import ElevenLabs
+            api_key, _ = self.credentials(agent)
+            built = ElevenLabs(api_key=api_key)
+            with self._lock:
+                client = self._clients.setdefault(agent, built)
+        return client
+
+    def signed_url(self, agent: str) -> Optional[str]:
+        """
+        A pre-fetched signed URL for a new session of `agent`, or None if none is ready.
+        """
+        agent = self._agent(agent)
+        now = time.monotonic()
+        url = None
+        with self._lock:
+            stock = self._urls[agent]
+            while stock:
+                fetched_at, candidate = stock.popleft()
+                if now - fetched_at < self.url_ttl:
+                    url = candidate
+                    break
+        self._start_refill()
+        return url
+
+    def warm(self) -> None:
+        for agent in AGENTS:
+            try:
+                self.client(agent)
+                self._fill(agent)
+            except Exception:
+                logger.exception("Warming the %s voice agent failed", agent)
+
+    def warm_in_background(self) -> None:
+        try:
+            self.credentials("male")
+        except RuntimeError:
+            logger.info("ElevenLabs is not configured; voice clients are not warmed")
+            return
+        threading.Thread(target=self.warm, name="voice-warm", daemon=True).start()
+        self._start_refill()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "clients": sorted(self._clients),
+                "ready_urls": {
+                    agent: sum(1 for fetched_at, _ in stock if now - fetched_at < self.url_ttl)
+                    for agent, stock in self._urls.items()
+                },
+            }
+
+    def _agent(self, agent: str) -> str:
+        return "female" if agent == "female" else "male"
+
+    def _fill(self, agent: str) -> None:
+        with self._fill_lock:
+            now = time.monotonic()
+            with self._lock:
+                stock = self._urls[agent]
+                while stock and now - stock[0][0] >= self.url_ttl:
+                    stock.popleft()
+                missing = self.urls_per_agent - len(stock)
+            if missing <= 0:
+                return
+            _, agent_id = self.credentials(agent)
+            conversations = self.client(agent).conversational_ai.conversations
+            for _ in range(missing):
+                url = conversations.get_signed_url(agent_id=agent_id).signed_url
+                with self._lock:
+                    self._urls[agent].append((time.monotonic(), url))
+
+    def _start_refill(self) -> None:
+        with self._lock:
+            if self._refiller is None:
+                self._refiller = threading.Thread(target=self._run_refill, name="voice-urls", daemon=True)
+                self._refiller.start()
+        self._refill.set()
+
+    def _run_refill(self) -> None:
+        while True:
+            # Also wakes up well before stocked URLs expire
+            self._refill.wait(self.url_ttl / 2)
+            self._refill.clear()
+            for agent in AGENTS:
+                try:
+                    self._fill(agent)
+                except Exception:
+                    logger.exception("Fetching signed URLs for the %s voice agent failed", agent)
+                    time.sleep(5)
+
+
+voice_clients = VoiceClientPool(urls_per_agent=settings.VOICE_PREFETCHED_URLS)
+voice_start_metrics = VoiceStartMetrics()
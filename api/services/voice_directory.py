@@ -0,0 +1,76 @@
+# StepCoachLive/api/services/voice_directory.py
+import os
+import socket
+import uuid
+from datetime import timedelta
+from typing import List
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from main.models import VoiceSessionLease
+
+
+class DatabaseSessionDirectory:
+    """
+    Shared directory of which worker runs whose voice sessions, kept in the
+    VoiceSessionLease table so every worker on every node sees it.
+
+    A worker `claim`s a user before starting a session for them; the claim
+    fails while another live worker holds the user. The owner `heartbeat`s
+    every few seconds, which also hands it the users whose sessions another
+    worker was asked to end, and `release`s the user when their last session
+    is over. A worker whose heartbeat is older than `dead_after` seconds is
+    presumed dead: its sessions died with it, so its leases are taken over
+    or dropped.
+    """
+    def __init__(self, dead_after: float = 10.0):
+        self.dead_after = dead_after
+        self._owner = None
+        self._pid = None
+
+    @property
+    def owner(self) -> str:
+        # Computed per process: workers forked from a preloaded app must not share an id
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._owner = f"{socket.gethostname()[:60]}:{self._pid}:{uuid.uuid4().hex[:8]}"
+        return self._owner
+
+    def claim(self, user_key: str, agent: str = "") -> bool:
+        now = timezone.now()
+        taken = VoiceSessionLease.objects.filter(
+            Q(owner=self.owner) | Q(heartbeat_at__lt=now - timedelta(seconds=self.dead_after)),
+            user_id=user_key,
+        ).update(owner=self.owner, agent=agent, started_at=now, heartbeat_at=now, end_requested_at=None)
+        if taken:
+            return True
+        try:
+            with transaction.atomic():
+                VoiceSessionLease.objects.create(user_id=user_key, owner=self.owner, agent=agent, started_at=now, heartbeat_at=now)
+        except IntegrityError:
+            return False
+        return True
+
+    def release(self, user_key: str) -> None:
+        VoiceSessionLease.objects.filter(user_id=user_key, owner=self.owner).delete()
+
+    def heartbeat(self) -> List[str]:
+        """
+        Refreshes this worker's leases; returns the users whose sessions it was asked to end.
+        """
+        leases = VoiceSessionLease.objects.filter(owner=self.owner)
+        leases.update(heartbeat_at=timezone.now())
+        return [str(user_id) for user_id in leases.filter(end_requested_at__isnull=False).values_list('user_id', flat=True)]
+
+    def request_end(self, user_key: str) -> bool:
+        """
+        Asks the worker that owns the user's sessions to end them; it does so
+        with its next heartbeat. Returns False if nobody held the user or the
+        owner was dead (then there is nothing left to end).
+        """
+        now = timezone.now()
+        stale = now - timedelta(seconds=self.dead_after)
+        VoiceSessionLease.objects.filter(user_id=user_key, heartbeat_at__lt=stale).delete()
+        return bool(VoiceSessionLease.objects.filter(user_id=user_key).update(end_requested_at=now))
@@ -1,27 +1,296 @@
 # StepCoachLive/api/services/voice_registry.py
-from typing import Dict, Optional
-from .voice_runtime import VoiceCounselorRuntime
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+if TYPE_CHECKING:
+    # The ElevenLabs SDK takes over a second to import; it is loaded with the first voice session
+    from .voice_runtime import VoiceCounselorRuntime
+
+logger = logging.getLogger(__name__)
+
+
+class VoiceCapacityError(Exception):
+    """This process already runs as many voice sessions as it is allowed to."""
+
+
+class VoiceSessionElsewhere(Exception):
+    """Another worker runs the user's voice sessions."""
+
+
+class _Slot:
+    __slots__ = ("runtime", "started", "last_activity", "ready", "error", "on_end")
+
+    def __init__(self, on_end: Optional[Callable[[], None]] = None):
+        self.runtime: Optional["VoiceCounselorRuntime"] = None
+        self.on_end = on_end
+        self.started = self.last_activity = time.monotonic()
+        self.ready = threading.Event()
+        self.error: Optional[BaseException] = None
+
+    def is_live(self) -> bool:
+        # A slot still being started counts as live, so it holds its place under the caps
+        return not self.ready.is_set() or (self.runtime is not None and self.runtime.is_running())
+
 
 class VoiceSessionRegistry:
-    def __init__(self):
-        self._by_user: Dict[str, VoiceCounselorRuntime] = {}
-
-    def get(self, user_key: str) -> Optional[VoiceCounselorRuntime]:
-        return self._by_user.get(user_key)
-
-    def start(self, user_key: str, **kwargs) -> VoiceCounselorRuntime:
-        existing = self._by_user.get(user_key)
-        if existing and existing.is_running():
-            return existing
-        runtime = VoiceCounselorRuntime(**kwargs)
-        self._by_user[user_key] = runtime
-        runtime.start()
+    """
+    Live voice sessions of this process, by user.
+
+    Every session runs a VoiceCounselorRuntime thread, so admission is capped:
+    at most `max_sessions` in the process and `max_per_user` per user,
+    counting sessions that are still starting. A user at their cap gets their
+    newest session back from `start` (with the default of one, starting twice
+    is harmless); past the process cap `start` raises VoiceCapacityError.
+
+    A background reaper ends sessions whose thread has died, that ran longer
+    than `max_duration`, or that saw no transcript or agent response for
+    `idle_timeout` seconds. However a session ends, the `on_end` callback
+    given to the `start` that created it runs afterwards. All bookkeeping
+    happens under one lock; starting and ending runtimes (network calls,
+    thread joins) happens outside it.
+
+    With several workers, a shared directory (VOICE_SESSION_DIRECTORY) keeps
+    each user's sessions on one worker: `start` raises VoiceSessionElsewhere
+    while another worker holds the user, `end` for a user held elsewhere asks
+    that worker to end them and raises it too, and the reaper loop doubles as
+    the heartbeat that keeps this worker's claims alive and picks up such
+    requests.
+    """
+    def __init__(self, max_sessions: int = 20, max_per_user: int = 1, max_duration: float = 1800,
+                 idle_timeout: float = 300, reap_interval: float = 15, start_timeout: float = 30):
+        self.max_sessions = max_sessions
+        self.max_per_user = max_per_user
+        self.max_duration = max_duration
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+        self.start_timeout = start_timeout
+        self._by_user: Dict[str, List[_Slot]] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._directory = None
+        self._directory_loaded = False
+
+    @property
+    def directory(self):
+        if not self._directory_loaded:
+            path = getattr(settings, "VOICE_SESSION_DIRECTORY", "")
+            # A worker missing five heartbeats in a row is taken for dead
+            self._directory = import_string(path)(dead_after=5 * self.reap_interval) if path else None
+            self._directory_loaded = True
+        return self._directory
+
+    def get(self, user_key: str) -> Optional["VoiceCounselorRuntime"]:
+        with self._lock:
+            for slot in reversed(self._by_user.get(user_key, [])):
+                if slot.runtime is not None and slot.is_live():
+                    return slot.runtime
+        return None
+
+    def active(self) -> int:
+        with self._lock:
+            return self._count_live()
+
+    def start(self, user_key: str, on_end: Optional[Callable[[], None]] = None, **kwargs) -> "VoiceCounselorRuntime":
+        dead: List[_Slot] = []
+        try:
+            with self._lock:
+                slots = self._by_user.setdefault(user_key, [])
+                dead = [slot for slot in slots if not slot.is_live()]
+                slots[:] = [slot for slot in slots if slot.is_live()]
+                if len(slots) >= self.max_per_user:
+                    existing = slots[-1]
+                elif self._count_live() >= self.max_sessions:
+                    if not slots:
+                        del self._by_user[user_key]
+                    raise VoiceCapacityError(f"All {self.max_sessions} voice sessions are in use.")
+                else:
+                    existing = None
+                    slot = _Slot(on_end)
+                    slots.append(slot)
+        finally:
+            # Sessions whose thread died since the last reap are cleaned up as reap() does
+            for old in dead:
+                self._shut(user_key, old)
+            if dead:
+                self._release(user_key)
+
+        if existing is not None:
+            return self._wait_ready(existing)
+
+        for name in ("on_user_transcript", "on_agent_response"):
+            kwargs[name] = self._touching(slot, kwargs.get(name))
+        try:
+            if self.directory is not None and not self.directory.claim(user_key, kwargs.get("agent", "")):
+                raise VoiceSessionElsewhere("A voice session is already running for this user on another worker.")
+            from .voice_runtime import VoiceCounselorRuntime
+            runtime = VoiceCounselorRuntime(**kwargs)
+            runtime.start()
+        except BaseException as e:
+            slot.error = e
+            self._remove(user_key, slot)
+            slot.ready.set()
+            self._ended(user_key, slot)
+            self._release(user_key)
+            raise
+        slot.runtime = runtime
+        slot.last_activity = time.monotonic()
+        slot.ready.set()
+        self._ensure_reaper()
         return runtime
 
-    def end(self, user_key: str) -> Optional[str]:
-        rt = self._by_user.pop(user_key, None)
-        if not rt:
+    def end(self, user_key: str, runtime: Optional["VoiceCounselorRuntime"] = None) -> Optional[str]:
+        """
+        Ends all sessions of the user, or only `runtime`; returns the conversation id of the newest one ended.
+        Sessions on another worker are ended by that worker with its next heartbeat: then this only asks it
+        to, and raises VoiceSessionElsewhere.
+        """
+        with self._lock:
+            if runtime is None:
+                slots = self._by_user.pop(user_key, [])
+            else:
+                slots = [slot for slot in self._by_user.get(user_key, []) if slot.runtime is runtime]
+                remaining = [slot for slot in self._by_user.get(user_key, []) if slot.runtime is not runtime]
+                if remaining:
+                    self._by_user[user_key] = remaining
+                else:
+                    self._by_user.pop(user_key, None)
+        if not slots and runtime is None and self.directory is not None:
+            if self.directory.request_end(user_key):
+                raise VoiceSessionElsewhere("The voice session is being ended by the worker running it.")
             return None
-        return rt.end()
+        conversation_id = None
+        try:
+            for slot in slots:
+                if slot.runtime is not None:
+                    try:
+                        conversation_id = slot.runtime.end() or conversation_id
+                    finally:
+                        self._ended(user_key, slot)
+        finally:
+            self._release(user_key)
+        return conversation_id
+
+    def reap(self) -> int:
+        """
+        Ends dead, over-long and idle sessions; returns how many were removed.
+        """
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for user_key, slots in list(self._by_user.items()):
+                keep = []
+                for slot in slots:
+                    if not slot.ready.is_set():
+                        keep.append(slot)
+                    elif (not slot.is_live()
+                          or now - slot.started > self.max_duration
+                          or now - slot.last_activity > self.idle_timeout):
+                        expired.append((user_key, slot))
+                    else:
+                        keep.append(slot)
+                if keep:
+                    self._by_user[user_key] = keep
+                else:
+                    del self._by_user[user_key]
+        for user_key, slot in expired:
+            self._shut(user_key, slot)
+        for user_key in {user_key for user_key, _ in expired}:
+            self._release(user_key)
+        return len(expired)
+
+    def heartbeat(self) -> None:
+        """
+        Keeps this worker's directory claims alive and ends the sessions other workers asked it to end.
+        """
+        if self.directory is None or not self._by_user:
+            return
+        for user_key in self.directory.heartbeat():
+            if user_key in self._by_user:
+                self.end(user_key)
+            else:
+                self._release(user_key)
+
+    def _release(self, user_key: str) -> None:
+        # The directory claim goes once the user's last session on this worker is over
+        if self.directory is None or user_key in self._by_user:
+            return
+        try:
+            self.directory.release(user_key)
+        except Exception:
+            logger.exception("Releasing the voice sessions of user %s in the directory failed", user_key)
+
+    def _shut(self, user_key: str, slot: _Slot) -> None:
+        if slot.runtime is not None:
+            try:
+                slot.runtime.end()
+            except Exception:
+                logger.exception("Ending the voice session of user %s failed", user_key)
+        self._ended(user_key, slot)
+
+    def _ended(self, user_key: str, slot: _Slot) -> None:
+        if slot.on_end is None:
+            return
+        try:
+            slot.on_end()
+        except Exception:
+            logger.exception("Cleaning up after the voice session of user %s failed", user_key)
+
+    def _wait_ready(self, slot: _Slot) -> "VoiceCounselorRuntime":
+        if not slot.ready.wait(self.start_timeout):
+            raise VoiceCapacityError("A voice session for this user is still starting.")
+        if slot.error is not None:
+            raise slot.error
+        return slot.runtime
+
+    def _touching(self, slot: _Slot, callback: Optional[Callable[[str], None]]) -> Callable[[str], None]:
+        def handle(text: str):
+            slot.last_activity = time.monotonic()
+            if callback is not None:
+                callback(text)
+        return handle
+
+    def _count_live(self) -> int:
+        return sum(1 for slots in self._by_user.values() for slot in slots if slot.is_live())
+
+    def _remove(self, user_key: str, slot: _Slot) -> None:
+        with self._lock:
+            slots = self._by_user.get(user_key, [])
+            if slot in slots:
+                slots.remove(slot)
+            if not slots:
+                self._by_user.pop(user_key, None)
+
+    def _ensure_reaper(self) -> None:
+        with self._lock:
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._run_reaper, name="voice-reaper", daemon=True)
+                self._reaper.start()
+
+    def _run_reaper(self) -> None:
+        while True:
+            time.sleep(self.reap_interval)
+            try:
+                reaped = self.reap()
+                self.heartbeat()
+            except Exception:
+                logger.exception("Reaping voice sessions failed")
+                continue
+            finally:
+                close_old_connections()
+            if reaped:
+                logger.info("Ended %s expired voice sessions", reaped)
+
 
-voice_registry = VoiceSessionRegistry()
+voice_registry = VoiceSessionRegistry(
+    max_sessions=settings.VOICE_MAX_SESSIONS,
+    max_per_user=settings.VOICE_MAX_SESSIONS_PER_USER,
+    max_duration=settings.VOICE_MAX_SESSION_SECONDS,
+    idle_timeout=settings.VOICE_IDLE_SECONDS,
+    reap_interval=settings.VOICE_HEARTBEAT_SECONDS,
+)
@@ -0,0 +1,185 @@
+# StepCoachLive/api/services/voice_relay.py
+# Audio interface that relays a voice session over the client's WebSocket
+# (api/voice_socket.py) instead of the server's sound card. Imported with the
+# first relayed session, since it pulls in the ElevenLabs SDK.
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Optional, Tuple
+
+from elevenlabs.conversational_ai.conversation import AudioInterface
+
+BYTES_PER_MS = 32  # 16-bit PCM, mono, 16 kHz: the format ElevenLabs expects and sends
+
+
+class FrameBuffer:
+    """
+    Bounded jitter buffer of PCM audio. Bytes go in in whatever chunks they
+    arrive, fixed `frame_bytes` frames come out; a partial frame comes out
+    once it has waited a frame's duration, so the tail of an utterance is not
+    held back. Past `max_bytes` the oldest audio is dropped: for live speech,
+    skipping ahead beats falling further behind. Thread-safe.
+    """
+    def __init__(self, frame_bytes: int, max_bytes: int):
+        self.frame_bytes = frame_bytes
+        self.max_bytes = max_bytes
+        self._frames: Deque[Tuple[bytes, float]] = deque()
+        self._partial = bytearray()
+        self._partial_since = 0.0
+        self._lock = threading.Lock()
+        self.buffered = 0
+        self.peak = 0
+        self.dropped = 0
+        self.frames_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def push(self, data: bytes) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if not self._partial:
+                self._partial_since = now
+            self._partial += data
+            while len(self._partial) >= self.frame_bytes:
+                self._frames.append((bytes(self._partial[:self.frame_bytes]), self._partial_since))
+                del self._partial[:self.frame_bytes]
+                self._partial_since = now
+            self.buffered += len(data)
+            while self.buffered > self.max_bytes and self._frames:
+                frame, _ = self._frames.popleft()
+                self.buffered -= len(frame)
+                self.dropped += len(frame)
+            self.peak = max(self.peak, self.buffered)
+
+    def pop(self) -> Optional[bytes]:
+        now = time.monotonic()
+        with self._lock:
+            if self._frames:
+                frame, since = self._frames.popleft()
+            elif self._partial and now - self._partial_since >= self.frame_bytes / BYTES_PER_MS / 1000:
+                frame, since = bytes(self._partial), self._partial_since
+                self._partial.clear()
+            else:
+                return None
+            self.buffered -= len(frame)
+            self.frames_out += 1
+            self.wait_total += now - since
+            self.wait_max = max(self.wait_max, now - since)
+            return frame
+
+    def clear(self) -> None:
+        with self._lock:
+            self.dropped += self.buffered
+            self._frames.clear()
+            self._partial.clear()
+            self.buffered = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "buffered_bytes": self.buffered,
+                "peak_bytes": self.peak,
+                "dropped_bytes": self.dropped,
+                "frames": self.frames_out,
+                "avg_wait_ms": round(self.wait_total / self.frames_out * 1000, 1) if self.frames_out else 0.0,
+                "max_wait_ms": round(self.wait_max * 1000, 1),
+            }
+
+
+class WebSocketAudioInterface(AudioInterface):
+    """
+    Relays PCM between a client WebSocket and an ElevenLabs Conversation.
+
+    Client audio goes through the inbound buffer to a pump thread that feeds
+    the SDK; agent audio goes through the outbound buffer to `events()`,
+    which the socket's send loop consumes on the event loop. Both buffers
+    are capped at `max_buffer_ms`, so a session never holds more than about
+    2 * max_buffer_ms of audio however slow either side is; `stats()` reports
+    peaks, drops and how long frames waited.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, frame_ms: int = 100, max_buffer_ms: int = 2000):
+        frame_bytes = frame_ms * BYTES_PER_MS
+        self.frame_seconds = frame_ms / 1000
+        self.inbound = FrameBuffer(frame_bytes, max_buffer_ms * BYTES_PER_MS)
+        self.outbound = FrameBuffer(frame_bytes, max_buffer_ms * BYTES_PER_MS)
+        self.interrupts = 0
+        self._loop = loop
+        self._out_ready = asyncio.Event()
+        self._in_ready = threading.Event()
+        self._stopped = threading.Event()
+        self._input_callback: Optional[Callable[[bytes], None]] = None
+        self._pump: Optional[threading.Thread] = None
+        self._started = time.monotonic()
+
+    # Called by the SDK, from its own threads
+
+    def start(self, input_callback: Callable[[bytes], None]):
+        self._input_callback = input_callback
+        self._pump = threading.Thread(target=self._pump_input, name="voice-relay-in", daemon=True)
+        self._pump.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._in_ready.set()
+        self._wake()
+
+    def output(self, audio: bytes):
+        self.outbound.push(audio)
+        self._wake()
+
+    def interrupt(self):
+        self.outbound.clear()
+        self.interrupts += 1
+        self._wake()
+
+    # Called by the socket, on the event loop
+
+    def receive(self, audio: bytes) -> None:
+        self.inbound.push(audio)
+        self._in_ready.set()
+
+    async def events(self, is_running: Callable[[], bool]) -> AsyncIterator[Tuple[str, Optional[bytes]]]:
+        """
+        Yields ("audio", frame) and ("interrupt", None) until the session stops.
+        """
+        interrupts = 0
+        while not self._stopped.is_set() and is_running():
+            try:
+                await asyncio.wait_for(self._out_ready.wait(), self.frame_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._out_ready.clear()
+            if self.interrupts != interrupts:
+                interrupts = self.interrupts
+                yield "interrupt", None
+            while (frame := self.outbound.pop()) is not None:
+                yield "audio", frame
+
+    def stats(self) -> dict:
+        return {
+            "seconds": round(time.monotonic() - self._started, 1),
+            "interrupts": self.interrupts,
+            "inbound": self.inbound.stats(),
+            "outbound": self.outbound.stats(),
+        }
+
+    def _pump_input(self) -> None:
+        while not self._stopped.is_set():
+            frame = self.inbound.pop()
+            if frame is None:
+                self._in_ready.wait(self.frame_seconds)
+                self._in_ready.clear()
+                continue
+            try:
+                self._input_callback(frame)
+            except Exception:
+                # The SDK's socket is gone; the session is ending
+                return
+
+    def _wake(self) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._out_ready.set)
+        except RuntimeError:
+            # Event loop already closed: the client went away
+            pass
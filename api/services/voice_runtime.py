@@ -1,13 +1,56 @@
 # StepCoachLive/api/services/voice_runtime.py
-import os, threading, signal
+import threading, signal, time
 from typing import Optional, Callable, Dict, Any
 
-from dotenv import load_dotenv
-from elevenlabs.client import ElevenLabs
-from elevenlabs.conversational_ai.conversation import Conversation
+from elevenlabs.conversational_ai.conversation import AudioInterface, Conversation
 from elevenlabs.conversational_ai.default_audio_interface import DefaultAudioInterface
+from elevenlabs.version import __version__
+
+from .voice_clients import voice_clients, voice_start_metrics
+
+
+class PooledConversation(Conversation):
+    """
+    Conversation that connects with a signed URL pre-fetched by voice_clients when one is ready.
+    """
+    def __init__(self, *args, voice_agent: str = "male", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.voice_agent = voice_agent
+
+    def _get_signed_url(self):
+        signed_url = voice_clients.signed_url(self.voice_agent)
+        voice_start_metrics.record_url(signed_url is not None)
+        if signed_url is None:
+            return super()._get_signed_url()
+        # The same query parameters the SDK adds to the URLs it fetches itself
+        separator = "&" if "?" in signed_url else "?"
+        return f"{signed_url}{separator}source=python_sdk&version={__version__}"
+
+
+class FirstAudioTimer(AudioInterface):
+    """
+    Passes everything through to `inner`, recording when the agent's first audio arrives.
+    """
+    def __init__(self, inner: AudioInterface, started: float):
+        self.inner = inner
+        self.started = started
+        self.first_audio: Optional[float] = None
+
+    def start(self, input_callback: Callable[[bytes], None]):
+        self.inner.start(input_callback)
+
+    def stop(self):
+        self.inner.stop()
+
+    def output(self, audio: bytes):
+        if self.first_audio is None:
+            self.first_audio = time.monotonic() - self.started
+            voice_start_metrics.record("first_audio", self.first_audio)
+        self.inner.output(audio)
+
+    def interrupt(self):
+        self.inner.interrupt()
 
-load_dotenv()
 
 class VoiceCounselorRuntime:
     """
@@ -21,18 +64,17 @@ class VoiceCounselorRuntime:
         on_agent_correction: Optional[Callable[[str, str], None]] = None,
         initial_context: Optional[str] = None,
         user_profile: Optional[Dict[str, Any]] = None,
+        audio_interface: Optional[AudioInterface] = None,
     ):
+        self.started = time.monotonic()
         self.agent = agent
         self.on_user_transcript = on_user_transcript or (lambda t: None)
         self.on_agent_response = on_agent_response or (lambda r: None)
         self.on_agent_correction = on_agent_correction or (lambda o, c: None)
 
-        self.api_key = os.getenv("ELEVENLABS_API_KEY")
-        self.agent_id = os.getenv("AGENT_ID_FEMALE") if agent == "female" else os.getenv("AGENT_ID_MALE")
-        if not self.api_key or not self.agent_id:
-            raise RuntimeError("Missing ELEVENLABS_API_KEY or AGENT_ID_* in environment.")
-
-        self.client = ElevenLabs(api_key=self.api_key)
+        # Credentials and the client (with its warm connections) are shared by all sessions of an agent
+        self.api_key, self.agent_id = voice_clients.credentials(agent)
+        self.client = voice_clients.client(agent)
 
         self.user_profile = user_profile or {
             "addiction_type": "Not specified",
@@ -47,11 +89,15 @@ class VoiceCounselorRuntime:
             "Be empathetic, concise, and non-judgmental. Use motivational interviewing techniques."
         )
 
-        self.conversation = Conversation(
+        # Without one, the session uses this machine's microphone and speakers
+        self.audio_interface = audio_interface or DefaultAudioInterface()
+
+        self.conversation = PooledConversation(
             self.client,
             self.agent_id,
+            voice_agent=agent,
             requires_auth=bool(self.api_key),
-            audio_interface=DefaultAudioInterface(),
+            audio_interface=FirstAudioTimer(self.audio_interface, self.started),
             callback_agent_response=self._handle_agent_response,
             callback_agent_response_correction=self._handle_agent_correction,
             callback_user_transcript=self._handle_user_transcript,
@@ -84,6 +130,7 @@ class VoiceCounselorRuntime:
             try:
                 # Start the session (captures audio or does nothing if audio_interface=None)
                 self.conversation.start_session()
+                voice_start_metrics.record("setup", time.monotonic() - self.started)
                 # Block until the SDK signals end of session
                 self._conversation_id = self.conversation.wait_for_session_end()
             except Exception as e:
@@ -0,0 +1,141 @@
+# StepCoachLive/api/services/voice_transcripts.py
+import atexit
+import logging
+import threading
+from typing import List, Optional, Set
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from main.models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptWriter:
+    """
+    Transcript of one voice session. The SDK callbacks (`user`, `agent`) only
+    append to a buffer, so they return in microseconds; the messages are
+    written with one bulk insert by the shared flush thread, as soon as
+    `batch_size` are waiting, and by `close` at the end of the session.
+    The conversation is looked up once, on the first write.
+
+    Writes of a session are serialized, so ids follow the order of the
+    utterances. `timestamp` is auto_now_add, so it is the time of the write,
+    at most `flush_seconds` after the utterance.
+    """
+    def __init__(self, pool: "TranscriptWriters", user_key: str):
+        self.pool = pool
+        self.user_key = user_key
+        self.conversation: Optional[Conversation] = None
+        self.written = 0
+        self._buffer: List[Message] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._closed = False
+
+    def user(self, text: str) -> None:
+        self._append('user', text)
+
+    def agent(self, text: str) -> None:
+        self._append('ai', text)
+
+    def flush(self) -> int:
+        with self._write_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+            try:
+                if self.conversation is None:
+                    self.conversation, _ = Conversation.objects.get_or_create(user_id=self.user_key)
+                for message in batch:
+                    message.conversation = self.conversation
+                with transaction.atomic():
+                    Message.objects.bulk_create(batch)
+                    Conversation.objects.filter(id=self.conversation.id).update(last_updated=timezone.now())
+            except Exception:
+                logger.exception("Writing %s voice transcript messages of user %s failed", len(batch), self.user_key)
+                with self._lock:
+                    self._buffer[:0] = batch
+                return 0
+            self.written += len(batch)
+            return len(batch)
+
+    def close(self) -> int:
+        """
+        Writes what is left and stops; later callbacks are ignored. Call when the session ends.
+        """
+        with self._lock:
+            self._closed = True
+        try:
+            return self.flush()
+        finally:
+            self.pool.discard(self)
+
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def _append(self, role: str, text: str) -> None:
+        if not text:
+            return
+        with self._lock:
+            if self._closed:
+                return
+            self._buffer.append(Message(role=role, content=text))
+            waiting = len(self._buffer)
+        self.pool.track(self, full=waiting >= self.pool.batch_size)
+
+
+class TranscriptWriters:
+    """
+    Creates the TranscriptWriter of each voice session and runs the one thread
+    that flushes all of them every `flush_seconds`. A writer is only tracked
+    once it has something to write, so one that ends up unused (e.g. a second
+    start of an already running session) costs nothing.
+    """
+    def __init__(self, flush_seconds: float = 3.0, batch_size: int = 20):
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._writers: Set[TranscriptWriter] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def open(self, user_key: str) -> TranscriptWriter:
+        return TranscriptWriter(self, user_key)
+
+    def track(self, writer: TranscriptWriter, full: bool = False) -> None:
+        with self._lock:
+            self._writers.add(writer)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="voice-transcripts", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush_all)
+        if full:
+            self._wake.set()
+
+    def discard(self, writer: TranscriptWriter) -> None:
+        with self._lock:
+            self._writers.discard(writer)
+
+    def flush_all(self) -> int:
+        with self._lock:
+            writers = list(self._writers)
+        return sum(writer.flush() for writer in writers)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush_all()
+            finally:
+                close_old_connections()
+
+
+transcript_writers = TranscriptWriters(
+    flush_seconds=settings.VOICE_TRANSCRIPT_FLUSH_SECONDS,
+    batch_size=settings.VOICE_TRANSCRIPT_BATCH_SIZE,
+)
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from main.models import JournalEntry, Quote
+from subscription.models import SubscriptionPlan, UserSubscription
+from .services.quotes import quote_service
+from .services.rate_limit import rate_limiter
+
+
+@receiver(post_save, sender=Quote)
+@receiver(post_delete, sender=Quote)
+def invalidate_quotes(sender, **kwargs):
+    quote_service.invalidate()
+
+
+@receiver(post_save, sender=UserSubscription)
+@receiver(post_delete, sender=UserSubscription)
+def invalidate_user_rate_limits(sender, instance, **kwargs):
+    rate_limiter.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=SubscriptionPlan)
+@receiver(post_delete, sender=SubscriptionPlan)
+def invalidate_plan_rate_limits(sender, **kwargs):
+    rate_limiter.invalidate()
+
+
+# The journal index pulls in NumPy, so it is imported on the first journal change, not at boot
+
+@receiver(post_save, sender=JournalEntry)
+def index_journal_entry(sender, instance, **kwargs):
+    from .services.journal_index import journal_indexer
+    transaction.on_commit(lambda: journal_indexer.entry_saved(instance))
+
+
+@receiver(post_delete, sender=JournalEntry)
+def unindex_journal_entry(sender, instance, **kwargs):
+    from .services.journal_index import journal_indexer
+    transaction.on_commit(lambda: journal_indexer.entry_deleted(instance))
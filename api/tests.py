@@ -1,3 +1,1158 @@
-from django.test import TestCase
+import asyncio
+import io
+import random
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api import async_views
+from api.ai import CRISIS_RESPONSE
+from api.pagination import MessageCursorPagination
+from api.management.commands.bench_message_classifier import SENTENCES, legacy_analyze
+from api.services import extraction_workers
+from api.services.attachment_extraction import AttachmentExtractor
+from api.services.chat_flights import ChatFlights
+from api.services.conversation_summary import conversation_summaries
+from api.services.counselor_sessions import CounselorSessionStore, counselor_sessions
+from api.services.crisis import crisis_follow_ups
+from api.services.embeddings import HashingEmbedder
+from api.services.journal_index import UserJournalIndex
+from api.services.llm_backends import FakeChatModel
+from api.services.llm_resilience import CircuitBreaker, CircuitOpenError, LLMMetrics, ResilientLLM
+from api.services.message_classifier import message_classifier
+from api.services.quotes import quote_service
+from api.services.rate_limit import Limit, LocalBucketBackend, rate_limiter
+from api.services.voice_directory import DatabaseSessionDirectory
+from api.services.voice_registry import VoiceCapacityError, VoiceSessionElsewhere, VoiceSessionRegistry
+from api.services.voice_transcripts import TranscriptWriters
+from main.models import Conversation, CrisisEvent, Message, Quote, VoiceSessionLease
+from subscription.models import SubscriptionPlan, UserSubscription
+
+
+class DeferredExecutor:
+    """
+    Runs submitted jobs when `run` is called, in the test's thread and transaction.
+    """
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args, **kwargs):
+        self.jobs.append((fn, args, kwargs))
+
+    def run(self):
+        while self.jobs:
+            fn, args, kwargs = self.jobs.pop(0)
+            fn(*args, **kwargs)
+
+
+def make_store(**kwargs):
+    store = CounselorSessionStore(**kwargs)
+    store.use_llm(FakeChatModel())
+    return store
+
+
+class CounselorSessionStoreTests(TestCase):
+    def test_users_get_separate_counselors_sharing_one_llm(self):
+        store = make_store()
+        first, second = store.get(1), store.get(2)
+        self.assertIsNot(first, second)
+        self.assertIs(first.llm, second.llm)
+        self.assertIs(store.get("1"), first)
+
+        first.remember_turn("I had a rough day", "I'm sorry to hear that.")
+        self.assertEqual(len(first.history), 2)
+        self.assertEqual(second.history, [])
+
+    def test_least_recently_used_session_is_evicted(self):
+        store = make_store(max_sessions=2)
+        first = store.get(1)
+        store.get(2)
+        store.get(1)
+        store.get(3)
+        self.assertEqual(len(store), 2)
+        self.assertIsNone(store.peek(2))
+        self.assertIs(store.peek(1), first)
+
+    def test_idle_sessions_are_dropped(self):
+        store = make_store(idle_timeout=60)
+        with mock.patch("api.services.counselor_sessions.time.monotonic", return_value=1000.0):
+            first = store.get(1)
+        with mock.patch("api.services.counselor_sessions.time.monotonic", return_value=1061.0):
+            self.assertIsNot(store.get(1), first)
+
+    def test_history_is_rebuilt_from_the_latest_conversation(self):
+        user = User.objects.create_user("sam", password="pw")
+        conversation = Conversation.objects.create(user=user)
+        Message.objects.bulk_create([
+            Message(conversation=conversation, role="user", content="I want to stop drinking"),
+            Message(conversation=conversation, role="ai", content="That's a brave decision."),
+        ])
+
+        counselor = make_store().get(user.id)
+
+        self.assertEqual(
+            [(turn.role, turn.content) for turn in counselor.history],
+            [("user", "I want to stop drinking"), ("ai", "That's a brave decision.")],
+        )
+
+
+class MessageClassifierTests(TestCase):
+    def corpus(self):
+        rng = random.Random(7)
+        return SENTENCES + [" ".join(rng.sample(SENTENCES, rng.randint(2, 6))) for _ in range(500)]
+
+    def test_matches_the_legacy_keyword_scans(self):
+        for message in self.corpus():
+            with self.subTest(message=message):
+                self.assertEqual(message_classifier.classify(message), legacy_analyze(message))
+
+    def test_earlier_rules_win(self):
+        result = message_classifier.classify("I'm drunk and I want to kill myself")
+        self.assertEqual(result["emotional_state"], "craving")
+        self.assertEqual(result["urgency"], "crisis")
+
+    def test_crisis_keywords_match_whole_words(self):
+        for message in ("I just want to END IT.", "Suicide keeps crossing my mind", "I can't go on"):
+            with self.subTest(message=message):
+                self.assertEqual(message_classifier.classify(message)["urgency"], "crisis")
+        for message in ("I'll spend it on a gym pass", "The suicidewatch forum helped", "I can't go online"):
+            with self.subTest(message=message):
+                self.assertEqual(message_classifier.classify(message)["urgency"], "medium")
+
+
+class AttachmentExtractorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.extractor = AttachmentExtractor(timeout=0.05)
+        self.jobs = []
+
+    def start(self, result=None):
+        """
+        Stands in for the process pool: a job that finishes with `result`, or never.
+        """
+        def start(kind, data):
+            future = Future()
+            if result is not None:
+                future.set_result(result)
+            self.jobs.append((kind, future))
+            return future
+        return mock.patch.object(self.extractor, "_start", side_effect=start)
+
+    def test_results_are_cached_by_content(self):
+        with self.start("Step 4 worksheet"):
+            self.assertEqual(self.extractor.extract("image", b"png"), "Step 4 worksheet")
+            self.assertEqual(self.extractor.extract("image", b"png"), "Step 4 worksheet")
+            self.extractor.extract("pdf", b"png")
+        self.assertEqual([kind for kind, _ in self.jobs], ["image", "pdf"])
+
+    def test_identical_uploads_share_a_running_job(self):
+        with self.start():
+            first, second = self.extractor.submit("pdf", b"%PDF"), self.extractor.submit("pdf", b"%PDF")
+        self.assertIs(first, second)
+        first.set_result("Meeting schedule")
+        with self.start():
+            self.assertEqual(self.extractor.extract("pdf", b"%PDF"), "Meeting schedule")
+        self.assertEqual(len(self.jobs), 1)
+
+    def test_timeouts_are_reported_and_not_cached(self):
+        with self.start():
+            self.assertEqual(self.extractor.extract("image", b"png"), "Error processing Image: extraction timed out")
+            self.assertEqual(
+                asyncio.run(self.extractor.aextract("pdf", b"%PDF")), "Error processing PDF: extraction timed out",
+            )
+        # The async wait gave up without cancelling the job
+        self.assertFalse(self.jobs[1][1].cancelled())
+        self.jobs[0][1].set_exception(TimeoutError("extraction timed out"))
+        with self.start("Recovered text"):
+            self.assertEqual(self.extractor.extract("image", b"png"), "Recovered text")
+
+    def test_oversized_files_are_refused(self):
+        self.extractor.max_bytes = 1024 * 1024
+        with self.start("never"):
+            self.assertEqual(
+                self.extractor.extract("pdf", b"%" * (1024 * 1024 + 1)), "Error processing PDF: file is larger than 1 MB",
+            )
+        self.assertEqual(self.jobs, [])
+
+
+class ExtractionWorkerTests(TestCase):
+    def pdf(self, pages):
+        import PyPDF2
+        writer = PyPDF2.PdfWriter()
+        for _ in range(pages):
+            writer.add_blank_page(width=72, height=72)
+        out = io.BytesIO()
+        writer.write(out)
+        return out.getvalue()
+
+    def image(self):
+        from PIL import Image
+        out = io.BytesIO()
+        Image.new("RGB", (40, 20), "white").save(out, format="PNG")
+        return out.getvalue()
+
+    def test_pdf_parsing_stops_at_the_deadline(self):
+        self.assertEqual(extraction_workers.pdf_text(self.pdf(3), max_pages=20, timeout=5), "")
+        with mock.patch("api.services.extraction_workers.time.monotonic", side_effect=[0.0, 0.5, 1.5]):
+            with self.assertRaises(TimeoutError):
+                extraction_workers.pdf_text(self.pdf(3), max_pages=20, timeout=1)
+
+    def test_tesseract_gets_the_timeout(self):
+        with mock.patch("pytesseract.image_to_string", return_value=" Day 12 \n") as ocr:
+            self.assertEqual(extraction_workers.ocr_image(self.image(), max_pixels=10_000, timeout=7), "Day 12")
+        self.assertEqual(ocr.call_args.kwargs["timeout"], 7)
+
+        with mock.patch("pytesseract.image_to_string", side_effect=RuntimeError("Tesseract process timeout")):
+            with self.assertRaises(TimeoutError):
+                extraction_workers.ocr_image(self.image(), max_pixels=10_000, timeout=7)
+
+
+class FakeClock:
+    """
+    Stands in for the `time` module of llm_resilience: sleeping just moves the clock.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class ScriptedModel:
+    """
+    A chat model that plays back one step per call: an exception to raise, a
+    reply, or for streams a list of chunks that may end in an exception. Each
+    call takes `latency` seconds of the fake clock.
+    """
+    def __init__(self, clock, steps, latency=1.0):
+        self.clock = clock
+        self.steps = list(steps)
+        self.latency = latency
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        self.clock.sleep(self.latency)
+        return self.steps.pop(0) if self.steps else "ok"
+
+    def invoke(self, prompt, **kwargs):
+        step = self._next()
+        if isinstance(step, Exception):
+            raise step
+        return step
+
+    def stream(self, prompt, **kwargs):
+        step = self._next()
+        for chunk in step if isinstance(step, list) else [step]:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+
+class ResilientLLMTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("api.services.llm_resilience.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.metrics = LLMMetrics()
+
+    def llm(self, steps, threshold=3, **kwargs):
+        self.model = ScriptedModel(self.clock, steps)
+        kwargs = {"max_retries": 0, "backoff_base": 0, **kwargs}
+        breaker = CircuitBreaker(failure_threshold=threshold, reset_timeout=30, metrics=self.metrics)
+        return ResilientLLM(self.model, breaker=breaker, metrics=self.metrics, **kwargs)
+
+    def outcomes(self):
+        return {name: count for name, count in self.metrics.snapshot()["outcomes"].items() if count}
+
+    def test_opens_after_the_threshold_and_fails_fast(self):
+        llm = self.llm([TimeoutError()] * 3)
+        for _ in range(3):
+            self.assertEqual(llm.breaker.state, "closed")
+            with self.assertRaises(TimeoutError):
+                llm.invoke("hi")
+        self.assertEqual(llm.breaker.state, "open")
+
+        with self.assertRaises(CircuitOpenError):
+            llm.invoke("hi")
+        self.assertEqual(self.model.calls, 3)
+        self.assertEqual(self.outcomes(), {"timeout": 3, "circuit_open": 1})
+
+    def test_half_open_lets_one_trial_through(self):
+        llm = self.llm([TimeoutError()] * 3 + [TimeoutError(), "better"])
+        for _ in range(3):
+            with self.assertRaises(TimeoutError):
+                llm.invoke("hi")
+        self.clock.sleep(30)
+
+        # The trial fails: open again, for another reset_timeout
+        with self.assertRaises(TimeoutError):
+            llm.invoke("hi")
+        self.assertEqual(llm.breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            llm.invoke("hi")
+
+        self.clock.sleep(30)
+        self.assertTrue(llm.breaker.allow())
+        # Only one trial at a time while it has no verdict
+        self.assertFalse(llm.breaker.allow())
+        llm.breaker.record_success()
+        self.assertEqual(llm.invoke("hi"), "better")
+        self.assertEqual(llm.breaker.state, "closed")
+
+    def test_retries_stop_at_the_deadline(self):
+        llm = self.llm([TimeoutError()] * 10, threshold=100, max_retries=5, timeout=10, deadline=25)
+        self.model.latency = 10
+        with self.assertRaises(TimeoutError):
+            llm.invoke("hi")
+        # Attempts end at 10 and 20s; a third one still fits in the remaining 5s, a fourth does not
+        self.assertEqual(self.model.calls, 3)
+        self.assertEqual(self.metrics.snapshot()["retries"], 2)
+
+    def test_a_transient_error_is_retried(self):
+        llm = self.llm([TimeoutError(), "fine"], max_retries=2)
+        self.assertEqual(llm.invoke("hi"), "fine")
+        self.assertEqual(self.outcomes(), {"ok": 1, "timeout": 1})
+
+    def test_a_stream_is_not_retried_after_its_first_chunk(self):
+        llm = self.llm([["Day ", TimeoutError()], ["never"]], max_retries=2)
+        chunks = []
+        with self.assertRaises(TimeoutError):
+            for chunk in llm.stream("hi"):
+                chunks.append(chunk)
+        self.assertEqual(chunks, ["Day "])
+        self.assertEqual(self.model.calls, 1)
+        self.assertEqual(self.outcomes(), {"ok": 1})
+
+    def test_a_stream_failing_before_its_first_chunk_is_retried(self):
+        llm = self.llm([[TimeoutError()], ["Day ", "one"]], max_retries=2)
+        self.assertEqual(list(llm.stream("hi")), ["Day ", "one"])
+        self.assertEqual(self.model.calls, 2)
+
+    def test_non_transient_errors_do_not_trip_the_breaker(self):
+        llm = self.llm([ValueError("bad request")] * 3, threshold=1, max_retries=2)
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                llm.invoke("hi")
+        self.assertEqual(self.model.calls, 3)
+        self.assertEqual(llm.breaker.state, "closed")
+        self.assertEqual(self.outcomes(), {"rejected": 3})
+
+    def test_a_retry_refused_by_the_breaker_raises_the_provider_error(self):
+        llm = self.llm([TimeoutError("upstream"), "never"], threshold=1, max_retries=2)
+        with self.assertRaisesMessage(TimeoutError, "upstream"):
+            llm.invoke("hi")
+        with self.assertRaisesMessage(TimeoutError, "upstream"):
+            list(self.llm([[TimeoutError("upstream")]], threshold=1, max_retries=2).stream("hi"))
+        self.assertEqual(self.model.calls, 1)
+
+
+@override_settings(RATE_LIMITS={})
+class ChatAPITestCase(TestCase):
+    """
+    Posts to ChatView as a fresh user, with the fake LLM and no rate limits.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user("robin", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.llm = FakeChatModel()
+        self.background = DeferredExecutor()
+        counselor_sessions.use_llm(self.llm)
+        rate_limiter.invalidate()
+        for target, value in (
+            ("api.views.chat_flights", ChatFlights()),
+            # Background work runs in the test's thread, inside the test transaction
+            ("api.services.crisis.close_old_connections", lambda: None),
+            ("api.services.counselor_sessions.usage_meter.record", lambda *args, **kwargs: None),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for target, attribute, value in (
+            # Background jobs run once the request is over, as on the pool
+            (crisis_follow_ups, "_executor", self.background),
+            # Its per-conversation turn counts outlive the test, and conversation ids are reused
+            (conversation_summaries, "record_turn", lambda conversation_id: None),
+        ):
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def chat(self, content, **extra):
+        response = self.client.post(reverse("chat_api"), {"content": content}, format="json", **extra)
+        self.background.run()
+        return response
+
+
+class CrisisRoutingTests(ChatAPITestCase):
+    def test_crisis_message_gets_the_vetted_reply_and_an_llm_follow_up(self):
+        with mock.patch.object(FakeChatModel, "_generate", wraps=self.llm._generate) as generate, \
+                self.assertLogs("api.services.crisis", "WARNING"):
+            response = self.chat("I can't go on like this, I want to kill myself")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["response"], CRISIS_RESPONSE)
+        # The one LLM call is the follow-up, made after the reply was decided
+        self.assertEqual(generate.call_count, 1)
+
+        event = CrisisEvent.objects.get()
+        self.assertEqual(event.user, self.user)
+        self.assertEqual(event.response, CRISIS_RESPONSE)
+        self.assertTrue(event.follow_up)
+        self.assertEqual(
+            list(Message.objects.filter(conversation=event.conversation).order_by("id").values_list("role", "content")),
+            [
+                ("user", "I can't go on like this, I want to kill myself"),
+                ("ai", CRISIS_RESPONSE),
+                ("ai", event.follow_up),
+            ],
+        )
+
+    def test_follow_up_waits_for_the_turn_and_bumps_the_conversation(self):
+        counselor = counselor_sessions.get(self.user.id)
+        held = []
+        with mock.patch.object(counselor, "crisis_follow_up", side_effect=lambda message: held.append(counselor.lock.locked()) or "Still here with you."), \
+                self.assertLogs("api.services.crisis", "WARNING"):
+            response = self.client.post(reverse("chat_api"), {"content": "I want to end it"}, format="json")
+            # The turn is over and its lock released before the follow-up takes it
+            self.assertFalse(counselor.lock.locked())
+            self.assertEqual(held, [])
+            self.background.run()
+
+        self.assertEqual(held, [True])
+        self.assertFalse(counselor.lock.locked())
+        follow_up = Message.objects.get(content="Still here with you.")
+        conversation = Conversation.objects.get(id=follow_up.conversation_id)
+        self.assertGreaterEqual(conversation.last_updated, follow_up.timestamp)
+        self.assertEqual(response.data["response"], CRISIS_RESPONSE)
+
+    def test_other_messages_go_to_the_llm(self):
+        response = self.chat("I went for a long walk today")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data["response"], CRISIS_RESPONSE)
+        self.assertFalse(CrisisEvent.objects.exists())
+
+    def test_words_containing_a_crisis_keyword_go_to_the_llm(self):
+        messages = (
+            "I got my first paycheck sober and want to spend it on a gym pass",
+            "The Tuesday meeting is small but I attend it every week",
+            "My sponsor lent me a book and I recommend it",
+        )
+        with mock.patch.object(FakeChatModel, "_generate", wraps=self.llm._generate) as generate:
+            responses = [self.chat(message) for message in messages]
+
+        self.assertEqual([response.status_code for response in responses], [200] * 3)
+        self.assertNotIn(CRISIS_RESPONSE, [response.data["response"] for response in responses])
+        self.assertEqual(generate.call_count, 3)
+        self.assertFalse(CrisisEvent.objects.exists())
+
+    def test_a_failing_follow_up_keeps_the_event(self):
+        with mock.patch.object(FakeChatModel, "_generate", side_effect=RuntimeError("LLM down")), \
+                self.assertLogs("api.services.crisis", "WARNING") as logs:
+            response = self.chat("I think I should just end it")
+
+        self.assertIn("Crisis follow-up for event", logs.output[-1])
+
+        self.assertEqual(response.data["response"], CRISIS_RESPONSE)
+        event = CrisisEvent.objects.get()
+        self.assertEqual(event.follow_up, "")
+
+
+class UserJournalIndexTests(TestCase):
+    def setUp(self):
+        self.embedder = HashingEmbedder(dim=64)
+        self.index = UserJournalIndex(self.embedder, top_k=3, min_score=0.1)
+
+    def add(self, entry_id, text):
+        self.index.upsert(entry_id, self.embedder.embed([text])[0], text)
+
+    def test_saves_and_deletes_change_what_is_found(self):
+        self.add(1, "walked by the lake at sunrise")
+        self.add(2, "argued with my brother about money")
+        self.assertEqual([hit.entry_id for hit in self.index.search("the lake at sunrise")], [1])
+
+        self.add(1, "slept badly and skipped breakfast")
+        self.assertEqual(self.index.search("the lake at sunrise"), [])
+        self.index.remove(2)
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.search("argued with my brother"), [])
+
+    def test_a_search_during_a_write_sees_one_version(self):
+        self.add(1, "walked by the lake at sunrise")
+        vstack, seen = np.vstack, []
+
+        def interleaved(*args, **kwargs):
+            # A search that lands while upsert is building the new version
+            seen.append(self.index.search("walked by the lake"))
+            return vstack(*args, **kwargs)
+
+        with mock.patch("api.services.journal_index.np.vstack", side_effect=interleaved):
+            self.add(2, "walked to the lake with my sponsor")
+        self.assertEqual([[hit.entry_id for hit in hits] for hits in seen], [[1]])
+        self.assertEqual(len(self.index.search("walked by the lake")), 2)
+
+
+class QuoteOfTheDayTests(TestCase):
+    def setUp(self):
+        # The service is process-wide; start every test from an empty copy
+        quote_service.invalidate()
+        self.addCleanup(quote_service.invalidate)
+        Quote.objects.create(text="One day at a time.", author="AA")
+        self.url = reverse("quote-of-the-day")
+
+    def test_a_matching_etag_gets_a_304_until_the_quote_changes(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        etag = first["ETag"]
+
+        # Served from the in-process copy, without touching the table
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached["ETag"], etag)
+
+        quote = Quote.objects.get(id=quote_service.of_the_day().quote.id)
+        quote.text = "Progress, not perfection."
+        quote.save()
+
+        fresh = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual(fresh.json()["text"], "Progress, not perfection.")
+        self.assertNotEqual(fresh["ETag"], etag)
+
+
+class RateLimitTests(TestCase):
+    def test_limit_parsing(self):
+        self.assertEqual(Limit.parse("30/minute"), Limit(30, 0.5))
+        self.assertEqual(Limit.parse("3/hour"), Limit(3, 3 / 3600))
+        self.assertEqual(Limit.parse("10/s"), Limit(10, 10.0))
+        self.assertEqual(Limit.parse({"rate": "30/hour", "burst": 5}), Limit(5, 30 / 3600))
+        self.assertEqual(Limit.parse({"rate": "20/day"}), Limit(20, 20 / 86400))
+
+    def test_bucket_refills_at_the_rate_up_to_the_burst(self):
+        backend, limit = LocalBucketBackend(), Limit(burst=2, per_second=0.5)
+        self.assertEqual(backend.take("chat:1", limit, 100.0), (True, 1.0))
+        self.assertEqual(backend.take("chat:1", limit, 100.0), (True, 0.0))
+        self.assertEqual(backend.take("chat:1", limit, 101.0), (False, 0.5))
+        self.assertEqual(backend.take("chat:1", limit, 102.0), (True, 0.0))
+        # Other keys have their own bucket, and a long pause refills only up to the burst
+        self.assertEqual(backend.take("chat:2", limit, 102.0), (True, 1.0))
+        self.assertEqual(backend.take("chat:1", limit, 1000.0), (True, 1.0))
+
+    def test_least_recently_used_buckets_are_dropped(self):
+        backend, limit = LocalBucketBackend(max_keys=2), Limit(burst=1, per_second=0.001)
+        for key in ("a", "b", "a", "c"):
+            backend.take(key, limit, 0.0)
+        self.assertEqual(backend.take("a", limit, 0.0), (False, 0.0))
+        # "b" was used least recently, so it starts full again
+        self.assertEqual(backend.take("b", limit, 0.0), (True, 0.0))
+
+
+@override_settings(RATE_LIMITS={"free": {"chat": {"rate": "60/minute", "burst": 2}}})
+class ChatRateLimitTests(ChatAPITestCase):
+    def test_requests_past_the_burst_get_429_with_retry_after(self):
+        with mock.patch("api.services.rate_limit.time.time", return_value=1000.0):
+            first, second, refused = (self.chat(f"check-in {n}") for n in range(3))
+
+        self.assertEqual([first.status_code, second.status_code], [200, 200])
+        self.assertEqual((first["RateLimit-Limit"], first["RateLimit-Remaining"]), ("2", "1"))
+        self.assertEqual(second["RateLimit-Remaining"], "0")
+        self.assertNotIn("Retry-After", second)
+
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual(refused["Retry-After"], "1")
+        self.assertEqual(refused["RateLimit-Remaining"], "0")
+        self.assertEqual(refused["RateLimit-Reset"], "2")
+        self.assertEqual(Message.objects.filter(role="user").count(), 2)
+
+        with mock.patch("api.services.rate_limit.time.time", return_value=1001.0):
+            self.assertEqual(self.chat("check-in 3").status_code, 200)
+
+    @override_settings(RATE_LIMITS={"free": {"chat": "5/hour"}, "monthly": {"chat": "300/hour", "voice": "20/hour"}})
+    def test_limits_follow_the_plan(self):
+        self.assertEqual(rate_limiter.limits_for(self.user.id), {"chat": Limit(5, 5 / 3600)})
+
+        # Subscribing drops the cached free limits; the plan's features override its plan_type
+        plan = SubscriptionPlan.objects.create(
+            name="Monthly", price=10, plan_type="monthly", stripe_price_id="price_1",
+            features={"rate_limits": {"chat": {"rate": "600/hour", "burst": 50}, "voice": None}},
+        )
+        UserSubscription.objects.create(
+            user=self.user, plan=plan, status="active", current_period_end=timezone.now() + timedelta(days=30),
+        )
+        self.assertEqual(rate_limiter.limits_for(self.user.id), {"chat": Limit(50, 600 / 3600)})
+
+
+class ChatFlightsTests(TestCase):
+    def test_keyless_requests_share_only_a_turn_in_flight(self):
+        flights, key = ChatFlights(), ChatFlights().key(1, None, ["text", "yes"])
+        started, release = threading.Event(), threading.Event()
+        results = []
+
+        def leader():
+            started.set()
+            release.wait(5)
+            return {"response": "first"}
+
+        thread = threading.Thread(target=lambda: results.append(flights.run(key, leader)))
+        thread.start()
+        started.wait(5)
+        flight, leads = flights.begin(key)
+        self.assertFalse(leads)
+        release.set()
+        thread.join(5)
+        self.assertEqual(flights.wait(flight), {"response": "first"})
+        self.assertEqual(results, [({"response": "first"}, False)])
+
+        # Sent again after it finished: a new turn
+        self.assertEqual(flights.run(key, lambda: {"response": "second"}), ({"response": "second"}, False))
+
+    def test_finished_turns_are_replayed_for_the_same_key(self):
+        flights = ChatFlights(key_replay_seconds=60)
+        key = flights.key(1, "retry-1", ["text", "yes"])
+        self.assertEqual(flights.run(key, lambda: {"response": "first"}), ({"response": "first"}, False))
+        self.assertEqual(flights.run(key, lambda: {"response": "second"}), ({"response": "first"}, True))
+        # Another user's key is their own
+        self.assertEqual(
+            flights.run(flights.key(2, "retry-1", ["text", "yes"]), lambda: {"response": "other"}),
+            ({"response": "other"}, False),
+        )
+        with mock.patch("api.services.chat_flights.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertEqual(flights.run(key, lambda: {"response": "third"}), ({"response": "third"}, False))
+
+    def test_failures_are_not_replayed(self):
+        flights = ChatFlights()
+        key = flights.key(1, "retry-1", ["text", "yes"])
+        with self.assertRaises(RuntimeError):
+            flights.run(key, mock.Mock(side_effect=RuntimeError("LLM down")))
+        self.assertEqual(flights.run(key, lambda: {"response": "ok"}), ({"response": "ok"}, False))
+
+
+class ChatDuplicateTests(ChatAPITestCase):
+    def user_messages(self):
+        return Message.objects.filter(role="user").count()
+
+    def test_the_same_message_sent_twice_is_two_turns(self):
+        with mock.patch.object(FakeChatModel, "_generate", wraps=self.llm._generate) as generate:
+            self.assertEqual(self.chat("yes").status_code, 200)
+            self.assertEqual(self.chat("yes").status_code, 200)
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual(self.user_messages(), 2)
+
+    def test_a_retry_with_the_idempotency_key_is_replayed(self):
+        with mock.patch.object(FakeChatModel, "_generate", wraps=self.llm._generate) as generate:
+            first = self.chat("yes", HTTP_IDEMPOTENCY_KEY="turn-1")
+            retry = self.chat("yes", HTTP_IDEMPOTENCY_KEY="turn-1")
+            self.chat("yes", HTTP_IDEMPOTENCY_KEY="turn-2")
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual(self.user_messages(), 2)
+
+
+class LoopCheckingJournal:
+    def __init__(self):
+        self.on_event_loop = None
+
+    def context(self, text):
+        try:
+            asyncio.get_running_loop()
+            self.on_event_loop = True
+        except RuntimeError:
+            self.on_event_loop = False
+        return ""
+
+
+class AsyncChatTests(ChatAPITestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("api.async_views.chat_flights", ChatFlights())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.async_client = AsyncClient()
+        self.auth = {"Authorization": f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+
+    async def test_journal_lookup_runs_off_the_event_loop(self):
+        counselor = await sync_to_async(counselor_sessions.get)(self.user.id)
+        counselor.journal = LoopCheckingJournal()
+        await counselor.aprocess_message("I journaled about my cravings")
+        self.assertIs(counselor.journal.on_event_loop, False)
+
+    async def test_a_cancelled_stream_settles_its_flight(self):
+        self.llm.tokens_per_second = 20
+        conversation = await Conversation.objects.acreate(user=self.user)
+        counselor = await sync_to_async(counselor_sessions.get)(self.user.id)
+        flight, _ = async_views.chat_flights.begin(f"{self.user.id}:key:stream-1")
+        response = async_views.AsyncChatView().stream_response(self.user, counselor, conversation, "Long day", flight=flight)
+
+        first_token = asyncio.Event()
+
+        async def read():
+            async for _ in response.streaming_content:
+                first_token.set()
+
+        reader = asyncio.create_task(read())
+        await first_token.wait()
+        # The client went away mid-stream
+        reader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await reader
+
+        self.assertTrue(flight.done.is_set())
+        self.assertIsNone(flight.error)
+        self.assertTrue(flight.result["response"])
+        self.assertFalse(counselor.lock.locked())
+        roles = [role async for role in Message.objects.filter(conversation=conversation).values_list("role", flat=True)]
+        self.assertEqual(roles, ["user", "ai"])
+
+    async def test_concurrent_turns_of_a_user_take_turns(self):
+        self.llm.first_token_ms = 100
+        prompts, active, overlapped = [], 0, False
+        generate = self.llm._agenerate
+
+        async def tracking(messages, *args, **kwargs):
+            nonlocal active, overlapped
+            active += 1
+            overlapped = overlapped or active > 1
+            prompts.append("\n".join(str(m.content) for m in messages))
+            try:
+                return await generate(messages, *args, **kwargs)
+            finally:
+                active -= 1
+
+        contents = ("First I called my sponsor", "Then I went to a meeting")
+        with mock.patch.object(FakeChatModel, "_agenerate", side_effect=tracking):
+            responses = await asyncio.gather(*(
+                self.async_client.post(
+                    reverse("async_chat_api"), {"content": content}, content_type="application/json", headers=self.auth,
+                )
+                for content in contents
+            ))
+
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertFalse(overlapped)
+        # The second turn saw the first one in its history
+        self.assertTrue(all(content in prompts[1] for content in contents))
+        roles = [turn.role for turn in (await sync_to_async(counselor_sessions.get)(self.user.id)).history]
+        self.assertEqual(roles, ["user", "ai", "user", "ai"])
+
+
+class MessageCursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("kai", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.conversation = Conversation.objects.create(user=self.user)
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, role="user", content=f"message {n}") for n in range(7)
+        ])
+        self.ids = list(Message.objects.order_by("id").values_list("id", flat=True))
+        # Messages 2-4 share a timestamp, so the id has to break the tie
+        start = timezone.now()
+        for n, pk in enumerate(self.ids):
+            Message.objects.filter(id=pk).update(timestamp=start + timedelta(seconds=min(n, 2) if n < 5 else n))
+
+    def page(self, **params):
+        response = self.client.get(
+            reverse("conversation_messages", args=[self.conversation.id]), {"limit": 3, **params},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_newest_page_comes_first_oldest_first(self):
+        page = self.page()
+        self.assertEqual([m["id"] for m in page["results"]], self.ids[-3:])
+        self.assertIsNotNone(page["older"])
+        self.assertIsNone(page["newer"])
+
+    def test_paging_back_and_forth_visits_every_message_once(self):
+        seen, page = [], self.page()
+        while True:
+            seen[:0] = [m["id"] for m in page["results"]]
+            if page["older"] is None:
+                break
+            page = self.page(before=page["older"])
+        self.assertEqual(seen, self.ids)
+
+        seen = [m["id"] for m in page["results"]]
+        while page["newer"] is not None:
+            page = self.page(after=page["newer"])
+            seen += [m["id"] for m in page["results"]]
+        self.assertEqual(seen, self.ids)
+
+    def test_newer_cursor_picks_up_messages_added_later(self):
+        newest = Message.objects.get(id=self.ids[-1])
+        latest = Message.objects.create(conversation=self.conversation, role="ai", content="late reply")
+        Message.objects.filter(id=latest.id).update(timestamp=newest.timestamp + timedelta(seconds=1))
+
+        page = self.page(after=MessageCursorPagination.encode(newest))
+        self.assertEqual([m["id"] for m in page["results"]], [latest.id])
+        self.assertIsNone(page["newer"])
+
+    def test_invalid_cursor_and_foreign_conversation_are_not_found(self):
+        url = reverse("conversation_messages", args=[self.conversation.id])
+        self.assertEqual(self.client.get(url, {"before": "not-a-cursor"}).status_code, 404)
+        self.assertEqual(self.client.get(url, {"before": "x", "after": "y"}).status_code, 404)
+
+        other = Conversation.objects.create(user=User.objects.create_user("lee", password="pw"))
+        self.assertEqual(self.client.get(reverse("conversation_messages", args=[other.id])).status_code, 404)
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(len(self.page(limit=0)["results"]), 1)
+        self.assertEqual(MessageCursorPagination().max_page_size, 100)
+
+
+class MessageSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("fay", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.conversation = Conversation.objects.create(user=self.user)
+
+    def search(self, **params):
+        response = self.client.get(reverse("message_search"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_best_match_ranks_first_however_old(self):
+        best = Message.objects.create(conversation=self.conversation, role="user", content="craving craving craving")
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, role="user", content=f"long day at work, a small craving at {n}pm, then dinner and a walk")
+            for n in range(250)
+        ])
+        results = self.search(q="craving", limit=5)["results"]
+        self.assertEqual(results[0]["id"], best.id)
+        self.assertIn("<mark>", results[0]["snippet"])
+
+    def test_pages_reach_every_match(self):
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, role="ai", content=f"sponsor call number {n}") for n in range(230)
+        ])
+        Message.objects.create(conversation=self.conversation, role="user", content="no match here")
+        other = Conversation.objects.create(user=User.objects.create_user("gus", password="pw"))
+        Message.objects.create(conversation=other, role="user", content="my sponsor")
+
+        seen, offset = [], 0
+        while offset is not None:
+            page = self.search(q="sponsor", limit=50, offset=offset)
+            seen += [hit["id"] for hit in page["results"]]
+            offset = page["next_offset"]
+        self.assertEqual(len(seen), 230)
+        self.assertEqual(set(seen), set(
+            Message.objects.filter(conversation=self.conversation, role="ai").values_list("id", flat=True)
+        ))
+
+    def test_filters_and_empty_queries(self):
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, role="user", content="went to the gym"),
+            Message(conversation=self.conversation, role="ai", content="the gym helps"),
+        ])
+        self.assertEqual([hit["role"] for hit in self.search(q="gym", role="ai")["results"]], ["ai"])
+        self.assertEqual(self.search(q="?!")["results"], [])
+        self.assertEqual(self.client.get(reverse("message_search"), {"q": "gym", "role": "x"}).status_code, 400)
+
+
+class FakeVoiceRuntime:
+    """
+    Stands in for VoiceCounselorRuntime, which needs ElevenLabs.
+    """
+    created = []
+
+    def __init__(self, agent="male", **callbacks):
+        self.agent = agent
+        self.callbacks = callbacks
+        self.running = False
+        FakeVoiceRuntime.created.append(self)
+
+    def start(self):
+        self.running = True
+
+    def is_running(self):
+        return self.running
+
+    def end(self):
+        self.running = False
+        return f"conversation-{id(self)}"
+
+
+@override_settings(VOICE_SESSION_DIRECTORY="")
+class VoiceSessionRegistryTests(TestCase):
+    def setUp(self):
+        FakeVoiceRuntime.created = []
+        self.clock = 1000.0
+        for target, value in (
+            ("api.services.voice_runtime.VoiceCounselorRuntime", FakeVoiceRuntime),
+            ("api.services.voice_registry.time.monotonic", lambda: self.clock),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def registry(self, **kwargs):
+        # The reaper thread never gets to run; the tests call reap() themselves
+        return VoiceSessionRegistry(**{"reap_interval": 3600, **kwargs})
+
+    def test_a_user_at_the_cap_gets_their_session_back(self):
+        registry = self.registry(max_per_user=1)
+        runtime = registry.start("1", agent="female")
+        self.assertIs(registry.start("1"), runtime)
+        self.assertEqual(len(FakeVoiceRuntime.created), 1)
+        self.assertIs(registry.get("1"), runtime)
+        self.assertEqual(registry.active(), 1)
+
+    def test_the_process_cap_refuses_new_users(self):
+        registry = self.registry(max_sessions=2)
+        registry.start("1")
+        registry.start("2")
+        with self.assertRaises(VoiceCapacityError):
+            registry.start("3")
+
+        registry.end("1")
+        self.assertIsNotNone(registry.start("3"))
+
+    def test_end_stops_the_runtime_and_runs_on_end(self):
+        registry, ended = self.registry(), []
+        runtime = registry.start("1", on_end=lambda: ended.append("1"))
+
+        self.assertEqual(registry.end("1"), f"conversation-{id(runtime)}")
+        self.assertFalse(runtime.running)
+        self.assertEqual(ended, ["1"])
+        self.assertIsNone(registry.get("1"))
+        self.assertIsNone(registry.end("1"))
+
+    def test_reaper_ends_idle_over_long_and_dead_sessions(self):
+        registry, ended = self.registry(max_duration=600, idle_timeout=60), []
+        idle = registry.start("idle", on_end=lambda: ended.append("idle"))
+        talking = registry.start("talking", on_end=lambda: ended.append("talking"))
+        dead = registry.start("dead", on_end=lambda: ended.append("dead"))
+        dead.running = False
+
+        self.clock += 50
+        talking.callbacks["on_user_transcript"]("Still here")
+        self.clock += 20
+        self.assertEqual(registry.reap(), 2)
+        self.assertCountEqual(ended, ["idle", "dead"])
+        self.assertFalse(idle.running)
+        self.assertIs(registry.get("talking"), talking)
+
+        # Talking all along, but past max_duration
+        for _ in range(10):
+            self.clock += 55
+            talking.callbacks["on_agent_response"]("Go on")
+        self.assertEqual(registry.reap(), 1)
+        self.assertEqual(registry.active(), 0)
+
+    def test_a_dead_session_is_cleaned_up_when_the_user_starts_again(self):
+        registry, ended = self.registry(), []
+        dead = registry.start("1", on_end=lambda: ended.append("dead"))
+        dead.running = False
+
+        fresh = registry.start("1", on_end=lambda: ended.append("fresh"))
+        self.assertIsNot(fresh, dead)
+        self.assertEqual(ended, ["dead"])
+        self.assertEqual(registry.active(), 1)
+
+    def test_a_dead_session_is_cleaned_up_even_when_the_process_is_full(self):
+        registry, ended = self.registry(max_sessions=2), []
+        dead = registry.start("1", on_end=lambda: ended.append("1"))
+        registry.start("2")
+        registry.max_sessions = 1
+        dead.running = False
+
+        with self.assertRaises(VoiceCapacityError):
+            registry.start("1")
+        self.assertEqual(ended, ["1"])
+        self.assertIsNone(registry.get("1"))
+
+    def test_the_transcript_of_a_dead_session_is_written_and_let_go(self):
+        user = User.objects.create_user("pia", password="pw")
+        writers = TranscriptWriters(batch_size=100)
+        transcript = writers.open(str(user.id))
+        registry = self.registry()
+        dead = registry.start(str(user.id), on_user_transcript=transcript.user, on_end=transcript.close)
+        dead.callbacks["on_user_transcript"]("I made it to the meeting")
+        dead.running = False
+
+        registry.start(str(user.id))
+        self.assertEqual(writers.flush_all(), 0)
+        self.assertEqual(list(Message.objects.values_list("content", flat=True)), ["I made it to the meeting"])
+
+    def test_a_failed_start_frees_its_place(self):
+        registry, ended = self.registry(max_sessions=1), []
+        with mock.patch.object(FakeVoiceRuntime, "start", side_effect=RuntimeError("no signed URL")):
+            with self.assertRaises(RuntimeError):
+                registry.start("1", on_end=lambda: ended.append("1"))
+        self.assertEqual(ended, ["1"])
+        self.assertEqual(registry.active(), 0)
+        self.assertIsNotNone(registry.start("2"))
+
+
+class DatabaseSessionDirectoryTests(TestCase):
+    def setUp(self):
+        self.user_key = str(User.objects.create_user("noa", password="pw").id)
+        # Two workers of the same process still get their own owner id
+        self.first, self.second = DatabaseSessionDirectory(dead_after=10), DatabaseSessionDirectory(dead_after=10)
+
+    def lease(self):
+        return VoiceSessionLease.objects.filter(user_id=self.user_key).first()
+
+    def stop_heartbeat(self, seconds=11):
+        VoiceSessionLease.objects.update(heartbeat_at=timezone.now() - timedelta(seconds=seconds))
+
+    def test_one_worker_holds_a_user_until_it_releases_them(self):
+        self.assertTrue(self.first.claim(self.user_key, "female"))
+        self.assertFalse(self.second.claim(self.user_key))
+        self.assertTrue(self.first.claim(self.user_key, "male"))
+        self.assertEqual((self.lease().owner, self.lease().agent), (self.first.owner, "male"))
+
+        self.second.release(self.user_key)
+        self.assertIsNotNone(self.lease())
+        self.first.release(self.user_key)
+        self.assertTrue(self.second.claim(self.user_key))
+
+    def test_heartbeats_keep_the_claim_and_a_dead_owner_is_taken_over(self):
+        self.first.claim(self.user_key)
+        self.stop_heartbeat(seconds=8)
+        self.assertEqual(self.first.heartbeat(), [])
+        self.stop_heartbeat(seconds=8)
+        self.assertFalse(self.second.claim(self.user_key))
+
+        self.stop_heartbeat()
+        self.assertTrue(self.second.claim(self.user_key))
+        self.assertEqual(self.lease().owner, self.second.owner)
+
+    def test_request_end_is_handed_to_the_owner_without_waiting(self):
+        self.assertFalse(self.second.request_end(self.user_key))
+        self.first.claim(self.user_key)
+
+        self.assertTrue(self.second.request_end(self.user_key))
+        self.assertIsNotNone(self.lease().end_requested_at)
+        self.assertEqual(self.first.heartbeat(), [self.user_key])
+
+        self.stop_heartbeat()
+        self.assertFalse(self.second.request_end(self.user_key))
+        self.assertIsNone(self.lease())
+
+
+class VoiceSessionHandOffTests(TestCase):
+    """
+    Two workers' registries sharing the lease table.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user("ola", password="pw")
+        self.user_key = str(self.user.id)
+        patcher = mock.patch("api.services.voice_runtime.VoiceCounselorRuntime", FakeVoiceRuntime)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.owner, self.other = (self.registry() for _ in range(2))
+
+    def registry(self):
+        registry = VoiceSessionRegistry(reap_interval=3600)
+        registry._directory, registry._directory_loaded = DatabaseSessionDirectory(dead_after=10), True
+        return registry
+
+    def test_sessions_are_ended_by_the_worker_running_them(self):
+        ended = []
+        runtime = self.owner.start(self.user_key, on_end=lambda: ended.append(self.user_key))
+        with self.assertRaises(VoiceSessionElsewhere):
+            self.other.start(self.user_key)
+        with self.assertRaises(VoiceSessionElsewhere):
+            self.other.end(self.user_key)
+        self.assertTrue(runtime.running)
+
+        self.owner.heartbeat()
+        self.assertFalse(runtime.running)
+        self.assertEqual(ended, [self.user_key])
+        self.assertFalse(VoiceSessionLease.objects.exists())
+        self.assertIsNotNone(self.other.start(self.user_key))
+
+    def test_delete_returns_202_while_another_worker_ends_the_session(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        VoiceSessionLease.objects.create(user=self.user, owner="other-host:1:abc")
+        with mock.patch("api.views.voice_registry", self.other):
+            response = client.delete(reverse("voice_session"))
+            self.assertEqual(response.status_code, 202)
+            self.assertIsNotNone(VoiceSessionLease.objects.get().end_requested_at)
+
+            VoiceSessionLease.objects.all().delete()
+            response = client.delete(reverse("voice_session"))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, {"status": "ended", "conversation_id": None})
+
+
+class TranscriptWriterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("ren", password="pw")
+        # No flush thread: `tick` runs its loop body in the test's thread and transaction
+        patcher = mock.patch.object(TranscriptWriters, "_run")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.writers = TranscriptWriters(flush_seconds=3, batch_size=3)
+        self.transcript = self.writers.open(str(self.user.id))
+
+    def tick(self):
+        """
+        One pass of the flush thread; returns True if a full batch woke it before the timer.
+        """
+        woken = self.writers._wake.is_set()
+        self.writers._wake.clear()
+        self.writers.flush_all()
+        return woken
+
+    def written(self):
+        return list(Message.objects.order_by("id").values_list("role", "content"))
+
+    def test_lines_are_written_in_order_by_size_timer_and_close(self):
+        lookups = mock.patch.object(Conversation.objects, "get_or_create", wraps=Conversation.objects.get_or_create)
+        with lookups as get_or_create:
+            self.transcript.user("Hi")
+            self.transcript.agent("Hello, how are you?")
+            self.assertEqual(self.written(), [])
+            self.transcript.user("Rough day")
+            self.assertTrue(self.tick())
+            self.assertEqual(len(self.written()), 3)
+
+            self.transcript.agent("What happened?")
+            self.transcript.user("Craving")
+            self.assertFalse(self.tick())
+            self.transcript.agent("Let's breathe")
+            self.assertEqual(self.transcript.close(), 1)
+            self.transcript.user("Too late")
+
+        self.assertEqual(self.written(), [
+            ("user", "Hi"), ("ai", "Hello, how are you?"), ("user", "Rough day"),
+            ("ai", "What happened?"), ("user", "Craving"), ("ai", "Let's breathe"),
+        ])
+        self.assertEqual(get_or_create.call_count, 1)
+        self.assertEqual(Conversation.objects.get().user, self.user)
+        self.assertEqual(self.writers.flush_all(), 0)
+
+    def test_a_failed_write_keeps_its_place_ahead_of_later_lines(self):
+        self.transcript.user("First")
+        with mock.patch.object(Message.objects, "bulk_create", side_effect=RuntimeError("db down")):
+            with self.assertLogs("api.services.voice_transcripts", "ERROR"):
+                self.assertEqual(self.transcript.flush(), 0)
+        self.transcript.agent("Second")
+        self.assertEqual(self.transcript.pending(), 2)
+
+        self.assertEqual(self.transcript.close(), 2)
+        self.assertEqual(self.written(), [("user", "First"), ("ai", "Second")])
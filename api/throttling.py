@@ -0,0 +1,47 @@
+# StepCoachLive/api/throttling.py
+from rest_framework.throttling import BaseThrottle
+
+from .services.rate_limit import rate_limiter
+
+
+class PlanRateThrottle(BaseThrottle):
+    """
+    Token-bucket throttle with the limits of the user's subscription plan.
+
+    Only `methods` are counted, so e.g. ending a voice session is never
+    refused. The decision is kept on the request for RateLimitHeadersMixin.
+    """
+    scope = None
+    methods = ('POST',)
+
+    def allow_request(self, request, view):
+        if request.method not in self.methods or not request.user.is_authenticated:
+            return True
+        self.decision = rate_limiter.hit(request.user.id, self.scope)
+        request.rate_limit = self.decision
+        return self.decision is None or self.decision.allowed
+
+    def wait(self):
+        return self.decision.retry_after
+
+
+class ChatRateThrottle(PlanRateThrottle):
+    scope = 'chat'
+
+
+class VoiceRateThrottle(PlanRateThrottle):
+    scope = 'voice'
+
+
+class RateLimitHeadersMixin:
+    """
+    Adds the RateLimit-* (and on 429, Retry-After) headers of PlanRateThrottle
+    to every response of the view, including streamed ones.
+    """
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        decision = getattr(request, 'rate_limit', None)
+        if decision is not None:
+            for header, value in decision.headers().items():
+                response[header] = value
+        return response
@@ -1,7 +1,8 @@
 # urls.py - Complete the URL configuration for the API
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from django.views.decorators.csrf import csrf_exempt
+from . import views, async_views
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -51,6 +52,7 @@ urlpatterns = [
     path('favorite-journals/', views.FavoriteJournalEntriesView.as_view(), name='favorite-journal-entries'),
     path('journals/<int:pk>/', views.JournalEntryDetailView.as_view(), name='journal-entry-detail'),
     path('motivational-quote/', views.MotivationalQuoteAPIView.as_view(), name='motivational-quote-api'),
+    path('quotes/today/', views.QuoteOfTheDayView.as_view(), name='quote-of-the-day'),
     
     path('suggestions/', views.SuggestionLiarView.as_view(), name='suggestions'),
     path('suggestions/<int:pk>', views.SuggestionDetailsView.as_view(), name='suggestions'),
@@ -70,7 +72,18 @@ urlpatterns = [
 
     path('chat/', views.ChatView.as_view(), name='chat_api'),
     path('conversation-history/', views.ConversationHistoryView.as_view(), name='conversation_history'),
+    path('conversations/', views.ConversationListView.as_view(), name='conversation_list'),
+    path('conversations/<int:conversation_id>/messages/', views.ConversationMessagesView.as_view(), name='conversation_messages'),
+    path('messages/search/', views.MessageSearchView.as_view(), name='message_search'),
     path('voice/session/', views.VoiceSessionView.as_view(), name='voice_session'),  # NEW
+    path('usage/daily/', views.UsageReportView.as_view(), name='usage_daily'),
+    path('llm/metrics/', views.LLMMetricsView.as_view(), name='llm_metrics'),
+    path('voice/metrics/', views.VoiceMetricsView.as_view(), name='voice_metrics'),
+
+    # Async variants for ASGI deployments (JWT auth, no session cookies, so CSRF does not apply)
+    path('async/chat/', csrf_exempt(async_views.AsyncChatView.as_view()), name='async_chat_api'),
+    path('async/conversation-history/', async_views.AsyncConversationHistoryView.as_view(), name='async_conversation_history'),
+    path('async/voice/session/', csrf_exempt(async_views.AsyncVoiceSessionView.as_view()), name='async_voice_session'),
 ]
 
 # Static files handling (e.g., media files)
@@ -1,25 +1,27 @@
+import json
 import random
-import stripe
 from tokenize import TokenError
 from django.shortcuts import render
 from django.contrib.auth.models import User
 from django.utils import timezone 
+from django.utils.dateparse import parse_date, parse_datetime
 from datetime import timedelta, date
 from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
-from django.http import JsonResponse
+from django.utils.functional import SimpleLazyObject
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import authenticate, login
 import datetime
-import openai
 from rest_framework.exceptions import NotFound
 from django.core.mail import send_mail
 from django.contrib.auth.hashers import make_password
 
-from api.ai import AICounselor
 from main.models import Conversation, DayPerWeek, EmailVerification, Message, MilestoneProgress, MoneySaved, PasswordResetCode, Profile, Addiction, OnboardingData, ProgressQuestion, ProgressAnswer, ProgressResponse, RecoveryMilestone, Report, TargetGoal, Timer, PrivacyPolicy, TermsConditions, SupportContact, AddictionOption, ImproveQuestion, ImproveQuestionOption, MilestoneQuestion, MilestoneOption, JournalEntry, Quote, Suggestion, SuggestionCategory, Notification
-from api.serializers import ConversationSerializer, DayPerWeekSerializer, DrinksPerDaySerializer, MessageSerializer, MilestoneProgressSerializer, MoneySavedSerializer, OnboardingDataSerializer, PasswordVerifySerializer, RecoveryMilestoneSerializer, RegistrationSerializer, EmailTokenObtainPairSerializer, PasswordResetRequestSerializer, PasswordResetConfirmSerializer, ProfileSerializer, AddictionSerializer, SubscriptionPlanSerializer, TargetGoalSerializer, TimerSerializer, TriggerTextSerializer, UserSubscriptionSerializer, ProgressQuestionSerializer, ProgressAnswerSerializer, ProgressResponseSerializer, ProgressQuestionSerializer, ReportSerializer, PrivacyPolicySerializer, TermsConditionsSerializer, SupportContactSerializer, AddictionOptionSerializer, ImproveQuestionSerializer, ImproveQuestionOptionSerializer, MilestoneQuestionSerializer, MilestoneOptionSerializer, JournalEntrySerializer, QuoteSerializer, SuggestionSerializer, SuggestionCategorySerializer, NotificationSerializer
+from api.serializers import ConversationSerializer, DayPerWeekSerializer, DrinksPerDaySerializer, MessageSerializer, MilestoneProgressSerializer, MoneySavedSerializer, OnboardingDataSerializer, PasswordVerifySerializer, RecoveryMilestoneSerializer, RegistrationSerializer, EmailTokenObtainPairSerializer, PasswordResetRequestSerializer, PasswordResetConfirmSerializer, ProfileSerializer, AddictionSerializer, SubscriptionPlanSerializer, TargetGoalSerializer, TimerSerializer, TriggerTextSerializer, UserSubscriptionSerializer, ProgressQuestionSerializer, ProgressAnswerSerializer, ProgressResponseSerializer, ProgressQuestionSerializer, ReportSerializer, PrivacyPolicySerializer, TermsConditionsSerializer, SupportContactSerializer, AddictionOptionSerializer, ImproveQuestionSerializer, ImproveQuestionOptionSerializer, MilestoneQuestionSerializer, MilestoneOptionSerializer, JournalEntrySerializer, QuoteSerializer, SuggestionSerializer, SuggestionCategorySerializer, NotificationSerializer, ConversationListSerializer, MessageHistorySerializer
 from subscription.models import SubscriptionPlan, UserSubscription
 
 from rest_framework import status, permissions, generics
@@ -32,7 +34,21 @@ from rest_framework.decorators import action
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
 
 from rest_framework.response import Response
-from .services.voice_registry import voice_registry
+from .services.voice_transcripts import transcript_writers
+from .services.voice_registry import VoiceCapacityError, VoiceSessionElsewhere, voice_registry
+from .services.counselor_sessions import counselor_sessions
+from .services.conversation_summary import conversation_summaries
+from .services.attachment_extraction import attachment_extractor
+from .services.crisis import crisis_follow_ups
+from .services.llm_resilience import llm_metrics
+from .services.voice_clients import voice_clients, voice_start_metrics
+from .services.chat_turns import save_turn
+from .services.chat_flights import DuplicateTimeout, chat_flights
+from .pagination import MessageCursorPagination
+from .throttling import ChatRateThrottle, RateLimitHeadersMixin, VoiceRateThrottle
+from .services.message_search import SearchFilters, message_search
+from .services.quotes import quote_service
+from .services.usage_meter import plan_totals, top_users
 
 
 
@@ -848,7 +864,6 @@ class SupportContactView(APIView):
 # views.py
 from datetime import datetime
 
-import stripe
 from django.conf import settings
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
@@ -865,7 +880,14 @@ from rest_framework.views import APIView
 from subscription.models import SubscriptionPlan, UserSubscription
 from .serializers import SubscriptionPlanSerializer, UserSubscriptionSerializer
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+def _load_stripe():
+    import stripe
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    return stripe
+
+
+# The Stripe SDK takes about a second to import; load it with the first payment request
+stripe = SimpleLazyObject(_load_stripe)
 
 
 class SubscriptionPlanView(APIView):
@@ -1333,14 +1355,37 @@ class JournalEntryDetailView(APIView):
 
 class MotivationalQuoteAPIView(APIView):
     def get(self, request, *args, **kwargs):
-        # Instantiate the AICounselor class
-        counselor = AICounselor()
+        quote = quote_service.random()
+        if quote is None:
+            return Response({"detail": "No quotes available."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'motivational_quote': quote.text})
+
 
-        # Get a motivational quote from the AI class
-        quote = counselor.get_motivational_quote()
+class QuoteOfTheDayView(APIView):
+    """
+    The same quote for every user all day. Clients revalidate with
+    If-None-Match and get a 304 until the day changes or the quote is edited.
+    """
+    def get(self, request, *args, **kwargs):
+        daily = quote_service.of_the_day()
+        if daily is None:
+            return Response({"detail": "No quotes available."}, status=status.HTTP_404_NOT_FOUND)
 
-        # Return the quote as a JSON response using DRF's Response class
-        return Response({'motivational_quote': quote})
+        etag = quote_etag(daily.etag)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response({
+                "date": daily.day.isoformat(),
+                "text": daily.quote.text,
+                "author": daily.quote.author,
+            })
+        response['ETag'] = etag
+        # Fresh until the day ends, but revalidate now and then so edits show up the same day
+        midnight = datetime.combine(daily.day + timedelta(days=1), datetime.min.time(), tzinfo=timezone.get_current_timezone())
+        until_midnight = max(0, int((midnight - timezone.now()).total_seconds()))
+        patch_cache_control(response, public=True, max_age=min(until_midnight, settings.QUOTE_CACHE_SECONDS))
+        return response
     
     
 
@@ -1645,17 +1690,31 @@ class CompleteMilestoneAPIView(APIView):
             return Response({"error": "Milestone option not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
-# Initialize AI counselor instance
-counselor = AICounselor()
+def sse_event(payload, event=None):
+    """Formats one Server-Sent Events frame."""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(payload)}\n\n"
+
+
+def chat_flight_key(request, user_id, conversation_type, user_message):
+    """
+    Single-flight key of a chat request: the client's Idempotency-Key, or else
+    what the request sends, including attachment names and sizes.
+    """
+    uploads = [(f.name, f.size) for name in ('image', 'pdf') for f in request.FILES.getlist(name)]
+    return chat_flights.key(user_id, request.headers.get('Idempotency-Key'), [conversation_type, user_message, uploads])
 
-class ChatView(APIView):
+
+class ChatView(RateLimitHeadersMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [ChatRateThrottle]
     
     def post(self, request):
         """
         Handle chat messages, process them with the AI counselor, and return the response.
         Save the conversation and messages to the database for text-based conversations.
         For voice-based conversations, only return the AI's response.
+        With `?stream=1` text responses are sent as `text/event-stream` tokens.
         """
         # Deserialize incoming message (user message only)
         conversation_type = request.data.get('conversation_type', 'text')  # default to 'text' if not specified
@@ -1674,33 +1733,50 @@ class ChatView(APIView):
             if serializer.is_valid():
                 # Extract the user message
                 user_message = serializer.validated_data['content']
-
-                # Start or retrieve the conversation for the user (we'll use 'guest' if no authenticated user)
-                user_id = request.user.id if request.user.is_authenticated else "guest"
-                conversation, created = Conversation.objects.get_or_create(user_id=user_id)
-
-                # Save the user message to the database with 'role' as 'user'
-                user_message_instance = Message.objects.create(
-                    conversation=conversation,
-                    role='user',  # The user message has the role 'user'
-                    content=user_message,  # The content of the user message
-                )
-
-                # Get the AI's response
-                ai_response = counselor.process_message(user_message)
-
-                # Save the AI response to the database with 'role' as 'ai'
-                ai_message_instance = Message.objects.create(
-                    conversation=conversation,
-                    role='ai',  # The AI message has the role 'ai'
-                    content=ai_response,  # The content of the AI's response
-                )
-                
-                # Return the AI's response to the user
-                return Response({
+                stream = request.query_params.get('stream') in ('1', 'true')
+
+                # A duplicate of a running turn, or a retry with the Idempotency-Key of a finished one, gets that turn's result
+                flight, leader = chat_flights.begin(chat_flight_key(request, request.user.id, conversation_type, user_message))
+                if not leader:
+                    return self.shared_response(flight, stream)
+
+                try:
+                    # Start or retrieve the conversation for the user
+                    user_id = request.user.id
+                    conversation, created = Conversation.objects.get_or_create(user_id=user_id)
+                    counselor = counselor_sessions.get(user_id)
+
+                    # OCR / PDF parsing runs on the extraction pool; this thread only waits for the text
+                    attachment_text = self.attachment_text(request)
+
+                    if stream:
+                        return self.stream_response(request, counselor, conversation, user_message, attachment_text, flight)
+
+                    # One turn per user at a time, see AICounselor.lock
+                    with counselor.lock:
+                        # Get the AI's response
+                        ai_response = counselor.process_message(user_message, attachment_text=attachment_text)
+
+                        # Save the user message and the AI response together, in one transaction
+                        save_turn(conversation, user_message, ai_response)
+                        if counselor.in_crisis():
+                            # The vetted crisis reply is already out; log it and let the LLM follow up in the background
+                            crisis_follow_ups.handle(counselor, request.user, conversation, user_message, ai_response)
+                        prompt_tokens = counselor.last_prompt_tokens
+                    conversation_summaries.record_turn(conversation.id)
+                except BaseException as e:
+                    chat_flights.fail(flight, e)
+                    raise
+
+                result = {
                     "response": ai_response,  # The AI's response
+                    "prompt_tokens": prompt_tokens,  # Size of the prompt sent to the LLM
                     # "conversation_id": conversation.id  # The ID of the current conversation
-                })
+                }
+                chat_flights.finish(flight, result)
+
+                # Return the AI's response to the user
+                return Response(result)
 
             # Return errors if serializer is invalid
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -1708,20 +1784,118 @@ class ChatView(APIView):
         # If the conversation type is voice, only return the AI response without saving
         elif conversation_type == 'voice':
             user_message = request.data.get('content', '')  # Assuming the user sends the voice content as text
-            
-            # Handle the AI response for the voice-based conversation
-            ai_response = counselor.process_message(user_message)
+
+            def voice_turn():
+                # Handle the AI response for the voice-based conversation
+                counselor = counselor_sessions.get(request.user.id)
+                with counselor.lock:
+                    ai_response = counselor.process_message(user_message)
+                    if counselor.in_crisis():
+                        crisis_follow_ups.handle(counselor, request.user, None, user_message, ai_response)
+                    return {
+                        "response": ai_response,  # The AI's response
+                        "prompt_tokens": counselor.last_prompt_tokens,
+                    }
 
             # Return the AI response directly to the frontend (no database saving)
-            return Response({
-                "response": ai_response,  # The AI's response
-            })
+            try:
+                result, shared = chat_flights.run(chat_flight_key(request, request.user.id, conversation_type, user_message), voice_turn)
+            except DuplicateTimeout:
+                return self.duplicate_pending()
+            response = Response(result)
+            if shared:
+                response['Idempotent-Replayed'] = 'true'
+            return response
 
         # If the conversation type is not recognized, return an error
         return Response({
             "error": "Invalid conversation type. Must be either 'text' or 'voice'."
         }, status=status.HTTP_400_BAD_REQUEST)
 
+    def attachment_text(self, request):
+        """
+        Text of the optional `image` / `pdf` uploads, extracted off the request thread.
+        """
+        image = request.FILES.get('image')
+        pdf = request.FILES.get('pdf')
+        if not image and not pdf:
+            return None
+        return attachment_extractor.extract_all(
+            image_data=image.read() if image else None,
+            pdf_data=pdf.read() if pdf else None,
+        )
+
+    def shared_response(self, flight, stream):
+        """
+        Response of a duplicate request: the result of the request it duplicates, once that one is done.
+        A stream gets the whole reply as a single token.
+        """
+        if stream:
+            def events():
+                try:
+                    result = chat_flights.wait(flight)
+                except DuplicateTimeout:
+                    yield sse_event({"error": "An identical request is still being processed."}, event="error")
+                    return
+                yield sse_event({"token": result["response"]})
+                yield sse_event(result, event="done")
+
+            response = StreamingHttpResponse(events(), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+        else:
+            try:
+                response = Response(chat_flights.wait(flight))
+            except DuplicateTimeout:
+                return self.duplicate_pending()
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def duplicate_pending(self):
+        return Response(
+            {"error": "An identical request is still being processed."}, status=status.HTTP_409_CONFLICT,
+        )
+
+    def stream_response(self, request, counselor, conversation, user_message, attachment_text=None, flight=None):
+        """
+        Forward tokens as they arrive, then save the turn once.
+        If the client goes away mid-stream the turn is saved with what was sent so far,
+        and that is also what a retry of the same request gets.
+        """
+        def events():
+            chunks = []
+            completed = False
+            # Held until the turn is saved, see AICounselor.lock
+            counselor.lock.acquire()
+            try:
+                for token in counselor.stream_message(user_message, attachment_text=attachment_text):
+                    chunks.append(token)
+                    yield sse_event({"token": token})
+                completed = True
+            except Exception as e:
+                if flight is not None:
+                    chat_flights.fail(flight, e)
+                raise
+            finally:
+                ai_response = "".join(chunks).strip()
+                prompt_tokens = counselor.last_prompt_tokens
+                try:
+                    save_turn(conversation, user_message, ai_response)
+                    if completed and counselor.in_crisis():
+                        crisis_follow_ups.handle(counselor, request.user, conversation, user_message, ai_response)
+                finally:
+                    counselor.lock.release()
+                    if flight is not None and not flight.done.is_set():
+                        chat_flights.finish(flight, {"response": ai_response, "prompt_tokens": prompt_tokens})
+
+            conversation_summaries.record_turn(conversation.id)
+            yield sse_event({"response": ai_response, "prompt_tokens": prompt_tokens}, event="done")
+
+        response = StreamingHttpResponse(events(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+        return response
+
 
 class ConversationHistoryView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -1731,43 +1905,183 @@ class ConversationHistoryView(generics.ListAPIView):
     serializer_class = ConversationSerializer
 
     def get_queryset(self):
-        # Get the user ID from the authenticated user, or default to 'guest' if unauthenticated
-        user_id = self.request.user.id if self.request.user.is_authenticated else "guest"
-        # Return the conversations for the authenticated user or guest
-        return Conversation.objects.filter(user_id=user_id)
-    
+        # Return the conversations for the authenticated user
+        return Conversation.objects.filter(user_id=self.request.user.id).prefetch_related('messages')
+
+
+class ConversationListView(generics.ListAPIView):
+    """
+    The user's conversations without their messages, most recently active first.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = ConversationListSerializer
+
+    def get_queryset(self):
+        return Conversation.objects.filter(user_id=self.request.user.id).order_by('-last_updated')
+
+
+class ConversationMessagesView(APIView):
+    """
+    One page of a conversation's messages, oldest first.
+    Page with `?before=<older cursor>` / `?after=<newer cursor>` and `?limit=` (max 100).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    pagination = MessageCursorPagination()
+
+    def get(self, request, conversation_id):
+        conversation = get_object_or_404(Conversation, id=conversation_id, user_id=request.user.id)
+        rows, cursors = self.pagination.paginate(
+            Message.objects.filter(conversation=conversation).only('id', 'role', 'content', 'timestamp'),
+            request,
+        )
+        return Response({
+            "conversation_id": conversation.id,
+            "results": MessageHistorySerializer(rows, many=True).data,
+            **cursors,
+        })
+
 
 
-class VoiceSessionView(APIView):
+class MessageSearchView(APIView):
+    """
+    Ranked full-text search over the user's chat history.
+    `?q=` words to find, optional `role=user|ai`, `since` / `until` (ISO date or datetime),
+    `limit` (max 50) and `offset` (max 500).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    max_limit = 50
+    max_offset = 500
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        role = request.query_params.get('role') or None
+        if role not in (None, 'user', 'ai'):
+            return Response({"error": "role must be 'user' or 'ai'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            since = self.parse_when(request.query_params.get('since'))
+            until = self.parse_when(request.query_params.get('until'))
+            limit = max(1, min(int(request.query_params.get('limit', 20)), self.max_limit))
+            offset = max(0, min(int(request.query_params.get('offset', 0)), self.max_offset))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # One extra row tells whether there is a next page
+        hits = message_search.search(
+            request.user.id, query, SearchFilters(role=role, since=since, until=until), limit + 1, offset
+        )
+        return Response({
+            "results": [
+                {
+                    "id": hit.id,
+                    "conversation_id": hit.conversation_id,
+                    "role": hit.role,
+                    "timestamp": hit.timestamp,
+                    "snippet": hit.snippet,
+                }
+                for hit in hits[:limit]
+            ],
+            "next_offset": offset + limit if len(hits) > limit and offset + limit <= self.max_offset else None,
+        })
+
+    @staticmethod
+    def parse_when(value):
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(f"'{value}' is not a date or datetime.")
+            parsed = datetime.combine(day, datetime.min.time())
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+
+class LLMMetricsView(APIView):
+    """
+    Per-process LLM call metrics for ops: outcomes, error rate, retries, latency histogram and breaker state.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(llm_metrics.snapshot(), status=status.HTTP_200_OK)
+
+
+class VoiceMetricsView(APIView):
+    """
+    Per-process voice metrics for ops: live sessions, start-up latency (setup and
+    time to first audio) and what the ElevenLabs client pool has ready.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "sessions": voice_registry.active(),
+            "start": voice_start_metrics.snapshot(),
+            "pool": voice_clients.stats(),
+        }, status=status.HTTP_200_OK)
+
+
+class UsageReportView(APIView):
+    """
+    Rolled-up token usage of one day (`?day=YYYY-MM-DD`, default today): totals per plan and the heaviest users.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        try:
+            day = parse_date(request.query_params.get('day', '')) or timezone.localdate()
+            limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+        except ValueError:
+            return Response({"detail": "Use day=YYYY-MM-DD and a numeric limit."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "day": day.isoformat(),
+            "plans": plan_totals(day),
+            "top_users": top_users(day, limit=limit),
+        }, status=status.HTTP_200_OK)
+
+
+class VoiceSessionView(RateLimitHeadersMixin, APIView):
     """
     Start/stop a server-side live voice session (uses machine's mic/speakers via ElevenLabs).
+    Starting a session is rate limited per plan; ending one is not.
     """
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [VoiceRateThrottle]
 
     def post(self, request):
         agent = (request.data.get("agent") or "male").lower()
         user_key = str(request.user.id)
 
-        def on_user_transcript(t):
-            convo, _ = Conversation.objects.get_or_create(user_id=user_key)
-            Message.objects.create(conversation=convo, role="user", content=t)
-
-        def on_agent_response(r):
-            convo, _ = Conversation.objects.get_or_create(user_id=user_key)
-            Message.objects.create(conversation=convo, role="ai", content=r)
+        # Utterances are buffered and written in batches, off the SDK callback thread
+        transcript = transcript_writers.open(user_key)
 
         try:
             voice_registry.start(
                 user_key=user_key,
                 agent=agent,
-                on_user_transcript=on_user_transcript,
-                on_agent_response=on_agent_response,
+                on_user_transcript=transcript.user,
+                on_agent_response=transcript.agent,
+                on_end=transcript.close,
             )
             return Response({"status": "running", "agent": agent}, status=status.HTTP_200_OK)
+        except VoiceSessionElsewhere as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except VoiceCapacityError as e:
+            # Capacity frees up as sessions end or get reaped
+            return Response(
+                {"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(int(voice_registry.reap_interval))},
+            )
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def delete(self, request):
         user_key = str(request.user.id)
-        conversation_id = voice_registry.end(user_key)
+        try:
+            conversation_id = voice_registry.end(user_key)
+        except VoiceSessionElsewhere:
+            # The worker running the session ends it within a heartbeat
+            return Response({"status": "ending"}, status=status.HTTP_202_ACCEPTED)
         return Response({"status": "ended", "conversation_id": conversation_id}, status=status.HTTP_200_OK)
\ No newline at end of file
@@ -0,0 +1,138 @@
+# StepCoachLive/api/voice_socket.py
+# WebSocket endpoint for live voice sessions whose audio comes from the client
+# (browser or app) rather than the server's sound card:
+#
+#     ws(s)://<host>/ws/voice/?token=<access JWT>&agent=male|female
+#
+# Binary frames are 16-bit PCM, mono, 16 kHz, in both directions. Text frames
+# are JSON control messages: the server sends {"type": "interrupt"} (drop any
+# audio queued for playback) and, last, {"type": "ended", ...}; the client may
+# send {"type": "end"}. Browsers cannot set headers on a WebSocket, hence the
+# token in the query string. Routed by StepCoachLive/asgi.py; a plain ASGI
+# app, so no extra dependency.
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .services.rate_limit import rate_limiter
+from .services.voice_transcripts import transcript_writers
+from .services.voice_registry import VoiceCapacityError, VoiceSessionElsewhere, voice_registry
+
+logger = logging.getLogger(__name__)
+
+VOICE_SOCKET_PATH = '/ws/voice/'
+
+# Close codes in the application range (4000-4999), after the HTTP status they mirror
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_NOT_FOUND = 4404
+CLOSE_BUSY = 4409
+CLOSE_THROTTLED = 4429
+CLOSE_UNAVAILABLE = 4503
+
+
+async def socket_user(scope):
+    params = parse_qs(scope.get('query_string', b'').decode())
+    authentication = JWTAuthentication()
+    try:
+        token = authentication.get_validated_token(params.get('token', [''])[0])
+        return await sync_to_async(authentication.get_user)(token)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+async def voice_socket(scope, receive, send):
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    # Accept first, so the client sees why the socket is closed
+    await send({'type': 'websocket.accept'})
+
+    async def close(code, reason=''):
+        await send({'type': 'websocket.close', 'code': code, 'reason': reason})
+
+    if scope['path'] != VOICE_SOCKET_PATH:
+        return await close(CLOSE_NOT_FOUND)
+    user = await socket_user(scope)
+    if user is None:
+        return await close(CLOSE_UNAUTHORIZED, "Authentication credentials were not provided.")
+    decision = await sync_to_async(rate_limiter.hit)(user.id, 'voice')
+    if decision is not None and not decision.allowed:
+        return await close(CLOSE_THROTTLED, f"Retry in {decision.retry_after} seconds.")
+
+    from .services.voice_relay import WebSocketAudioInterface
+    relay = WebSocketAudioInterface(
+        asyncio.get_running_loop(),
+        frame_ms=settings.VOICE_RELAY_FRAME_MS,
+        max_buffer_ms=settings.VOICE_RELAY_BUFFER_MS,
+    )
+    user_key = str(user.id)
+    agent = (parse_qs(scope.get('query_string', b'').decode()).get('agent', ['male'])[0]).lower()
+
+    transcript = transcript_writers.open(user_key)
+
+    try:
+        runtime = await sync_to_async(voice_registry.start, thread_sensitive=False)(
+            user_key=user_key,
+            agent=agent,
+            on_user_transcript=transcript.user,
+            on_agent_response=transcript.agent,
+            on_end=transcript.close,
+            audio_interface=relay,
+        )
+    except VoiceSessionElsewhere as e:
+        return await close(CLOSE_BUSY, str(e))
+    except VoiceCapacityError as e:
+        return await close(CLOSE_UNAVAILABLE, str(e))
+    except Exception:
+        logger.exception("Starting a relayed voice session for user %s failed", user_key)
+        return await close(1011)
+    if runtime.audio_interface is not relay:
+        return await close(CLOSE_BUSY, "A voice session is already running for this user.")
+
+    client_gone = False
+
+    async def from_client():
+        nonlocal client_gone
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                client_gone = True
+                return
+            if message.get('bytes'):
+                relay.receive(message['bytes'])
+            elif message.get('text'):
+                try:
+                    control = json.loads(message['text'])
+                except ValueError:
+                    continue
+                if isinstance(control, dict) and control.get('type') == 'end':
+                    return
+
+    async def to_client():
+        async for kind, frame in relay.events(runtime.is_running):
+            if kind == 'audio':
+                await send({'type': 'websocket.send', 'bytes': frame})
+            else:
+                await send({'type': 'websocket.send', 'text': json.dumps({"type": kind})})
+
+    tasks = [asyncio.ensure_future(from_client()), asyncio.ensure_future(to_client())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        conversation_id = await sync_to_async(voice_registry.end, thread_sensitive=False)(user_key, runtime)
+        stats = relay.stats()
+        logger.info("Relayed voice session of user %s ended: %s", user_key, stats)
+    if not client_gone:
+        await send({'type': 'websocket.send', 'text': json.dumps(
+            {"type": "ended", "conversation_id": conversation_id, "stats": stats}
+        )})
+        await close(1000)
@@ -203,8 +203,10 @@ class ConversationAdmin(admin.ModelAdmin):
     """
     Admin interface for the Conversation model.
     """
-    list_display = ('user_id', 'started_at', 'last_updated')  # Fields to display in the list view
-    search_fields = ('user_id',)  # Allow search by user_id
+    list_display = ('user', 'started_at', 'last_updated')  # Fields to display in the list view
+    search_fields = ('user__username', 'user__email')  # Allow search by the user's username or email
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
     list_filter = ('started_at',)  # Add filters based on started_at
     inlines = [MessageInline]  # Display messages inline within the conversation
 
@@ -219,4 +221,59 @@ class MessageAdmin(admin.ModelAdmin):
 
 # Register models with the admin site
 admin.site.register(Conversation, ConversationAdmin)
-admin.site.register(Message, MessageAdmin)
\ No newline at end of file
+admin.site.register(Message, MessageAdmin)
+
+class CrisisEventAdmin(admin.ModelAdmin):
+    """
+    Review queue for messages that took the crisis fast path.
+    """
+    list_display = ('user', 'created_at', 'reviewed', 'message')
+    list_filter = ('reviewed', 'created_at')
+    search_fields = ('user__email', 'message')
+    readonly_fields = ('user', 'conversation', 'message', 'response', 'follow_up', 'created_at')
+
+admin.site.register(CrisisEvent, CrisisEventAdmin)
+
+
+class TokenUsageAdmin(admin.ModelAdmin):
+    """
+    The append-only LLM usage ledger; read only.
+    """
+    list_display = ('created_at', 'user', 'kind', 'model', 'prompt_tokens', 'completion_tokens', 'latency_ms', 'estimated')
+    list_filter = ('kind', 'model', 'estimated', 'created_at')
+    search_fields = ('user__email',)
+    readonly_fields = [field.name for field in TokenUsage._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+admin.site.register(TokenUsage, TokenUsageAdmin)
+
+
+class DailyTokenUsageAdmin(admin.ModelAdmin):
+    list_display = ('day', 'user', 'plan', 'calls', 'prompt_tokens', 'completion_tokens')
+    list_filter = ('day', 'plan')
+    search_fields = ('user__email',)
+    ordering = ('-day', '-prompt_tokens')
+
+admin.site.register(DailyTokenUsage, DailyTokenUsageAdmin)
+
+
+class VoiceSessionLeaseAdmin(admin.ModelAdmin):
+    """
+    Which worker runs whose live voice sessions; maintained by the workers themselves.
+    """
+    list_display = ('user', 'owner', 'agent', 'started_at', 'heartbeat_at', 'end_requested_at')
+    search_fields = ('user__email', 'owner')
+    readonly_fields = [field.name for field in VoiceSessionLease._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+admin.site.register(VoiceSessionLease, VoiceSessionLeaseAdmin)
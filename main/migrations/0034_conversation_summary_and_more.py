@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0033_alter_moneysaved_daily_saving_amount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary_last_message_id',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
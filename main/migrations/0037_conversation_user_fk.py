@@ -0,0 +1,74 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class AddIndexOnline(migrations.AddIndex):
+    """
+    AddIndexConcurrently on Postgres, so writes to the table go on while the
+    index builds; a plain AddIndex everywhere else.
+    """
+    def concurrently(self, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return None
+        # Imported here: django.contrib.postgres needs psycopg, which other databases do not install
+        from django.contrib.postgres.operations import AddIndexConcurrently
+        return AddIndexConcurrently(self.model_name, self.index)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        operation = self.concurrently(schema_editor) or super()
+        operation.database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        operation = self.concurrently(schema_editor) or super()
+        operation.database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    """
+    Expand step of moving Conversation.user_id from text to a real FK.
+
+    The old `user_id` column stays as `legacy_user_id` (state-only rename,
+    no table rewrite) and the FK gets its own nullable column, so both the
+    previous and the new release can run against the schema at once.
+    Dropping Message.conversation's own index is left to the contract step
+    (0046_drop_message_conversation_index).
+    """
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0036_message_history_index'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name='conversation',
+                    old_name='user_id',
+                    new_name='legacy_user_id',
+                ),
+                migrations.AlterField(
+                    model_name='conversation',
+                    name='legacy_user_id',
+                    field=models.CharField(blank=True, db_column='user_id', default='', max_length=255),
+                ),
+            ],
+            database_operations=[],
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user',
+            field=models.ForeignKey(blank=True, db_column='user_ref_id', db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to=settings.AUTH_USER_MODEL),
+        ),
+        AddIndexOnline(
+            model_name='conversation',
+            index=models.Index(fields=['user', '-last_updated'], name='conversation_user_updated_idx'),
+        ),
+        AddIndexOnline(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='message_conv_id_idx'),
+        ),
+    ]
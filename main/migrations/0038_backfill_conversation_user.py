@@ -0,0 +1,38 @@
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+BATCH_SIZE = 5000
+
+
+def backfill_conversation_user(apps, schema_editor):
+    """
+    Copies legacy_user_id into the user FK, one id range per statement.
+
+    Each batch is its own short transaction (the migration is not atomic),
+    so the table is never locked for long and the app keeps serving while
+    this runs. Rows whose legacy id is not an existing user stay NULL.
+    """
+    Conversation = apps.get_model('main', 'Conversation')
+    User = apps.get_model('auth', 'User')
+
+    last = Conversation.objects.aggregate(last=models.Max('id'))['last'] or 0
+    user_ids = User.objects.annotate(key=Cast('id', models.CharField(max_length=255))).values('key')
+    for start in range(0, last, BATCH_SIZE):
+        Conversation.objects.filter(
+            id__gt=start,
+            id__lte=start + BATCH_SIZE,
+            user__isnull=True,
+            legacy_user_id__in=user_ids,
+        ).update(user_id=Cast('legacy_user_id', models.BigIntegerField()))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('main', '0037_conversation_user_fk'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_conversation_user, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+from django.db import migrations
+
+# FTS rowid = user id * 2**32 + message id. Each user's messages sit in one rowid
+# range, so a search seeks straight to that range of every posting list instead
+# of walking the postings of all users. Messages without a user go under 0.
+SQLITE_ROWID = "COALESCE({user}, 0) * 4294967296 + {message}"
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE main_message_fts USING fts5(
+        content, tokenize = 'porter unicode61 remove_diacritics 2'
+    )""",
+    f"""INSERT INTO main_message_fts (rowid, content)
+        SELECT {SQLITE_ROWID.format(user='c.user_ref_id', message='m.id')}, m.content
+        FROM main_message m JOIN main_conversation c ON c.id = m.conversation_id""",
+    f"""CREATE TRIGGER main_message_fts_insert AFTER INSERT ON main_message BEGIN
+        INSERT INTO main_message_fts (rowid, content)
+            SELECT {SQLITE_ROWID.format(user='user_ref_id', message='new.id')}, new.content
+            FROM main_conversation WHERE id = new.conversation_id;
+    END""",
+    f"""CREATE TRIGGER main_message_fts_delete AFTER DELETE ON main_message BEGIN
+        DELETE FROM main_message_fts WHERE rowid = (
+            SELECT {SQLITE_ROWID.format(user='user_ref_id', message='old.id')}
+            FROM main_conversation WHERE id = old.conversation_id
+        );
+    END""",
+    f"""CREATE TRIGGER main_message_fts_update AFTER UPDATE OF content ON main_message BEGIN
+        UPDATE main_message_fts SET content = new.content WHERE rowid = (
+            SELECT {SQLITE_ROWID.format(user='user_ref_id', message='new.id')}
+            FROM main_conversation WHERE id = new.conversation_id
+        );
+    END""",
+    # A conversation that gets its user later (e.g. by the 0038 backfill) moves its messages to that user's range
+    f"""CREATE TRIGGER main_message_fts_owner AFTER UPDATE OF user_ref_id ON main_conversation BEGIN
+        DELETE FROM main_message_fts WHERE rowid IN (
+            SELECT {SQLITE_ROWID.format(user='old.user_ref_id', message='id')}
+            FROM main_message WHERE conversation_id = old.id
+        );
+        INSERT INTO main_message_fts (rowid, content)
+            SELECT {SQLITE_ROWID.format(user='new.user_ref_id', message='id')}, content
+            FROM main_message WHERE conversation_id = new.id;
+    END""",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS main_message_fts_owner",
+    "DROP TRIGGER IF EXISTS main_message_fts_update",
+    "DROP TRIGGER IF EXISTS main_message_fts_delete",
+    "DROP TRIGGER IF EXISTS main_message_fts_insert",
+    "DROP TABLE IF EXISTS main_message_fts",
+]
+
+# Same expression as PostgresSearchBackend, or the planner will not use it
+POSTGRES_FORWARD = [
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS message_content_fts_idx ON main_message
+        USING GIN (to_tsvector('english'::regconfig, COALESCE(content, '')))""",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX CONCURRENTLY IF EXISTS message_content_fts_idx",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql, params=None)
+    return apply
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text index over Message.content for api/services/message_search.py.
+    Other databases get no index and fall back to ScanSearchBackend.
+    """
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('main', '0038_backfill_conversation_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({"sqlite": SQLITE_FORWARD, "postgresql": POSTGRES_FORWARD}),
+            run({"sqlite": SQLITE_BACKWARD, "postgresql": POSTGRES_BACKWARD}),
+        ),
+    ]
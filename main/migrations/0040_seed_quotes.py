@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# The list AICounselor used to pick from, so the quote endpoints keep serving
+# the same quotes until real ones are added in the admin
+QUOTES = [
+    "Recovery is not a race. You don't have to feel guilty if it takes you longer than you thought it would.",
+    "The greatest revolution of our generation is the discovery that human beings, by changing the inner attitudes of their minds, can change the outer aspects of their lives.",
+    "You are stronger than your addiction and your addiction is not stronger than your God.",
+    "Don't quit too easily. Your life is precious.",
+    "Recovery is about progression, not perfection.",
+    "If you are tired take rest and start again. Believe that you can do it.",
+    "One day at a time, one moment at a time, one breath at a time.",
+    "Life doesn't always go with the flow. Life is like a wave sometimes you need to stay calm sometimes you need to rise.",
+    "The only person you are destined to become is the person you decide to be.",
+    "Don't let the past take over your today.",
+    "Healing takes time, and asking for help is a courageous step.",
+    "Progress, not perfection, is what we should strive for.",
+]
+
+
+def seed_quotes(apps, schema_editor):
+    Quote = apps.get_model('main', 'Quote')
+    if Quote.objects.exists():
+        return
+    Quote.objects.bulk_create([Quote(text=text, author="Unknown") for text in QUOTES])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0039_message_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_quotes, migrations.RunPython.noop),
+    ]
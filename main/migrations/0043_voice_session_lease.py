@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('main', '0042_token_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoiceSessionLease',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('owner', models.CharField(db_index=True, max_length=100)),
+                ('agent', models.CharField(blank=True, max_length=20)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('heartbeat_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('end_requested_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
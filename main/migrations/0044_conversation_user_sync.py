@@ -0,0 +1,105 @@
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+BATCH_SIZE = 5000
+
+# The FK wins when it is set; a row without it takes it from the legacy id when
+# that names a user. Covers every writer: the previous release (legacy id only),
+# bulk_create and queryset.update() (FK only). Each SQLite repair writes only the
+# column it fixes, so it does not fire the 0039 FTS trigger on user_ref_id again.
+SQLITE_USER = "(SELECT id FROM {users} WHERE id = CAST({legacy} AS INTEGER) AND CAST(id AS TEXT) = {legacy})"
+SQLITE_LEGACY_FROM_FK = """
+    WHEN new.user_ref_id IS NOT NULL AND new.user_id IS NOT CAST(new.user_ref_id AS TEXT)
+    BEGIN
+        UPDATE main_conversation SET user_id = CAST(new.user_ref_id AS TEXT) WHERE id = new.id;
+    END"""
+SQLITE_FK_FROM_LEGACY = """
+    WHEN new.user_ref_id IS NULL AND {user} IS NOT NULL
+    BEGIN
+        UPDATE main_conversation SET user_ref_id = {user} WHERE id = new.id;
+    END"""
+SQLITE_FORWARD = [
+    "CREATE TRIGGER main_conversation_legacy_insert AFTER INSERT ON main_conversation" + SQLITE_LEGACY_FROM_FK,
+    "CREATE TRIGGER main_conversation_legacy_update AFTER UPDATE OF user_id, user_ref_id ON main_conversation"
+    + SQLITE_LEGACY_FROM_FK,
+    "CREATE TRIGGER main_conversation_user_insert AFTER INSERT ON main_conversation" + SQLITE_FK_FROM_LEGACY,
+    "CREATE TRIGGER main_conversation_user_update AFTER UPDATE OF user_id, user_ref_id ON main_conversation"
+    + SQLITE_FK_FROM_LEGACY,
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS main_conversation_user_update",
+    "DROP TRIGGER IF EXISTS main_conversation_user_insert",
+    "DROP TRIGGER IF EXISTS main_conversation_legacy_update",
+    "DROP TRIGGER IF EXISTS main_conversation_legacy_insert",
+]
+
+POSTGRES_FORWARD = [
+    """CREATE OR REPLACE FUNCTION main_conversation_sync_user() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.user_ref_id IS NOT NULL THEN
+            NEW.user_id := NEW.user_ref_id::text;
+        ELSIF NEW.user_id ~ '^[0-9]{{1,18}}$' THEN
+            NEW.user_ref_id := (SELECT id FROM {users} WHERE id = NEW.user_id::bigint);
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER main_conversation_sync_user BEFORE INSERT OR UPDATE OF user_id, user_ref_id
+        ON main_conversation FOR EACH ROW EXECUTE FUNCTION main_conversation_sync_user()""",
+]
+POSTGRES_BACKWARD = [
+    "DROP TRIGGER IF EXISTS main_conversation_sync_user ON main_conversation",
+    "DROP FUNCTION IF EXISTS main_conversation_sync_user()",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        users = schema_editor.quote_name(apps.get_model('auth', 'User')._meta.db_table)
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            user = SQLITE_USER.format(users=users, legacy='new.user_id')
+            schema_editor.execute(sql.format(users=users, user=user), params=None)
+    return apply
+
+
+def catch_up(apps, schema_editor):
+    """
+    Repeats the 0038 backfill for rows the previous release wrote since, and
+    copies the FK into legacy_user_id where bulk_create or update() skipped it.
+    Batched by id range like 0038.
+    """
+    Conversation = apps.get_model('main', 'Conversation')
+    User = apps.get_model('auth', 'User')
+
+    last = Conversation.objects.aggregate(last=models.Max('id'))['last'] or 0
+    user_ids = User.objects.annotate(key=Cast('id', models.CharField(max_length=255))).values('key')
+    for start in range(0, last, BATCH_SIZE):
+        batch = Conversation.objects.filter(id__gt=start, id__lte=start + BATCH_SIZE)
+        batch.filter(user__isnull=True, legacy_user_id__in=user_ids).update(
+            user_id=Cast('legacy_user_id', models.BigIntegerField()),
+        )
+        batch.filter(user__isnull=False).exclude(
+            legacy_user_id=Cast('user_id', models.CharField(max_length=255)),
+        ).update(legacy_user_id=Cast('user_id', models.CharField(max_length=255)))
+
+
+class Migration(migrations.Migration):
+    """
+    Dual-write of Conversation.user and legacy_user_id in the database, so the
+    two agree however a row is written until the contract migration drops the
+    legacy column. Other databases get no triggers; run
+    `manage.py backfill_conversation_users` there before that migration.
+    """
+    atomic = False
+
+    dependencies = [
+        ('main', '0043_voice_session_lease'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({"sqlite": SQLITE_FORWARD, "postgresql": POSTGRES_FORWARD}),
+            run({"sqlite": SQLITE_BACKWARD, "postgresql": POSTGRES_BACKWARD}),
+        ),
+        migrations.RunPython(catch_up, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+SQLITE_ROWID = "COALESCE({user}, 0) * 4294967296 + {message}"
+
+OWNER_TRIGGER = f"""CREATE TRIGGER main_message_fts_owner AFTER UPDATE OF user_ref_id ON main_conversation
+    {{when}}BEGIN
+        DELETE FROM main_message_fts WHERE rowid IN (
+            SELECT {SQLITE_ROWID.format(user='old.user_ref_id', message='id')}
+            FROM main_message WHERE conversation_id = old.id
+        );
+        INSERT INTO main_message_fts (rowid, content)
+            SELECT {SQLITE_ROWID.format(user='new.user_ref_id', message='id')}, content
+            FROM main_message WHERE conversation_id = new.id;
+    END"""
+
+SQLITE_FORWARD = [
+    "DROP TRIGGER IF EXISTS main_message_fts_owner",
+    # UPDATE OF fires whenever the column is assigned, e.g. by every Conversation.save();
+    # only an actual change of user moves the messages
+    OWNER_TRIGGER.format(when="WHEN old.user_ref_id IS NOT new.user_ref_id "),
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS main_message_fts_owner",
+    OWNER_TRIGGER.format(when=""),
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql, params=None)
+    return apply
+
+
+class Migration(migrations.Migration):
+    """
+    Re-indexes a conversation's messages in main_message_fts only when its user changes.
+    """
+
+    dependencies = [
+        ('main', '0044_conversation_user_sync'),
+    ]
+
+    operations = [
+        migrations.RunPython(run({"sqlite": SQLITE_FORWARD}), run({"sqlite": SQLITE_BACKWARD})),
+    ]
@@ -0,0 +1,66 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Recreated under this name on the way back; the original one was generated by Django
+BACKWARD_INDEX = "message_conversation_idx"
+
+
+def conversation_indexes(schema_editor):
+    """Names of the single-column indexes on main_message.conversation_id."""
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, "main_message")
+    return [
+        name for name, constraint in constraints.items()
+        if constraint["index"] and not constraint["unique"] and constraint["columns"] == ["conversation_id"]
+    ]
+
+
+def concurrently(schema_editor):
+    return " CONCURRENTLY" if schema_editor.connection.vendor == "postgresql" else ""
+
+
+def drop_index(apps, schema_editor):
+    for name in conversation_indexes(schema_editor):
+        schema_editor.execute(
+            f"DROP INDEX{concurrently(schema_editor)} IF EXISTS {schema_editor.quote_name(name)}", params=None
+        )
+
+
+def create_index(apps, schema_editor):
+    schema_editor.execute(
+        f"CREATE INDEX{concurrently(schema_editor)} IF NOT EXISTS {schema_editor.quote_name(BACKWARD_INDEX)}"
+        " ON main_message (conversation_id)",
+        params=None,
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    Contract step after 0037: Message.conversation loses its own index, which
+    the composite indexes starting with conversation cover. The index is
+    dropped by name instead of through AlterField, which on SQLite would
+    rebuild main_message (and drop its full-text triggers with it) and on
+    Postgres would hold a lock on the table for the drop.
+    """
+    # DROP INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('main', '0045_message_search_owner_guard'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='message',
+                    name='conversation',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='main.conversation'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(drop_index, create_index),
+            ],
+        ),
+    ]
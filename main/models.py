@@ -222,7 +222,25 @@ class JournalEntry(models.Model):
 
     def __str__(self):
         return f"Journal Entry by {self.user.email} on {self.created_at.strftime('%Y-%m-%d')}"
-    
+
+
+class JournalEmbedding(models.Model):
+    """
+    Embedding of a journal entry for the counselor's journal search
+    (api/services/journal_index.py), stored as little-endian float32 bytes.
+    `digest` covers the embedded text and the embedder, so unchanged entries
+    are not embedded again.
+    """
+    entry = models.OneToOneField(JournalEntry, on_delete=models.CASCADE, primary_key=True, related_name='embedding')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    embedder = models.CharField(max_length=100)
+    digest = models.CharField(max_length=40)
+    vector = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Embedding of journal entry {self.entry_id} ({self.embedder})"
+
 
 class Quote(models.Model):
     date = models.DateField(auto_now_add=True)
@@ -334,9 +352,28 @@ class Conversation(models.Model):
     """
     Represents a chat session between the user and the AI counselor.
     """
-    user_id = models.CharField(max_length=255)  # Store the user's ID or identifier if needed
+    # Nullable until every row is backfilled (migration 0038); `user_id` lookups go through this FK.
+    # Indexed by conversation_user_updated_idx below
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE, related_name='conversations', db_column='user_ref_id', db_index=False)
+    # The old free-text user id, still written so the previous release keeps working during a deploy.
+    # save() and, for every other write, the triggers of migration 0044 keep it equal to `user`.
+    # Drop it (and make `user` required) once no running code reads it.
+    legacy_user_id = models.CharField(max_length=255, blank=True, default="", db_column='user_id')
     started_at = models.DateTimeField(auto_now_add=True)  # Track when the conversation started
     last_updated = models.DateTimeField(auto_now=True)  # Track when the conversation was last updated
+    summary = models.TextField(blank=True, default="")  # Rolling summary of messages folded out of the prompt
+    summary_last_message_id = models.BigIntegerField(default=0)  # Newest Message id already in the summary
+
+    class Meta:
+        indexes = [
+            # Latest conversation per user (ChatView, counselor sessions, conversation list)
+            models.Index(fields=['user', '-last_updated'], name='conversation_user_updated_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.user_id is not None:
+            self.legacy_user_id = str(self.user_id)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Conversation with {self.user_id} started at {self.started_at}"
@@ -345,10 +382,105 @@ class Message(models.Model):
     """
     Represents a single message in the conversation.
     """
-    conversation = models.ForeignKey(Conversation, related_name='messages', on_delete=models.CASCADE)
+    # No index of its own: both composite indexes below start with conversation
+    conversation = models.ForeignKey(Conversation, related_name='messages', on_delete=models.CASCADE, db_index=False)
     role = models.CharField(max_length=50, choices=[('user', 'User'), ('ai', 'AI')])  # User or AI
     content = models.TextField()  # Message content
     timestamp = models.DateTimeField(auto_now_add=True)  # Time when the message was sent
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a conversation's history (api/pagination.py)
+            models.Index(fields=['conversation', 'timestamp', 'id'], name='message_conv_ts_id_idx'),
+            # Messages after a summary watermark, in id order (session hydration, summarizer)
+            models.Index(fields=['conversation', 'id'], name='message_conv_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.role} at {self.timestamp}: {self.content[:30]}"
+
+class CrisisEvent(models.Model):
+    """
+    A message flagged as a crisis. The user got the vetted crisis response
+    immediately; the LLM follow-up is filled in later. Kept for human review.
+    """
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='crisis_events')
+    conversation = models.ForeignKey(Conversation, on_delete=models.SET_NULL, null=True, blank=True, related_name='crisis_events')
+    message = models.TextField()  # What the user wrote
+    response = models.TextField()  # The vetted response that was sent
+    follow_up = models.TextField(blank=True)  # LLM follow-up, saved once it arrives
+    reviewed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Crisis event for {self.user} at {self.created_at}"
+
+
+class TokenUsage(models.Model):
+    """
+    Append-only ledger of LLM calls: one row per call, written in batches by
+    api/services/usage_meter.py. `estimated` rows had no usage data from the
+    provider and were counted locally with tiktoken.
+    """
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    kind = models.CharField(max_length=30)  # chat, crisis_follow_up, summary
+    model = models.CharField(max_length=100)
+    prompt_tokens = models.PositiveIntegerField()
+    completion_tokens = models.PositiveIntegerField()
+    latency_ms = models.PositiveIntegerField()
+    estimated = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='token_usage_created_idx'),
+            models.Index(fields=['user', 'created_at'], name='token_usage_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} by {self.user_id}: {self.prompt_tokens}+{self.completion_tokens} tokens"
+
+
+class DailyTokenUsage(models.Model):
+    """
+    Per-user totals of TokenUsage for one day, rebuilt by the rollup_token_usage
+    command. `plan` is the user's plan name when the day was rolled up; per-plan
+    totals are sums over it.
+    """
+    day = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    plan = models.CharField(max_length=100, blank=True)
+    calls = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
+    latency_ms = models.BigIntegerField(default=0)  # summed, for averages
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'user'], name='daily_token_usage_day_user_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'plan'], name='daily_token_usage_plan_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} on {self.day}: {self.prompt_tokens + self.completion_tokens} tokens"
+
+
+class VoiceSessionLease(models.Model):
+    """
+    Which worker process runs a user's live voice sessions
+    (api/services/voice_directory.py). The owner refreshes `heartbeat_at`
+    while it holds sessions and deletes the row when the last one ends;
+    another worker asks it to end them through `end_requested_at`. A lease
+    whose heartbeat stopped belongs to a dead worker and may be taken over.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    owner = models.CharField(max_length=100, db_index=True)
+    agent = models.CharField(max_length=20, blank=True)
+    started_at = models.DateTimeField(default=timezone.now)
+    heartbeat_at = models.DateTimeField(default=timezone.now)
+    end_requested_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
-        return f"{self.role} at {self.timestamp}: {self.content[:30]}"
\ No newline at end of file
+        return f"Voice sessions of {self.user_id} on {self.owner}"
@@ -1,3 +1,180 @@
-from django.test import TestCase
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+
+from api.services.message_search import SqliteFtsBackend, message_search
+from main.models import Conversation, Message
+
+
+class MigrationTestCase(TransactionTestCase):
+    """
+    Moves the test database to a `main` migration and back to the latest state afterwards.
+    """
+    def migrate(self, name):
+        executor = MigrationExecutor(connection)
+        executor.migrate([("main", name)])
+        executor.loader.build_graph()
+        return executor.loader.project_state([("main", name)]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+
+
+class ConversationUserMigrationTests(MigrationTestCase):
+    def pairs(self, model=Conversation):
+        return {
+            conversation.id: (conversation.user_id, conversation.legacy_user_id)
+            for conversation in model.objects.all()
+        }
+
+    def test_backfill_and_dual_write_keep_both_ids_equal(self):
+        apps = self.migrate("0037_conversation_user_fk")
+        OldUser, OldConversation = apps.get_model("auth", "User"), apps.get_model("main", "Conversation")
+        ana, ben = OldUser.objects.create(username="ana"), OldUser.objects.create(username="ben")
+        before = OldConversation.objects.create(legacy_user_id=str(ana.id))
+        guest = OldConversation.objects.create(legacy_user_id="guest")
+
+        apps = self.migrate("0038_backfill_conversation_user")
+        OldConversation = apps.get_model("main", "Conversation")
+        self.assertEqual(OldConversation.objects.get(id=before.id).user_id, ana.id)
+        # Written during the rolling deploy: the previous release sets only the legacy id,
+        # bulk_create and update() in the new one only the FK
+        during = OldConversation.objects.create(legacy_user_id=str(ben.id))
+        bulk = OldConversation.objects.bulk_create([OldConversation(user_id=ana.id)])[0]
+        OldConversation.objects.filter(id=before.id).update(user_id=ben.id)
+        self.assertIsNone(OldConversation.objects.get(id=during.id).user_id)
+
+        self.migrate("0044_conversation_user_sync")
+        self.assertEqual(self.pairs(), {
+            before.id: (ben.id, str(ben.id)),
+            guest.id: (None, "guest"),
+            during.id: (ben.id, str(ben.id)),
+            bulk.id: (ana.id, str(ana.id)),
+        })
+
+        # From here on the triggers keep every write in agreement
+        ana, ben = User.objects.get(id=ana.id), User.objects.get(id=ben.id)
+        legacy, fk = Conversation.objects.bulk_create([
+            Conversation(legacy_user_id=str(ana.id)),
+            Conversation(user=ben),
+        ])
+        Message.objects.create(conversation=Conversation.objects.get(id=before.id), role="user", content="Still sober")
+        Conversation.objects.filter(id=before.id).update(user=ana)
+        Conversation.objects.filter(id=guest.id).update(legacy_user_id="guest2")
+        Conversation.objects.filter(id=guest.id).update(legacy_user_id=str(ben.id))
+        pairs = self.pairs()
+        self.assertEqual(pairs[legacy.id], (ana.id, str(ana.id)))
+        self.assertEqual(pairs[fk.id], (ben.id, str(ben.id)))
+        self.assertEqual(pairs[before.id], (ana.id, str(ana.id)))
+        self.assertEqual(pairs[guest.id], (ben.id, str(ben.id)))
+        # The search index moved with the conversation, once
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM main_message_fts")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_backfill_command_fixes_rows_without_triggers(self):
+        self.migrate("0043_voice_session_lease")
+        user = User.objects.create(username="cam")
+        legacy_only, fk_only = Conversation.objects.bulk_create([
+            Conversation(legacy_user_id=str(user.id)),
+            Conversation(user=user),
+        ])
+
+        out = StringIO()
+        call_command("backfill_conversation_users", "--check", stdout=out)
+        self.assertIn("1 conversations without the FK and 1 with a stale legacy id disagree", out.getvalue())
+        self.assertEqual(self.pairs()[legacy_only.id], (None, str(user.id)))
+
+        call_command("backfill_conversation_users", stdout=StringIO())
+        call_command("backfill_conversation_users", stdout=StringIO())
+        self.assertEqual(self.pairs(), {
+            legacy_only.id: (user.id, str(user.id)),
+            fk_only.id: (user.id, str(user.id)),
+        })
+
+
+class MessageConversationIndexMigrationTests(MigrationTestCase):
+    def conversation_indexes(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, "main_message")
+            cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'main_message'")
+            triggers = cursor.fetchone()[0]
+        indexes = [name for name, c in constraints.items() if c["index"] and c["columns"] == ["conversation_id"]]
+        return len(indexes), triggers
+
+    def test_contract_step_drops_the_index_without_rebuilding_the_table(self):
+        self.migrate("0045_message_search_owner_guard")
+        self.assertEqual(self.conversation_indexes(), (1, 3))
+
+        self.migrate("0046_drop_message_conversation_index")
+        # A table rebuild would have taken the full-text triggers with it
+        self.assertEqual(self.conversation_indexes(), (0, 3))
+
+
+class MessageSearchTriggerTests(TestCase):
+    """
+    The 0039 triggers keep main_message_fts in step with main_message, however rows are written.
+    """
+    def setUp(self):
+        self.assertIsInstance(message_search.backend, SqliteFtsBackend)
+        self.user = User.objects.create(username="dee")
+        self.conversation = Conversation.objects.create(user=self.user)
+
+    def found(self, query, user=None):
+        return [hit.id for hit in message_search.search((user or self.user).id, query)]
+
+    def test_inserts_are_indexed(self):
+        single = Message.objects.create(conversation=self.conversation, role="user", content="Craving a drink tonight")
+        bulk = Message.objects.bulk_create([
+            Message(conversation=self.conversation, role="ai", content="Cravings pass, try a walk"),
+        ])[0]
+        self.assertCountEqual(self.found("craving"), [single.id, bulk.id])
+        self.assertEqual(self.found("walk"), [bulk.id])
+
+    def test_updates_replace_the_indexed_text(self):
+        message = Message.objects.create(conversation=self.conversation, role="user", content="Went to a meeting")
+        Message.objects.filter(id=message.id).update(content="Called my sponsor")
+        self.assertEqual(self.found("meeting"), [])
+        self.assertEqual(self.found("sponsor"), [message.id])
+
+    def test_deletes_leave_the_index(self):
+        kept, gone = Message.objects.bulk_create([
+            Message(conversation=self.conversation, role="user", content="Proud of today"),
+            Message(conversation=self.conversation, role="user", content="Proud and tired"),
+        ])
+        Message.objects.filter(id=gone.id).delete()
+        self.assertEqual(self.found("proud"), [kept.id])
+        self.conversation.delete()
+        self.assertEqual(self.found("proud"), [])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM main_message_fts")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_messages_follow_their_conversation_to_a_user(self):
+        orphan = Conversation.objects.create()
+        message = Message.objects.create(conversation=orphan, role="user", content="Sleepless night again")
+        self.assertEqual(self.found("sleepless"), [])
+
+        Conversation.objects.filter(id=orphan.id).update(user=self.user)
+        self.assertEqual(self.found("sleepless"), [message.id])
+        other = User.objects.create(username="eli")
+        Conversation.objects.filter(id=orphan.id).update(user=other)
+        self.assertEqual(self.found("sleepless"), [])
+        self.assertEqual(self.found("sleepless", other), [message.id])
+
+    def test_saving_a_conversation_does_not_reindex_it(self):
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, role="user", content=f"note {n}") for n in range(5)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT total_changes()")
+            before = cursor.fetchone()[0]
+            self.conversation.save()
+            cursor.execute("SELECT total_changes()")
+            self.assertEqual(cursor.fetchone()[0] - before, 1)